@@ -1,8 +1,44 @@
 # encoding: utf-8
+import hashlib
 import json
+import os
 import re
+import time
 import urllib
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from xhs_utils.cookie_pool_util import CookiePool
+from xhs_utils.common_util import get_request_timeout
+from xhs_utils.cookie_util import trans_cookies
+from xhs_utils.metrics_util import (
+    ACCOUNT_REQUESTS,
+    API_LATENCY,
+    API_REQUESTS,
+    SIGN_LATENCY,
+    account_label,
+)
+from xhs_utils.error_util import (
+    AuthError,
+    CircuitOpenError,
+    NetworkError,
+    ParseError,
+    RiskError,
+    SignError,
+    XHSError,
+    error_msg,
+)
+from xhs_utils.profile_util import bind_task
+from xhs_utils.proxy_pool_util import ProxyPool
+from xhs_utils.rate_limit_util import (
+    get_circuit_breaker,
+    get_concurrency_controller,
+    get_rate_limiter,
+    is_risk_msg,
+)
+from xhs_utils.record_util import get_recorder
+from xhs_utils.response_cache_util import get_response_cache
+from xhs_utils.singleflight_util import SingleFlight
+from xhs_utils.timing_util import get_stage_timer
 from xhs_utils.xhs_util import (
     splice_str,
     generate_request_params,
@@ -13,13 +49,285 @@ from loguru import logger
 
 """
     获小红书的api
-    :param cookies_str: 你的cookies
+    :param cookies_str: 你的cookies，也可以传入 CookiePool 使用多个账号
+    :param proxies: 代理，也可以传入 ProxyPool 自动挑选代理
 """
 
+# 进程内共享的请求合并
+_single_flight = SingleFlight()
+
+# 代理本身出错时返回的状态码
+PROXY_ERROR_STATUS = (407, 502, 503, 504)
+
+# 风控状态码，与小红书安全脚本中的定义一致
+PULL_BLOCK_STATUS = 461
+RISK_LOGIN_STATUS = 465
+RISK_SPAM_STATUS = 471
+RISK_STATUS_MSG = {
+    PULL_BLOCK_STATUS: "请求被风控拦截",
+    RISK_LOGIN_STATUS: "风控要求重新登录",
+    RISK_SPAM_STATUS: "请求被判定为异常",
+}
+
+
+# 返回结果与账号相关的接口，缓存时需要区分账号
+ACCOUNT_SCOPED_APIS = ("/user/selfinfo", "/user/me")
+
+
+def api_family(api: str):
+    """
+    接口类别，用于按类别限速和统计
+    """
+    path = api.split("?")[0]
+    if "/comment/" in path:
+        return "comment"
+    if "/search/" in path:
+        return "search"
+    if "/homefeed" in path:
+        return "homefeed"
+    if path.endswith("/feed"):
+        return "note"
+    if "/you/" in path or "unread_count" in path:
+        return "message"
+    return "user"
+
+
+def session_key(cookies_str: str):
+    """
+    登录会话的标识，区分账号相关接口的缓存和合并请求
+    a1 是设备标识，同一个浏览器切换账号或登录过期后不变，因此使用 web_session，没有时使用完整的Cookie
+    只保留摘要，Cookie 不会出现在缓存的key中
+    """
+    session = trans_cookies(cookies_str).get("web_session") or cookies_str or ""
+    return hashlib.sha1(session.encode("utf-8")).hexdigest()
+
+
+def request_key(method: str, api: str, data, account):
+    """
+    请求的规范化标识，参数顺序不同的相同请求得到相同的key，用作响应缓存的key
+    与账号相关的接口(个人信息、消息、推荐流)才区分账号
+    """
+    path, _, query = api.partition("?")
+    params = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(query, True)))
+    if not isinstance(data, str):
+        data = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    scoped = api_family(api) in ("message", "homefeed") or path.endswith(
+        ACCOUNT_SCOPED_APIS
+    )
+    return method, path, params, data, account if scoped else None
+
 
 class XHS_Apis:
-    def __init__(self):
-        self.base_url = "https://edith.xiaohongshu.com"
+    def __init__(
+        self,
+        rate_limiter=None,
+        concurrency=None,
+        circuit_breaker=None,
+        single_flight=None,
+        response_cache=None,
+        stage_timer=None,
+    ):
+        # XHS_API_BASE 可以指向本地模拟服务器
+        self.base_url = os.getenv("XHS_API_BASE", "https://edith.xiaohongshu.com")
+        # 配置了 XHS_RECORD_DIR 时录制接口响应
+        self.recorder = get_recorder()
+        # (连接超时, 读取超时)
+        self.timeout = get_request_timeout()
+        # 按接口类别熔断，接口异常时快速失败
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker()
+        # 按账号共享请求额度的令牌桶限速器，默认进程内所有实例共用一个
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        # 根据响应自动调整并发数的 AIMD 控制器，默认进程内所有实例共用一个
+        self.concurrency = concurrency or get_concurrency_controller()
+        # 合并同时进行的相同请求，默认进程内所有实例共用一个
+        self.single_flight = single_flight or _single_flight
+        # 只读接口的响应缓存，可以用 self.response_cache.control(bypass=True) 或 refresh=True 临时跳过
+        self.response_cache = response_cache or get_response_cache()
+        # 按阶段(等待额度、签名、网络、解析)统计耗时，XHS_TIMING=1 时开启
+        self.stage_timer = stage_timer or get_stage_timer()
+
+    def _request(self, method: str, api: str, cookies_str, data="", proxies=None):
+        """
+        限速、签名并发送请求，返回解析后的json
+        :param method: GET 或 POST
+        :param api: 接口路径(GET请求包含参数)
+        :param cookies_str: 你的cookies，也可以传入 CookiePool，每次请求从池中挑选账号
+        :param data: POST请求的数据
+        :param proxies: 代理，也可以传入 ProxyPool
+        只读接口优先使用缓存的响应，同一个账号同时进行的相同请求只发送一次，共享解析后的结果
+        """
+        if isinstance(cookies_str, CookiePool):
+            account = id(cookies_str)
+        else:
+            account = session_key(cookies_str)
+        key = request_key(method, api, data, account)
+        path = api.split("?")[0]
+        res_json = self.response_cache.get(key, path)
+        if res_json is not None:
+            return res_json
+        # 合并请求时总是区分登录会话，避免用其他账号的cookie签名或共享其他账号的风控错误
+        # 账号池的请求只共享成功的结果，失败时等待者自己从池中挑选账号重试并上报结果
+        res_json = self.single_flight.do(
+            (key, account),
+            self._request_once,
+            method,
+            api,
+            cookies_str,
+            data,
+            proxies,
+            share_errors=not isinstance(cookies_str, CookiePool),
+        )
+        self.response_cache.put(key, path, res_json)
+        return res_json
+
+    def _request_once(self, method: str, api: str, cookies_str, data="", proxies=None):
+        if not isinstance(cookies_str, CookiePool):
+            return self._send(method, api, cookies_str, data, proxies)
+        account = cookies_str.acquire()
+        try:
+            res_json = self._send(method, api, account.cookies_str, data, proxies)
+        except Exception as e:
+            cookies_str.report(account, False, e)
+            raise
+        cookies_str.report(account, res_json.get("success", False), res_json.get("msg"))
+        return res_json
+
+    def _send(self, method: str, api: str, cookies_str: str, data="", proxies=None):
+        family = api_family(api)
+        endpoint = api.split("?")[0]
+        if not self.circuit_breaker.allow(family):
+            API_REQUESTS.inc((endpoint, CircuitOpenError.kind))
+            raise CircuitOpenError(f"{family} 类接口熔断中，请稍后再试")
+        a1 = trans_cookies(cookies_str).get("a1", "")
+        # 接口是否正常响应，None 表示失败与接口无关
+        endpoint_ok = None
+        outcome = "fail"
+        # 指标中的结果，出错时为错误类别
+        error_kind = None
+        http_seconds = None
+        try:
+            # 先取得额度再签名，避免签名中的时间戳在等待中过期
+            with self.stage_timer.stage("wait"):
+                self.rate_limiter.acquire(a1, family)
+                self.concurrency.acquire(a1)
+            try:
+                started = time.perf_counter()
+                try:
+                    with self.stage_timer.stage("sign"):
+                        headers, cookies, trans_data = generate_request_params(
+                            cookies_str, api, data, method
+                        )
+                except Exception as e:
+                    raise SignError(f"生成签名失败: {e}") from e
+                finally:
+                    SIGN_LATENCY.observe((), time.perf_counter() - started)
+                kwargs = {"headers": headers, "cookies": cookies}
+                if method != "GET":
+                    kwargs["data"] = trans_data.encode("utf-8")
+                started = time.perf_counter()
+                try:
+                    with self.stage_timer.stage("http"):
+                        if isinstance(proxies, ProxyPool):
+                            response = self._send_via_pool(
+                                method, api, proxies, a1, kwargs
+                            )
+                        else:
+                            response = requests.request(
+                                method,
+                                self.base_url + api,
+                                proxies=proxies,
+                                timeout=self.timeout,
+                                **kwargs,
+                            )
+                except requests.Timeout as e:
+                    endpoint_ok = False
+                    raise NetworkError(f"请求超时: {e}") from e
+                except requests.RequestException as e:
+                    endpoint_ok = False
+                    raise NetworkError(f"网络错误: {e}") from e
+                finally:
+                    http_seconds = time.perf_counter() - started
+                try:
+                    with self.stage_timer.stage("parse"):
+                        res_json = self._parse_response(response)
+                except (RiskError, AuthError):
+                    endpoint_ok = True
+                    outcome = "risk"
+                    raise
+                except XHSError:
+                    endpoint_ok = False
+                    raise
+                endpoint_ok = True
+                if self.recorder is not None:
+                    self.recorder.record_response(
+                        method, api, data, response.status_code, res_json
+                    )
+                if res_json.get("success"):
+                    outcome = "ok"
+                elif is_risk_msg(res_json.get("msg")):
+                    outcome = "risk"
+                return res_json
+            finally:
+                self.concurrency.release(a1, outcome)
+        except XHSError as e:
+            error_kind = e.kind
+            raise
+        finally:
+            self.circuit_breaker.record(family, endpoint_ok)
+            label = error_kind or outcome
+            API_REQUESTS.inc((endpoint, label))
+            ACCOUNT_REQUESTS.inc((account_label(a1),))
+            if http_seconds is not None:
+                API_LATENCY.observe((endpoint, label), http_seconds)
+
+    @staticmethod
+    def _parse_response(response):
+        """
+        检查状态码并解析响应
+        风控状态码抛出 RiskError / AuthError，5xx 抛出 NetworkError，响应不是json抛出 ParseError
+        """
+        status = response.status_code
+        if status in RISK_STATUS_MSG:
+            msg = f"{RISK_STATUS_MSG[status]}(HTTP {status})"
+            raise AuthError(msg) if status == RISK_LOGIN_STATUS else RiskError(msg)
+        if status >= 500:
+            raise NetworkError(f"服务端错误(HTTP {status})")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise ParseError(
+                f"响应解析失败(HTTP {status}): {response.text[:100]}"
+            ) from e
+
+    def _send_via_pool(self, method: str, api: str, proxy_pool, a1: str, kwargs):
+        """
+        通过代理池发送请求，记录代理的延迟和错误，同一个账号固定使用同一个代理
+        代理连接失败时换一个代理重试一次
+        """
+        failed = []
+        while True:
+            state = proxy_pool.acquire(a1, exclude=failed)
+            started = time.perf_counter()
+            try:
+                response = requests.request(
+                    method,
+                    self.base_url + api,
+                    proxies=state.proxies,
+                    timeout=proxy_pool.timeout,
+                    **kwargs,
+                )
+            except requests.RequestException:
+                proxy_pool.report(state, False)
+                failed.append(state)
+                if len(failed) >= min(2, len(proxy_pool)):
+                    raise
+                continue
+            proxy_pool.report(
+                state,
+                response.status_code not in PROXY_ERROR_STATUS,
+                time.perf_counter() - started,
+            )
+            return response
 
     def get_homefeed_all_channel(self, cookies_str: str, proxies: dict = None):
         """
@@ -29,17 +337,11 @@ class XHS_Apis:
         res_json = None
         try:
             api = "/api/sns/web/v1/homefeed/category"
-            headers, cookies, data = generate_request_params(
-                cookies_str, api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + api, headers=headers, cookies=cookies, proxies=proxies
-            )
-            res_json = response.json()
+            res_json = self._request("GET", api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_homefeed_recommend(
@@ -77,21 +379,11 @@ class XHS_Apis:
                 "image_formats": ["jpg", "webp", "avif"],
                 "need_filter_image": False,
             }
-            headers, cookies, trans_data = generate_request_params(
-                cookies_str, api, data, "POST"
-            )
-            response = requests.post(
-                self.base_url + api,
-                headers=headers,
-                data=trans_data,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("POST", api, cookies_str, data, proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_homefeed_recommend_by_num(
@@ -129,7 +421,7 @@ class XHS_Apis:
                     break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         if len(note_list) > require_num:
             note_list = note_list[:require_num]
         return success, msg, note_list
@@ -146,20 +438,11 @@ class XHS_Apis:
             api = f"/api/sns/web/v1/user/otherinfo"
             params = {"target_user_id": user_id}
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_user_self_info(self, cookies_str: str, proxies: dict = None):
@@ -171,17 +454,11 @@ class XHS_Apis:
         res_json = None
         try:
             api = f"/api/sns/web/v1/user/selfinfo"
-            headers, cookies, data = generate_request_params(
-                cookies_str, api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + api, headers=headers, cookies=cookies, proxies=proxies
-            )
-            res_json = response.json()
+            res_json = self._request("GET", api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_user_self_info2(self, cookies_str: str, proxies: dict = None):
@@ -193,17 +470,11 @@ class XHS_Apis:
         res_json = None
         try:
             api = f"/api/sns/web/v2/user/me"
-            headers, cookies, data = generate_request_params(
-                cookies_str, api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + api, headers=headers, cookies=cookies, proxies=proxies
-            )
-            res_json = response.json()
+            res_json = self._request("GET", api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_user_note_info(
@@ -234,20 +505,11 @@ class XHS_Apis:
                 "xsec_source": xsec_source,
             }
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_user_all_notes(self, user_url: str, cookies_str: str, proxies: dict = None):
@@ -284,7 +546,7 @@ class XHS_Apis:
                     break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, note_list
 
     def get_user_like_note_info(
@@ -315,20 +577,11 @@ class XHS_Apis:
                 "xsec_source": xsec_source,
             }
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_user_all_like_note_info(
@@ -367,7 +620,7 @@ class XHS_Apis:
                     break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, note_list
 
     def get_user_collect_note_info(
@@ -398,20 +651,11 @@ class XHS_Apis:
                 "xsec_source": xsec_source,
             }
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_user_all_collect_note_info(
@@ -450,7 +694,7 @@ class XHS_Apis:
                     break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, note_list
 
     def get_note_info(self, url: str, cookies_str: str, proxies: dict = None):
@@ -477,21 +721,11 @@ class XHS_Apis:
                 ),
                 "xsec_token": kvDist["xsec_token"],
             }
-            headers, cookies, data = generate_request_params(
-                cookies_str, api, data, "POST"
-            )
-            response = requests.post(
-                self.base_url + api,
-                headers=headers,
-                data=data,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("POST", api, cookies_str, data, proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_search_keyword(self, word: str, cookies_str: str, proxies: dict = None):
@@ -506,20 +740,11 @@ class XHS_Apis:
             api = "/api/sns/web/v1/search/recommend"
             params = {"keyword": urllib.parse.quote(word)}
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def search_note(
@@ -603,21 +828,11 @@ class XHS_Apis:
                 "geo": geo,
                 "image_formats": ["jpg", "webp", "avif"],
             }
-            headers, cookies, data = generate_request_params(
-                cookies_str, api, data, "POST"
-            )
-            response = requests.post(
-                self.base_url + api,
-                headers=headers,
-                data=data.encode("utf-8"),
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("POST", api, cookies_str, data, proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def search_some_note(
@@ -673,7 +888,7 @@ class XHS_Apis:
                     break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         if len(note_list) > require_num:
             note_list = note_list[:require_num]
         return success, msg, note_list
@@ -699,21 +914,11 @@ class XHS_Apis:
                     "request_id": "22471139-1723999898524",
                 }
             }
-            headers, cookies, data = generate_request_params(
-                cookies_str, api, data, "POST"
-            )
-            response = requests.post(
-                self.base_url + api,
-                headers=headers,
-                data=data.encode("utf-8"),
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("POST", api, cookies_str, data, proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def search_some_user(
@@ -744,7 +949,7 @@ class XHS_Apis:
                     break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         if len(user_list) > require_num:
             user_list = user_list[:require_num]
         return success, msg, user_list
@@ -775,20 +980,11 @@ class XHS_Apis:
                 "xsec_token": xsec_token,
             }
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_note_all_out_comment(
@@ -800,28 +996,43 @@ class XHS_Apis:
         :param cookies_str 你的cookies
         返回笔记的全部一级评论
         """
-        cursor = ""
+        success, msg = True, "成功"
         note_out_comment_list = []
         try:
-            while True:
-                success, msg, res_json = self.get_note_out_comment(
-                    note_id, cursor, xsec_token, cookies_str, proxies
-                )
-                if not success:
-                    raise Exception(msg)
-                comments = res_json["data"]["comments"]
-                if "cursor" in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
+            for comments in self.iter_note_out_comment_pages(
+                note_id, xsec_token, cookies_str, proxies
+            ):
                 note_out_comment_list.extend(comments)
-                if len(note_out_comment_list) == 0 or not res_json["data"]["has_more"]:
-                    break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, note_out_comment_list
 
+    def iter_note_out_comment_pages(
+        self, note_id: str, xsec_token: str, cookies_str: str, proxies: dict = None
+    ):
+        """
+        逐页获取笔记的一级评论，每拿到一页就返回该页的评论列表，请求失败时抛出异常
+        :param note_id 笔记的id
+        :param cookies_str 你的cookies
+        """
+        cursor = ""
+        total = 0
+        while True:
+            success, msg, res_json = self.get_note_out_comment(
+                note_id, cursor, xsec_token, cookies_str, proxies
+            )
+            if not success:
+                raise Exception(msg)
+            comments = res_json["data"]["comments"]
+            if "cursor" not in res_json["data"]:
+                break
+            cursor = str(res_json["data"]["cursor"])
+            total += len(comments)
+            yield comments
+            if total == 0 or not res_json["data"]["has_more"]:
+                break
+
     def get_note_inner_comment(
         self,
         comment: dict,
@@ -850,20 +1061,11 @@ class XHS_Apis:
                 "xsec_token": xsec_token,
             }
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_note_all_inner_comment(
@@ -897,14 +1099,18 @@ class XHS_Apis:
             comment["sub_comments"].extend(inner_comment_list)
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, comment
 
-    def get_note_all_comment(self, url: str, cookies_str: str, proxies: dict = None):
+    def get_note_all_comment(
+        self, url: str, cookies_str: str, proxies: dict = None, concurrency=None
+    ):
         """
         获取一篇文章的所有评论
+        每拿到一页一级评论，就把其中还有更多二级评论的评论交给线程池并发展开
         :param url: 笔记的完整URL
         :param cookies_str: 你的cookies
+        :param concurrency: 同时展开的二级评论数量，为None时使用 XHS_COMMENT_CONCURRENCY
         返回一篇文章的所有评论
         """
         out_comment_list = []
@@ -928,28 +1134,42 @@ class XHS_Apis:
             else:
                 xsec_token = ""
 
-            # 获取一级评论
-            success, msg, out_comment_list = self.get_note_all_out_comment(
-                note_id, xsec_token, cookies_str, proxies
-            )
-            if not success:
-                return success, msg, []
+            workers = concurrency or int(os.getenv("XHS_COMMENT_CONCURRENCY", 4))
+            executor = ThreadPoolExecutor(max_workers=max(1, workers))
+            expand = bind_task(self.get_note_all_inner_comment)
+            futures = []
+            try:
+                # 获取一级评论，同时展开已经拿到的评论的二级评论
+                for comments in self.iter_note_out_comment_pages(
+                    note_id, xsec_token, cookies_str, proxies
+                ):
+                    out_comment_list.extend(comments)
+                    for comment in comments:
+                        # 二级评论已经完整的评论不需要请求
+                        if comment.get("sub_comment_has_more"):
+                            futures.append(
+                                executor.submit(
+                                    expand,
+                                    comment,
+                                    xsec_token,
+                                    cookies_str,
+                                    proxies,
+                                )
+                            )
+            except Exception as e:
+                # 取消还没开始的展开，shutdown 的 cancel_futures 参数需要 Python 3.9
+                for future in futures:
+                    future.cancel()
+                executor.shutdown()
+                return False, error_msg(e), []
+            executor.shutdown()
 
-            # 获取二级评论
-            for comment in out_comment_list:
-                try:
-                    success_inner, msg_inner, updated_comment = (
-                        self.get_note_all_inner_comment(
-                            comment, xsec_token, cookies_str, proxies
-                        )
-                    )
-                    if success_inner:
-                        # 更新评论对象，包含子评论
-                        comment.update(updated_comment)
-                except Exception as e:
+            # get_note_all_inner_comment 直接把二级评论追加到评论对象中
+            for future in futures:
+                success_inner, msg_inner, comment = future.result()
+                if not success_inner:
                     # 如果获取二级评论失败，不影响一级评论
-                    print(f"获取二级评论失败: {e}")
-                    continue
+                    logger.warning(f"获取二级评论失败 {comment['id']}: {msg_inner}")
 
         except Exception as e:
             success = False
@@ -967,17 +1187,11 @@ class XHS_Apis:
         res_json = None
         try:
             api = "/api/sns/web/unread_count"
-            headers, cookies, data = generate_request_params(
-                cookies_str, api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + api, headers=headers, cookies=cookies, proxies=proxies
-            )
-            res_json = response.json()
+            res_json = self._request("GET", api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_metions(self, cursor: str, cookies_str: str, proxies: dict = None):
@@ -992,20 +1206,11 @@ class XHS_Apis:
             api = "/api/sns/web/v1/you/mentions"
             params = {"num": "20", "cursor": cursor}
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_all_metions(self, cookies_str: str, proxies: dict = None):
@@ -1031,7 +1236,7 @@ class XHS_Apis:
                     break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, metions_list
 
     def get_likesAndcollects(self, cursor: str, cookies_str: str, proxies: dict = None):
@@ -1046,20 +1251,11 @@ class XHS_Apis:
             api = "/api/sns/web/v1/you/likes"
             params = {"num": "20", "cursor": cursor}
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_all_likesAndcollects(self, cookies_str: str, proxies: dict = None):
@@ -1087,7 +1283,7 @@ class XHS_Apis:
                     break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, likesAndcollects_list
 
     def get_new_connections(self, cursor: str, cookies_str: str, proxies: dict = None):
@@ -1102,20 +1298,11 @@ class XHS_Apis:
             api = "/api/sns/web/v1/you/connections"
             params = {"num": "20", "cursor": cursor}
             splice_api = splice_str(api, params)
-            headers, cookies, data = generate_request_params(
-                cookies_str, splice_api, "", "GET"
-            )
-            response = requests.get(
-                self.base_url + splice_api,
-                headers=headers,
-                cookies=cookies,
-                proxies=proxies,
-            )
-            res_json = response.json()
+            res_json = self._request("GET", splice_api, cookies_str, proxies=proxies)
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, res_json
 
     def get_all_new_connections(self, cookies_str: str, proxies: dict = None):
@@ -1143,7 +1330,7 @@ class XHS_Apis:
                     break
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, connections_list
 
     @staticmethod
@@ -1159,12 +1346,12 @@ class XHS_Apis:
         try:
             headers = get_common_headers()
             url = f"https://www.xiaohongshu.com/explore/{note_id}"
-            response = requests.get(url, headers=headers)
+            response = requests.get(url, headers=headers, timeout=get_request_timeout())
             res = response.text
             video_addr = re.findall(r'<meta name="og:video" content="(.*?)">', res)[0]
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, video_addr
 
     @staticmethod
@@ -1204,7 +1391,7 @@ class XHS_Apis:
                 new_url = f"https://sns-img-qc.xhscdn.com/{img_id}"
         except Exception as e:
             success = False
-            msg = str(e)
+            msg = error_msg(e)
         return success, msg, new_url
 
 
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端爬取基准测试
+在本地模拟服务器上运行爬虫的主要流程，统计吞吐量、请求延迟、签名耗时占比、内存峰值和磁盘写入速度
+每个场景在独立的子进程中运行，结果保存为JSON并与上一次结果对比:
+    python benchmarks/crawl_bench.py
+    python benchmarks/crawl_bench.py --scenarios search,web --scales 10,100,1000,10000 --latency 50
+    python benchmarks/crawl_bench.py --compare benchmarks/results/crawl-20260101-120000.json
+场景:
+    user     Data_Spider.spider_user_all_note
+    search   Data_Spider.spider_some_search_note
+    comments XHS_Apis.get_note_all_comment (规模为一级评论数量)
+    web      WebSpider.search_and_collect
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+SCENARIOS = ("user", "search", "comments", "web")
+PAGE_SIZE = 20
+COOKIES = "a1=benchmark; web_session=benchmark"
+
+sys.path.insert(0, ROOT_DIR)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 单位为字节
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class RequestTimer:
+    """
+    记录每次接口请求的网络耗时和签名耗时
+    """
+
+    def __init__(self):
+        self.http = []
+        self.sign = []
+        self._lock = threading.Lock()
+
+    def wrap(self, fn, bucket):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    bucket.append(elapsed)
+
+        return timed
+
+    def install(self):
+        import apis.xhs_pc_apis as pc_apis
+
+        pc_apis.generate_request_params = self.wrap(
+            pc_apis.generate_request_params, self.sign
+        )
+        pc_apis.requests.request = self.wrap(pc_apis.requests.request, self.http)
+
+
+def run_scenario(scenario, scale, workdir):
+    """
+    在当前进程中运行一个场景，返回处理的条目数
+    """
+    base_path = {
+        "media": os.path.join(workdir, "media"),
+        "excel": os.path.join(workdir, "excel"),
+    }
+    for path in base_path.values():
+        os.makedirs(path, exist_ok=True)
+    save_choice = os.getenv("BENCH_SAVE_CHOICE", "excel")
+
+    if scenario == "user":
+        from main import Data_Spider
+
+        user_url = "https://www.xiaohongshu.com/user/profile/bench_user?xsec_token=bench&xsec_source=pc_feed"
+        note_list, _, _ = Data_Spider().spider_user_all_note(
+            user_url, COOKIES, base_path, save_choice
+        )
+        return len(note_list)
+    if scenario == "search":
+        from main import Data_Spider
+
+        note_list, _, _ = Data_Spider().spider_some_search_note(
+            "基准测试", scale, COOKIES, base_path, save_choice
+        )
+        return len(note_list)
+    if scenario == "comments":
+        from apis.xhs_pc_apis import XHS_Apis
+
+        _, _, comments = XHS_Apis().get_note_all_comment(
+            "https://www.xiaohongshu.com/explore/bench_note?xsec_token=bench", COOKIES
+        )
+        return len(comments)
+    if scenario == "web":
+        from web_spider import web_spider
+        from xhs_utils.result_util import ResultStore
+
+        web_spider.results_dir = os.path.join(workdir, "web_data")
+        os.makedirs(web_spider.results_dir, exist_ok=True)
+        web_spider.result_store = ResultStore(web_spider.results_dir)
+
+        task_id = int(time.time() * 1000)
+        web_spider.tasks[task_id] = {
+            "status": "pending",
+            "progress": 0,
+            "keyword": "基准测试",
+            "num_notes": scale,
+        }
+        web_spider.search_and_collect("基准测试", scale, task_id, COOKIES)
+        if web_spider.tasks[task_id]["status"] != "completed":
+            raise RuntimeError(web_spider.tasks[task_id].get("error"))
+        return len(web_spider.result_store.load(task_id)["data"])
+    raise ValueError(f"未知场景: {scenario}")
+
+
+def run_child(scenario, scale):
+    """
+    子进程入口：运行一个场景并把结果以JSON输出到标准输出
+    """
+    timer = RequestTimer()
+    timer.install()
+    workdir = tempfile.mkdtemp(prefix="xhs_bench_")
+    started = time.perf_counter()
+    items = run_scenario(scenario, scale, workdir)
+    elapsed = time.perf_counter() - started
+    written = dir_size(workdir)
+    shutil.rmtree(workdir, ignore_errors=True)
+    http_total, sign_total = sum(timer.http), sum(timer.sign)
+    result = {
+        "scenario": scenario,
+        "scale": scale,
+        "items": items,
+        "requests": len(timer.http),
+        "seconds": round(elapsed, 3),
+        "items_per_sec": round(items / elapsed, 2),
+        "requests_per_sec": round(len(timer.http) / elapsed, 2),
+        "p50_ms": round(percentile(timer.http, 50) * 1000, 2),
+        "p95_ms": round(percentile(timer.http, 95) * 1000, 2),
+        "p99_ms": round(percentile(timer.http, 99) * 1000, 2),
+        "sign_ms_avg": round(sign_total / max(1, len(timer.sign)) * 1000, 2),
+        "sign_share": round(sign_total / max(1e-9, sign_total + http_total), 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "disk_written_mb": round(written / 1024 / 1024, 3),
+        "disk_write_mb_per_sec": round(written / 1024 / 1024 / elapsed, 3),
+    }
+    print("BENCH_RESULT " + json.dumps(result, ensure_ascii=False))
+
+
+def spawn_child(scenario, scale, env, timeout):
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", scenario, str(scale)],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith("BENCH_RESULT "):
+            return json.loads(line[len("BENCH_RESULT ") :])
+    raise RuntimeError(process.stderr.strip().splitlines()[-1:] or "子进程没有输出结果")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results, previous_path, threshold):
+    """
+    与之前的结果对比吞吐量，下降超过 threshold 的标记为回退
+    """
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    old = {(r["scenario"], r["scale"]): r for r in previous["results"]}
+    print(f"\n与 {os.path.basename(previous_path)} ({previous.get('revision')}) 对比:")
+    regressions = 0
+    for result in results:
+        before = old.get((result["scenario"], result["scale"]))
+        if before is None or not before["items_per_sec"]:
+            continue
+        change = result["items_per_sec"] / before["items_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  ⚠️ 回退"
+            regressions += 1
+        print(
+            f"{result['scenario']:>8} {result['scale']:>6}: "
+            f"{before['items_per_sec']:>9} -> {result['items_per_sec']:>9} items/s "
+            f"({change:+.1%}){flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端爬取基准测试")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--scales", default="10,100", help="规模，如 10,100,1000,10000")
+    parser.add_argument("--latency", type=float, default=20, help="模拟接口延迟(毫秒)")
+    parser.add_argument("--jitter", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate", default="0", help="XHS_RATE，0 表示不限速")
+    parser.add_argument(
+        "--save-choice", default="excel", help="Data_Spider 的 save_choice"
+    )
+    parser.add_argument("--timeout", type=float, default=3600, help="单个场景超时(秒)")
+    parser.add_argument(
+        "--output", default="", help="结果文件，默认保存到 benchmarks/results"
+    )
+    parser.add_argument(
+        "--compare",
+        default="latest",
+        help="对比的结果文件，latest 为最近一次，none 不对比",
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.1, help="吞吐量下降多少视为回退"
+    )
+    parser.add_argument(
+        "--child", nargs=2, metavar=("SCENARIO", "SCALE"), help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]))
+        return
+
+    from benchmarks.mock_xhs_server import MockConfig, MockXHSServer
+
+    previous = None
+    if args.compare == "latest":
+        files = sorted(glob.glob(os.path.join(RESULTS_DIR, "crawl-*.json")))
+        previous = files[-1] if files else None
+    elif args.compare != "none":
+        previous = args.compare
+
+    results = []
+    for scenario in args.scenarios.split(","):
+        for scale in [int(s) for s in args.scales.split(",")]:
+            page_size = min(PAGE_SIZE, scale)
+            pages = max(1, math.ceil(scale / page_size))
+            config = MockConfig(
+                latency=args.latency,
+                jitter=args.jitter,
+                error_rate=args.error_rate,
+                pages=pages,
+                sub_pages=0,
+                page_size=page_size,
+                media_kb=16,
+                video_kb=256,
+            )
+            server = MockXHSServer("127.0.0.1", 0, config).start()
+            env = dict(
+                os.environ,
+                XHS_API_BASE=server.url,
+                XHS_CDN_BASE=server.url,
+                XHS_RATE=args.rate,
+                BENCH_SAVE_CHOICE=args.save_choice,
+                WEB_STATE_BACKEND="memory",
+                NOTE_CACHE_DIR="",
+                RESPONSE_CACHE_DIR="",
+                XHS_RECORD_DIR="",
+                PYTHONPATH=ROOT_DIR,
+            )
+            try:
+                result = spawn_child(scenario, scale, env, args.timeout)
+            except Exception as e:
+                print(f"❌ {scenario} {scale}: {e}")
+                continue
+            finally:
+                server.shutdown()
+                server.server_close()
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False))
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR, f"crawl-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+    report = {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "mock": {
+            "latency_ms": args.latency,
+            "jitter_ms": args.jitter,
+            "error_rate": args.error_rate,
+        },
+        "rate": args.rate,
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+    if previous and os.path.abspath(previous) != os.path.abspath(output):
+        if compare(results, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
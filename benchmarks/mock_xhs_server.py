@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟的小红书服务器，同时模拟 edith 接口和图片视频CDN，用于离线端到端运行和压测
+优先回放录制的夹具(XHS_RECORD_DIR 录制)，没有夹具的请求返回合成数据
+    python benchmarks/mock_xhs_server.py --port 8899 --latency 80 --error-rate 0.01 --pages 5
+爬虫指向模拟服务器:
+    XHS_API_BASE=http://127.0.0.1:8899 XHS_CDN_BASE=http://127.0.0.1:8899 python main.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from xhs_utils.record_util import fixture_key, media_key  # noqa: E402
+
+IMAGE_CDN = "https://sns-webpic-qc.xhscdn.com"
+
+
+def _id(*parts):
+    return hashlib.md5("-".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:24]
+
+
+def _ok(data):
+    return {"code": 0, "success": True, "msg": "成功", "data": data}
+
+
+class MockConfig:
+    """
+    模拟服务器的配置
+    :param latency: 接口平均延迟(毫秒)
+    :param jitter: 延迟的随机波动(毫秒)
+    :param error_rate: 返回 500 的比例
+    :param risk_rate: 返回 461 风控的比例
+    :param pages: 笔记搜索、一级评论、用户笔记的分页数量
+    :param sub_pages: 二级评论的分页数量
+    :param page_size: 每页数量
+    :param media_kb: 合成图片的大小(KB)
+    :param video_kb: 合成视频的大小(KB)
+    :param fixtures: 夹具目录，为空时只返回合成数据
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        risk_rate: float = 0,
+        pages: int = 3,
+        sub_pages: int = 2,
+        page_size: int = 20,
+        media_kb: int = 64,
+        video_kb: int = 1024,
+        fixtures: str = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.risk_rate = risk_rate
+        self.pages = pages
+        self.sub_pages = sub_pages
+        self.page_size = page_size
+        self.media_kb = media_kb
+        self.video_kb = video_kb
+        self.fixtures = fixtures
+
+
+class SyntheticData:
+    """
+    按请求参数生成确定的合成数据，结构与真实接口一致，能被 data_util 中的处理函数解析
+    """
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+
+    def user(self, user_id):
+        return {
+            "user_id": user_id,
+            "nickname": f"用户{user_id[:6]}",
+            "avatar": f"{IMAGE_CDN}/avatar/{user_id}.jpg",
+            "image": f"{IMAGE_CDN}/avatar/{user_id}.jpg",
+        }
+
+    def search_notes(self, body):
+        page = int(body.get("page", 1))
+        items = [
+            {
+                "id": _id(body.get("keyword"), page, i),
+                "model_type": "note",
+                "xsec_token": "mock_token",
+                "note_card": {"display_title": f"{body.get('keyword')} {page}-{i}"},
+            }
+            for i in range(self.config.page_size)
+        ]
+        return _ok({"items": items, "has_more": page < self.config.pages})
+
+    def feed(self, body):
+        note_id = body.get("source_note_id", "")
+        rng = random.Random(note_id)
+        is_video = rng.random() < 0.3
+        user_id = _id("user", rng.randint(0, 999))
+        image_list = [
+            {
+                "info_list": [
+                    {"url": f"{IMAGE_CDN}/mock/{note_id}_{k}_prv.jpg"},
+                    {"url": f"{IMAGE_CDN}/mock/{note_id}_{k}.jpg"},
+                ]
+            }
+            for k in range(rng.randint(1, 6))
+        ]
+        note_card = {
+            "type": "video" if is_video else "normal",
+            "user": self.user(user_id),
+            "title": f"笔记{note_id[:6]}",
+            "desc": "模拟笔记内容 " * rng.randint(1, 20),
+            "interact_info": {
+                "liked_count": str(rng.randint(0, 10000)),
+                "collected_count": str(rng.randint(0, 5000)),
+                "comment_count": str(rng.randint(0, 500)),
+                "share_count": str(rng.randint(0, 100)),
+            },
+            "image_list": image_list,
+            "tag_list": [{"name": f"标签{k}"} for k in range(rng.randint(0, 5))],
+            "time": 1700000000000 + rng.randint(0, 10**10),
+            "ip_location": "上海",
+        }
+        if is_video:
+            note_card["video"] = {"consumer": {"origin_video_key": f"mock/{note_id}"}}
+        return _ok({"items": [{"id": note_id, "note_card": note_card}]})
+
+    def comment(self, note_id, comment_id, rng):
+        return {
+            "id": comment_id,
+            "note_id": note_id,
+            "user_info": self.user(_id("user", rng.randint(0, 999))),
+            "content": "模拟评论 " * rng.randint(1, 5),
+            "show_tags": [],
+            "like_count": str(rng.randint(0, 100)),
+            "create_time": 1700000000000 + rng.randint(0, 10**10),
+            "ip_location": "北京",
+        }
+
+    def comment_page(self, params):
+        note_id = params.get("note_id", "")
+        page = int(params.get("cursor") or 0)
+        comments = []
+        for i in range(self.config.page_size):
+            comment_id = _id(note_id, page, i)
+            rng = random.Random(comment_id)
+            comment = self.comment(note_id, comment_id, rng)
+            has_more = self.config.sub_pages > 0 and i % 3 == 0
+            comment["sub_comments"] = [
+                self.comment(note_id, _id(comment_id, "first"), rng)
+            ]
+            comment["sub_comment_count"] = str(
+                1 + (self.config.sub_pages * 10 if has_more else 0)
+            )
+            comment["sub_comment_cursor"] = "0" if has_more else ""
+            comment["sub_comment_has_more"] = has_more
+            comments.append(comment)
+        has_more = page + 1 < self.config.pages
+        return _ok(
+            {"comments": comments, "cursor": str(page + 1), "has_more": has_more}
+        )
+
+    def sub_comment_page(self, params):
+        note_id = params.get("note_id", "")
+        root_id = params.get("root_comment_id", "")
+        page = int(params.get("cursor") or 0)
+        comments = []
+        for i in range(10):
+            comment_id = _id(root_id, page, i)
+            comments.append(
+                self.comment(note_id, comment_id, random.Random(comment_id))
+            )
+        has_more = page + 1 < self.config.sub_pages
+        return _ok(
+            {"comments": comments, "cursor": str(page + 1), "has_more": has_more}
+        )
+
+    def user_posted(self, params):
+        user_id = params.get("user_id", "")
+        page = int(params.get("cursor") or 0)
+        notes = [
+            {"note_id": _id(user_id, page, i), "xsec_token": "mock_token"}
+            for i in range(self.config.page_size)
+        ]
+        has_more = page + 1 < self.config.pages
+        return _ok({"notes": notes, "cursor": str(page + 1), "has_more": has_more})
+
+    def user_info(self, params):
+        user_id = params.get("target_user_id", "") or _id("self")
+        return _ok(
+            {
+                "basic_info": {
+                    "nickname": f"用户{user_id[:6]}",
+                    "imageb": f"{IMAGE_CDN}/avatar/{user_id}.jpg",
+                    "red_id": user_id[:10],
+                    "gender": 1,
+                    "ip_location": "广东",
+                    "desc": "模拟用户",
+                },
+                "interactions": [{"count": "10"}, {"count": "20"}, {"count": "30"}],
+                "tags": [{"name": "模拟"}],
+                "user_id": user_id,
+            }
+        )
+
+    def respond(self, path, params, body):
+        if path.endswith("/search/notes"):
+            return self.search_notes(body)
+        if path.endswith("/feed"):
+            return self.feed(body)
+        if path.endswith("/comment/page"):
+            return self.comment_page(params)
+        if path.endswith("/comment/sub/page"):
+            return self.sub_comment_page(params)
+        if path.endswith("/user_posted"):
+            return self.user_posted(params)
+        if path.endswith(("/user/otherinfo", "/user/selfinfo", "/user/me")):
+            return self.user_info(params)
+        if path.endswith("/homefeed/category"):
+            return _ok({"categories": [{"id": "homefeed_recommend", "name": "推荐"}]})
+        if path.endswith("/search/recommend"):
+            return _ok({"sug_items": [{"text": params.get("keyword", "")}]})
+        return _ok({})
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockXHS/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self) -> MockConfig:
+        return self.server.config
+
+    def _send(self, status, body: bytes, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8")
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length).decode("utf-8") if length else ""
+        self.server.count(self.path.split("?")[0])
+        if self.path == "/__stats":
+            self._send_json(200, self.server.stats())
+        elif self.path.startswith("/api/"):
+            self._handle_api(raw_body)
+        else:
+            self._handle_media()
+
+    def _handle_api(self, raw_body):
+        config = self.config
+        delay = config.latency + random.uniform(-config.jitter, config.jitter)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        roll = random.random()
+        if roll < config.error_rate:
+            self._send(500, b"Internal Server Error", "text/plain")
+            return
+        if roll < config.error_rate + config.risk_rate:
+            self._send_json(461, {"code": 300011, "success": False, "msg": "风控拦截"})
+            return
+        path, _, query = self.path.partition("?")
+        if config.fixtures:
+            fixture_path = os.path.join(
+                config.fixtures,
+                "api",
+                f"{fixture_key(self.command, self.path, raw_body)}.json",
+            )
+            if os.path.exists(fixture_path):
+                with open(fixture_path, "r", encoding="utf-8") as f:
+                    fixture = json.load(f)
+                self._send_json(fixture["status"], fixture["response"])
+                return
+        params = dict(urllib.parse.parse_qsl(query, True))
+        body = json.loads(raw_body) if raw_body else {}
+        self._send_json(200, self.server.synthetic.respond(path, params, body))
+
+    def _handle_media(self):
+        config = self.config
+        path = self.path.split("?")[0]
+        # 路径的第一段是原来的域名，见 data_util.cdn_url
+        if config.fixtures:
+            media_path = os.path.join(
+                config.fixtures, "cdn", media_key("https:/" + path)
+            )
+            if os.path.exists(media_path):
+                with open(media_path, "rb") as f:
+                    self._send(200, f.read(), "application/octet-stream")
+                return
+        if "video" in path or path.endswith(".mp4"):
+            size, content_type = config.video_kb * 1024, "video/mp4"
+        else:
+            size, content_type = config.media_kb * 1024, "image/jpeg"
+        self._send(200, self.server.payload(size), content_type)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class MockXHSServer(ThreadingHTTPServer):
+    """
+    模拟服务器，可以在脚本中用 start() 在后台线程启动
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=8899, config: MockConfig = None):
+        super().__init__((host, port), MockHandler)
+        self.config = config or MockConfig()
+        self.synthetic = SyntheticData(self.config)
+        self._counts = {}
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path):
+        with self._lock:
+            self._counts[path] = self._counts.get(path, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def payload(self, size):
+        payload = self._payloads.get(size)
+        if payload is None:
+            payload = self._payloads[size] = os.urandom(size)
+        return payload
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的小红书服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--latency", type=float, default=0, help="接口平均延迟(毫秒)")
+    parser.add_argument("--jitter", type=float, default=0, help="延迟波动(毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0, help="返回500的比例")
+    parser.add_argument("--risk-rate", type=float, default=0, help="返回461的比例")
+    parser.add_argument("--pages", type=int, default=3, help="分页数量")
+    parser.add_argument("--sub-pages", type=int, default=2, help="二级评论分页数量")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--media-kb", type=int, default=64)
+    parser.add_argument("--video-kb", type=int, default=1024)
+    parser.add_argument(
+        "--fixtures", default=os.getenv("XHS_RECORD_DIR"), help="夹具目录"
+    )
+    args = parser.parse_args()
+    config = MockConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        risk_rate=args.risk_rate,
+        pages=args.pages,
+        sub_pages=args.sub_pages,
+        page_size=args.page_size,
+        media_kb=args.media_kb,
+        video_kb=args.video_kb,
+        fixtures=args.fixtures,
+    )
+    server = MockXHSServer(args.host, args.port, config)
+    print(f"模拟服务器已启动: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
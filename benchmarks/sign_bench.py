@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+签名函数基准测试
+对每个签名函数和每个可用的 execjs 后端统计:
+    冷启动   新进程中导入模块(编译js)并完成第一次调用的耗时
+    单次调用 预热后单次调用耗时的 p50/p95
+    持续调用 单线程连续调用的每秒次数
+    并发调用 多线程同时调用的每秒次数
+    python benchmarks/sign_bench.py
+    python benchmarks/sign_bench.py --signers generate_xs_xs_common --backends Node --threads 8
+结果保存为JSON，并与上一次结果对比
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+sys.path.insert(0, ROOT_DIR)
+
+A1 = "18c4d2f7a5bdpmsxxn8v1lfw6d5e8j3q6mbefbk7850000123456"
+API = "/api/sns/web/v1/feed"
+DATA = {
+    "source_note_id": "683fe17f0000000023017c6a",
+    "image_formats": ["jpg", "webp", "avif"],
+    "extra": {"need_body_topic": "1"},
+    "xsec_source": "pc_search",
+    "xsec_token": "ABBr_cMzallQeLyKSRdPk9fwzA0torkbT_ubuQP1ayvKA=",
+}
+
+# 签名函数: (模块, 使用的js上下文变量名, 调用方式)
+SIGNERS = {
+    "generate_xs_xs_common": (
+        "xhs_utils.xhs_util",
+        "js",
+        lambda m: m.generate_xs_xs_common(A1, API, DATA, "POST"),
+    ),
+    "generate_xs": ("xhs_utils.xhs_util", "js", lambda m: m.generate_xs(A1, API, DATA)),
+    "generate_xray_traceid": (
+        "xhs_utils.xhs_util",
+        "xray_js",
+        lambda m: m.generate_xray_traceid(),
+    ),
+    "generate_x_b3_traceid": (
+        "xhs_utils.xhs_util",
+        None,
+        lambda m: m.generate_x_b3_traceid(),
+    ),
+    "generate_headers": (
+        "xhs_utils.xhs_util",
+        "js",
+        lambda m: m.generate_headers(A1, API, DATA, "POST"),
+    ),
+    "creator_generate_xs": (
+        "xhs_utils.xhs_creator_util",
+        "js",
+        lambda m: m.generate_xs(A1, API, ""),
+    ),
+}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def available_backends():
+    import execjs
+
+    return [
+        name for name, runtime in execjs.runtimes().items() if runtime.is_available()
+    ]
+
+
+def load_signer(name):
+    import importlib
+
+    module_name, _, call = SIGNERS[name]
+    return importlib.import_module(module_name), call
+
+
+def cold_start(signer, backend):
+    """
+    子进程入口：切换到指定的 execjs 后端后导入签名模块并调用一次，输出耗时
+    """
+    if backend != "python":
+        import execjs
+
+        # 后端不可用时直接报错，避免 EXECJS_RUNTIME 无效时静默退回默认后端
+        execjs.get(backend)
+        os.environ["EXECJS_RUNTIME"] = backend
+    started = time.perf_counter()
+    module, call = load_signer(signer)
+    imported = time.perf_counter()
+    call(module)
+    finished = time.perf_counter()
+    print(
+        "SIGN_COLD "
+        + json.dumps(
+            {
+                "import_ms": (imported - started) * 1000,
+                "total_ms": (finished - started) * 1000,
+            }
+        )
+    )
+
+
+def measure_cold(signer, backend, timeout):
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--cold", signer, backend],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith("SIGN_COLD "):
+            return json.loads(line[len("SIGN_COLD ") :])
+    raise RuntimeError(process.stderr.strip().splitlines()[-1:] or "子进程没有输出结果")
+
+
+def use_backend(signer, backend):
+    """
+    把签名模块使用的js上下文切换为指定后端编译的版本
+    """
+    import execjs
+
+    module, call = load_signer(signer)
+    context_name = SIGNERS[signer][1]
+    if context_name is None or backend == "python":
+        return module, call
+    contexts = use_backend.cache.setdefault((module.__name__, backend), {})
+    if not contexts:
+        runtime = execjs.get(backend)
+        for name, value in vars(module).items():
+            if hasattr(value, "call") and hasattr(value, "_source"):
+                contexts[name] = runtime.compile(value._source)
+    for name, context in contexts.items():
+        setattr(module, name, context)
+    return module, call
+
+
+use_backend.cache = {}
+
+
+def measure_warm(module, call, calls):
+    """
+    预热一次后逐次调用，返回每次调用的耗时(毫秒)
+    """
+    call(module)
+    durations = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call(module)
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations
+
+
+def measure_rate(module, call, duration, threads):
+    """
+    threads 个线程在 duration 秒内持续调用，返回每秒调用次数
+    """
+    count = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        nonlocal count
+        local = 0
+        while time.perf_counter() < deadline:
+            call(module)
+            local += 1
+        with lock:
+            count += local
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return count / (time.perf_counter() - started)
+
+
+def compare(results, previous_path, threshold):
+    """
+    与之前的结果对比持续调用速度，下降超过 threshold 的标记为回退
+    """
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    old = {(r["signer"], r["backend"]): r for r in previous["results"]}
+    print(f"\n与 {os.path.basename(previous_path)} ({previous.get('revision')}) 对比:")
+    regressions = 0
+    for result in results:
+        before = old.get((result["signer"], result["backend"]))
+        if (
+            before is None
+            or not before.get("sustained_per_sec")
+            or "sustained_per_sec" not in result
+        ):
+            continue
+        change = result["sustained_per_sec"] / before["sustained_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  ⚠️ 回退"
+            regressions += 1
+        print(
+            f"{result['signer']:>24} {result['backend']:>8}: "
+            f"{before['sustained_per_sec']:>10} -> {result['sustained_per_sec']:>10} 次/秒 "
+            f"({change:+.1%}){flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="签名函数基准测试")
+    parser.add_argument("--signers", default=",".join(SIGNERS))
+    parser.add_argument("--backends", default="", help="execjs 后端，默认所有可用后端")
+    parser.add_argument("--calls", type=int, default=10, help="单次调用测量次数")
+    parser.add_argument(
+        "--duration", type=float, default=5, help="持续和并发调用的时长(秒)"
+    )
+    parser.add_argument("--threads", type=int, default=4, help="并发调用的线程数")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", default="")
+    parser.add_argument("--compare", default="latest", help="latest、none 或结果文件")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument(
+        "--cold", nargs=2, metavar=("SIGNER", "BACKEND"), help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    os.chdir(ROOT_DIR)
+    if args.cold:
+        cold_start(*args.cold)
+        return
+
+    previous = None
+    if args.compare == "latest":
+        files = sorted(glob.glob(os.path.join(RESULTS_DIR, "sign-*.json")))
+        previous = files[-1] if files else None
+    elif args.compare != "none":
+        previous = args.compare
+
+    backends = args.backends.split(",") if args.backends else available_backends()
+    results = []
+    for signer in args.signers.split(","):
+        signer_backends = ["python"] if SIGNERS[signer][1] is None else backends
+        for backend in signer_backends:
+            try:
+                cold = measure_cold(signer, backend, args.timeout)
+                module, call = use_backend(signer, backend)
+                warm = measure_warm(module, call, args.calls)
+                result = {
+                    "signer": signer,
+                    "backend": backend,
+                    "cold_import_ms": round(cold["import_ms"], 2),
+                    "cold_total_ms": round(cold["total_ms"], 2),
+                    "warm_p50_ms": round(percentile(warm, 50), 3),
+                    "warm_p95_ms": round(percentile(warm, 95), 3),
+                    "sustained_per_sec": round(
+                        measure_rate(module, call, args.duration, 1), 2
+                    ),
+                    "concurrent_per_sec": round(
+                        measure_rate(module, call, args.duration, args.threads), 2
+                    ),
+                    "threads": args.threads,
+                }
+            except Exception as e:
+                # 签名函数不可用时同样写入报告，便于对比
+                print(f"❌ {signer} {backend}: {e}")
+                results.append({"signer": signer, "backend": backend, "error": str(e)})
+                continue
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False))
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR, f"sign-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+    report = {
+        "revision": git_revision(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+    if previous and os.path.abspath(previous) != os.path.abspath(output):
+        if compare(results, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Web服务压测脚本
+对已运行的服务压测:
+    python benchmarks/web_load_test.py --url http://127.0.0.1:8888 --path /api/tasks
+依次以不同Web进程数启动生产模式服务并压测，观察吞吐量随进程数的变化:
+    python benchmarks/web_load_test.py --spawn-workers 1,2,4 --path "/api/data/1766739844891?limit=5"
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_load(url, concurrency, duration):
+    """
+    用 concurrency 个线程持续请求 url，持续 duration 秒
+    返回吞吐量和延迟统计
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        nonlocal errors
+        session = requests.Session()
+        local_latencies, local_errors = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = session.get(url, timeout=30)
+                response.content
+                if response.status_code >= 400:
+                    local_errors += 1
+            except requests.RequestException:
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + "/api/tasks", timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.3)
+    return False
+
+
+def spawn_server(workers, port):
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "start_web.py",
+            "--prod",
+            "--workers",
+            str(workers),
+            "--crawl-workers",
+            "0",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+        ],
+        cwd=ROOT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Web服务压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8888")
+    parser.add_argument("--path", default="/api/tasks")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument(
+        "--spawn-workers", default="", help="依次启动的Web进程数，如 1,2,4"
+    )
+    parser.add_argument("--port", type=int, default=18888)
+    parser.add_argument("--output", default="", help="结果保存为JSON文件")
+    args = parser.parse_args()
+
+    results = []
+    if args.spawn_workers:
+        base_url = f"http://127.0.0.1:{args.port}"
+        for workers in [int(w) for w in args.spawn_workers.split(",")]:
+            server = spawn_server(workers, args.port)
+            try:
+                if not wait_ready(base_url):
+                    print(f"❌ {workers} 个Web进程的服务启动失败")
+                    continue
+                result = run_load(base_url + args.path, args.concurrency, args.duration)
+                result["workers"] = workers
+                results.append(result)
+                print(json.dumps(result, ensure_ascii=False))
+            finally:
+                server.terminate()
+                server.wait()
+    else:
+        result = run_load(args.url + args.path, args.concurrency, args.duration)
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -65,7 +65,7 @@ docker run -d \
     -v $(pwd)/datas:/app/datas \
     -v $(pwd)/web_data:/app/web_data \
     -v $(pwd)/.env:/app/.env \
-    xhs-spider python start_web.py
+    xhs-spider python start_web.py --prod --port 8888
 
 # 10. 等待服务启动
 echo "⏳ 等待服务启动..."
@@ -1,14 +1,34 @@
+import argparse
+import atexit
 import json
 import os
+import time
+import urllib.parse
 from loguru import logger
 from apis.xhs_pc_apis import XHS_Apis
+from xhs_utils.comment_util import CommentBudget, CommentCrawler, open_comment_sink
 from xhs_utils.common_util import init
+from xhs_utils.cookie_pool_util import CookiePool
 from xhs_utils.data_util import handle_note_info, download_note, save_to_xlsx
+from xhs_utils.log_util import hot_logger
+from xhs_utils.note_cache_util import NOTE_CACHE_HIT_MSG, get_note_cache
+from xhs_utils.profile_util import CrawlProfiler
+from xhs_utils.timing_util import get_stage_timer
+
+# 每条笔记输出的日志，按 LOG_SAMPLE / LOG_RATE 采样和限流
+note_log = hot_logger('note')
 
 
 class Data_Spider():
-    def __init__(self):
+    """
+    各方法的 cookies_str 参数都可以传入 CookiePool，请求会分摊到池中的多个账号
+    """
+    def __init__(self, note_cache=None):
         self.xhs_apis = XHS_Apis()
+        # 跨任务共享的笔记缓存，重复的笔记不再请求
+        self.note_cache = note_cache or get_note_cache()
+        # XHS_TIMING=1 时统计各阶段耗时，每次爬取结束输出汇总
+        self.stage_timer = get_stage_timer()
 
     def spider_note(self, note_url: str, cookies_str: str, proxies=None):
         """
@@ -19,15 +39,24 @@ class Data_Spider():
         """
         note_info = None
         try:
+            note_id = urllib.parse.urlparse(note_url).path.split('/')[-1]
+            cached = self.note_cache.get(note_id, 'note')
+            if cached is not None:
+                cached['note_url'] = note_url
+                success, msg, note_info = True, NOTE_CACHE_HIT_MSG, cached
+                note_log.info('爬取笔记信息 {}: {}, msg: {}', note_url, success, msg)
+                return success, msg, note_info
             success, msg, note_info = self.xhs_apis.get_note_info(note_url, cookies_str, proxies)
             if success:
                 note_info = note_info['data']['items'][0]
                 note_info['url'] = note_url
-                note_info = handle_note_info(note_info)
+                with self.stage_timer.stage('handle_note'):
+                    note_info = handle_note_info(note_info)
+                self.note_cache.put(note_id, 'note', note_info)
         except Exception as e:
             success = False
             msg = e
-        logger.info(f'爬取笔记信息 {note_url}: {success}, msg: {msg}')
+        note_log.info('爬取笔记信息 {}: {}, msg: {}', note_url, success, msg)
         return success, msg, note_info
 
     def spider_some_note(self, notes: list, cookies_str: str, base_path: dict, save_choice: str, excel_name: str = '', proxies=None):
@@ -41,16 +70,19 @@ class Data_Spider():
         if (save_choice == 'all' or save_choice == 'excel') and excel_name == '':
             raise ValueError('excel_name 不能为空')
         note_list = []
-        for note_url in notes:
-            success, msg, note_info = self.spider_note(note_url, cookies_str, proxies)
-            if note_info is not None and success:
-                note_list.append(note_info)
-        for note_info in note_list:
-            if save_choice == 'all' or 'media' in save_choice:
-                download_note(note_info, base_path['media'], save_choice)
-        if save_choice == 'all' or save_choice == 'excel':
-            file_path = os.path.abspath(os.path.join(base_path['excel'], f'{excel_name}.xlsx'))
-            save_to_xlsx(note_list, file_path)
+        try:
+            for note_url in notes:
+                success, msg, note_info = self.spider_note(note_url, cookies_str, proxies)
+                if note_info is not None and success:
+                    note_list.append(note_info)
+            for note_info in note_list:
+                if save_choice == 'all' or 'media' in save_choice:
+                    download_note(note_info, base_path['media'], save_choice)
+            if save_choice == 'all' or save_choice == 'excel':
+                file_path = os.path.abspath(os.path.join(base_path['excel'], f'{excel_name}.xlsx'))
+                save_to_xlsx(note_list, file_path)
+        finally:
+            self.stage_timer.summary()
 
 
     def spider_user_all_note(self, user_url: str, cookies_str: str, base_path: dict, save_choice: str, excel_name: str = '', proxies=None):
@@ -110,16 +142,62 @@ class Data_Spider():
         logger.info(f'搜索关键词 {query} 笔记: {success}, msg: {msg}')
         return note_list, success, msg
 
+    def spider_notes_comments(self, notes: list, cookies_str: str, base_path: dict, file_name: str, file_type: str = 'xlsx', max_comments=None, max_pages=None, max_seconds=None, total_comments=None, total_pages=None, total_seconds=None, include_sub=True, proxies=None):
+        """
+        按预算爬取一些笔记的评论，边爬边写入文件，不在内存中保留评论
+        :param notes: 笔记链接列表
+        :param cookies_str:
+        :param base_path:
+        :param file_name: 文件名，保存在 base_path['excel'] 下
+        :param file_type: xlsx / csv / jsonl
+        :param max_comments max_pages max_seconds: 每篇笔记最多的评论数、评论页数和秒数，None 为不限
+        :param total_comments total_pages total_seconds: 所有笔记合计的上限
+        :param include_sub: 是否包含二级评论
+        返回 文件路径, 每篇笔记的 (note_url, success, msg, 统计信息)
+        """
+        file_path = os.path.abspath(os.path.join(base_path['excel'], f'{file_name}.{file_type}'))
+        sink = open_comment_sink(file_path)
+        crawler = CommentCrawler(
+            self.xhs_apis,
+            sink,
+            note_limits={'max_comments': max_comments, 'max_pages': max_pages, 'max_seconds': max_seconds},
+            budget=CommentBudget(total_comments, total_pages, total_seconds),
+            include_sub=include_sub,
+        )
+        try:
+            results = crawler.crawl_notes(notes, cookies_str, proxies)
+        finally:
+            sink.close()
+        logger.info(f'评论保存至 {file_path}，共 {sink.rows} 条')
+        return file_path, results
+
 if __name__ == '__main__':
     """
         此文件为爬虫的入口文件，可以直接运行
         apis/xhs_pc_apis.py 为爬虫的api文件，包含小红书的全部数据接口，可以继续封装
         apis/xhs_creator_apis.py 为小红书创作者中心的api文件
         感谢star和follow
+        python main.py --profile 对整个爬取过程做性能分析，结果保存在 datas/profile
     """
+    parser = argparse.ArgumentParser(description='小红书爬虫')
+    parser.add_argument('--profile', action='store_true', help='对爬取过程做性能分析')
+    parser.add_argument('--profile-mode', default=os.getenv('XHS_PROFILE_MODE', 'both'), choices=['both', 'cprofile', 'sample'], help='cprofile 确定性分析, sample 采样分析, both 两者都用')
+    parser.add_argument('--profile-interval', type=float, default=float(os.getenv('XHS_PROFILE_INTERVAL', 0.005)), help='采样间隔(秒)')
+    parser.add_argument('--tracemalloc', action='store_true', help='同时记录内存快照')
+    args = parser.parse_args()
 
     cookies_str, base_path = init()
+    # 配置了 COOKIES_POOL 或 COOKIES_POOL_FILE 时使用多账号池
+    cookie_pool = CookiePool.from_env()
+    if cookie_pool is not None:
+        cookies_str = cookie_pool
     data_spider = Data_Spider()
+    if args.profile:
+        # 分析结果和爬取的数据放在一起，进程退出时写入
+        profile_dir = os.path.join(os.path.dirname(base_path['excel']), 'profile')
+        profiler = CrawlProfiler(profile_dir, f"crawl-{time.strftime('%Y%m%d-%H%M%S')}", args.profile_mode, args.profile_interval, args.tracemalloc)
+        atexit.register(profiler.stop)
+        profiler.start()
     """
         save_choice: all: 保存所有的信息, media: 保存视频和图片（media-video只下载视频, media-image只下载图片，media都下载）, excel: 保存到excel
         save_choice 为 excel 或者 all 时，excel_name 不能为空
@@ -150,3 +228,6 @@ if __name__ == '__main__':
     #     "longitude": 116.4207
     # }
     data_spider.spider_some_search_note(query, query_num, cookies_str, base_path, 'all', sort_type_choice, note_type, note_time, note_range, pos_distance, geo=None)
+
+    # 4 爬取笔记的评论，每篇最多 500 条，边爬边写入 excel
+    data_spider.spider_notes_comments(notes, cookies_str, base_path, 'test_comments', 'xlsx', max_comments=500)
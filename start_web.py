@@ -2,13 +2,100 @@
 # -*- coding: utf-8 -*-
 """
 启动Web服务的脚本
+python start_web.py                 开发模式，单进程 + 自动重载
+python start_web.py --prod          生产模式，gunicorn 多进程提供Web服务，独立的爬虫进程执行任务
+python start_web.py --crawl-worker  只启动爬虫进程，配合已经运行的生产模式Web服务使用
 """
 
+import argparse
+import multiprocessing
 import os
 import sys
 
 
+def run_crawl_worker():
+    """
+    爬虫进程：从共享任务队列中领取任务并执行
+    """
+    os.environ["WEB_STATE_BACKEND"] = "sqlite"
+    from web_spider import web_spider
+
+    web_spider.scheduler.serve(web_spider)
+
+
+def run_production(args):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError as e:
+        print(f"❌ 缺少依赖: {e}")
+        print("请运行: pip install gunicorn")
+        return
+
+    # Web进程和爬虫进程通过SQLite共享任务状态、队列和事件
+    os.environ["WEB_STATE_BACKEND"] = "sqlite"
+
+    crawl_processes = []
+    for i in range(args.crawl_workers):
+        process = multiprocessing.Process(
+            target=run_crawl_worker, name=f"crawl-worker-{i}", daemon=True
+        )
+        process.start()
+        crawl_processes.append(process)
+    print(f"✅ 已启动 {len(crawl_processes)} 个爬虫进程")
+
+    class WebApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{args.host}:{args.port}")
+            self.cfg.set("workers", args.workers)
+            # SSE 是长连接，使用线程模式避免占满工作进程
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", args.threads)
+            self.cfg.set("timeout", 120)
+
+        def load(self):
+            from web_spider import app
+
+            return app
+
+    try:
+        WebApplication().run()
+    finally:
+        for process in crawl_processes:
+            process.terminate()
+
+
 def main():
+    parser = argparse.ArgumentParser(description="小红书数据采集Web服务")
+    parser.add_argument("--prod", action="store_true", help="生产模式")
+    parser.add_argument(
+        "--crawl-worker", action="store_true", help="只启动爬虫进程(生产模式)"
+    )
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8888)))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_WORKERS", 2)),
+        help="Web进程数量",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=int(os.getenv("WEB_THREADS", 8)),
+        help="每个Web进程的线程数量",
+    )
+    parser.add_argument(
+        "--crawl-workers",
+        type=int,
+        default=int(os.getenv("WEB_CRAWL_WORKERS", 1)),
+        help="爬虫进程数量，每个进程的并发任务数由 WEB_MAX_WORKERS 决定",
+    )
+    args = parser.parse_args()
+
+    if args.crawl_worker:
+        run_crawl_worker()
+        return
+
     print("🚀 启动小红书数据采集Web服务...")
     print("=" * 50)
 
@@ -32,13 +119,17 @@ def main():
 
     print("✅ 环境检查通过")
     print("🌐 启动Web服务...")
-    print("📱 访问地址: http://localhost:8888")
+    print(f"📱 访问地址: http://localhost:{args.port}")
     print("=" * 50)
 
+    if args.prod:
+        run_production(args)
+        return
+
     # 启动服务
     from web_spider import app
 
-    app.run(debug=True, host="0.0.0.0", port=8888)
+    app.run(debug=True, host=args.host, port=args.port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+import csv
+import os
+import sys
+import time
+
+import openpyxl
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from xhs_utils.comment_util import (  # noqa: E402
+    CommentBudget,
+    CommentCrawler,
+    open_comment_sink,
+)
+from xhs_utils.data_util import XLSX_HEADERS  # noqa: E402
+
+
+def make_comment(note_id, comment_id, **extra):
+    comment = {
+        "id": comment_id,
+        "note_id": note_id,
+        "content": f"内容 {comment_id}",
+        "like_count": "1",
+        "create_time": 1700000000000,
+        "ip_location": "上海",
+        "show_tags": [],
+        "pictures": [],
+        "user_info": {
+            "user_id": f"user-{comment_id}",
+            "nickname": f"昵称 {comment_id}",
+            "image": f"https://img.test/{comment_id}.jpg",
+        },
+    }
+    comment.update(extra)
+    return comment
+
+
+class StubApis:
+    """
+    按页返回合成评论的 XHS_Apis 替身
+    :param pages: 每篇笔记的一级评论页数
+    :param page_size: 每页的一级评论数
+    :param sub_pages: 每条一级评论还需要请求的二级评论页数
+    :param delay: 每次请求的耗时(秒)
+    """
+
+    def __init__(self, pages=3, page_size=10, sub_pages=0, delay=0):
+        self.pages = pages
+        self.page_size = page_size
+        self.sub_pages = sub_pages
+        self.delay = delay
+        self.calls = []
+
+    def get_note_out_comment(self, note_id, cursor, xsec_token, cookies_str, proxies):
+        self.calls.append(("out", note_id, cursor))
+        time.sleep(self.delay)
+        page = int(cursor or 0)
+        comments = [
+            make_comment(
+                note_id,
+                f"{note_id}-{page}-{i}",
+                sub_comments=[],
+                sub_comment_has_more=self.sub_pages > 0,
+                sub_comment_cursor="",
+            )
+            for i in range(self.page_size)
+        ]
+        has_more = page + 1 < self.pages
+        return (
+            True,
+            "成功",
+            {"data": {"comments": comments, "cursor": page + 1, "has_more": has_more}},
+        )
+
+    def get_note_inner_comment(self, comment, cursor, xsec_token, cookies_str, proxies):
+        self.calls.append(("inner", comment["id"], cursor))
+        time.sleep(self.delay)
+        page = int(cursor or 0)
+        comments = [make_comment(comment["note_id"], f"{comment['id']}-sub-{page}")]
+        has_more = page + 1 < self.sub_pages
+        return (
+            True,
+            "成功",
+            {"data": {"comments": comments, "cursor": page + 1, "has_more": has_more}},
+        )
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+
+def note_url(note_id):
+    return f"https://www.xiaohongshu.com/explore/{note_id}?xsec_token=t"
+
+
+def crawl(apis, note_limits=None, budget=None, note_id="n1", include_sub=True):
+    sink = ListSink()
+    crawler = CommentCrawler(apis, sink, note_limits, budget, include_sub)
+    success, msg, stats = crawler.crawl_note(note_url(note_id), "a1=x")
+    assert success, msg
+    assert len(sink.rows) == stats["comments"]
+    return stats
+
+
+@pytest.mark.parametrize("note_limits", [{}, {"max_comments": 30}, {"max_pages": 3}])
+def test_note_ending_exactly_at_the_limit_is_not_stopped(note_limits):
+    apis = StubApis(pages=3, page_size=10)
+    stats = crawl(apis, note_limits)
+    assert stats == {"comments": 30, "pages": 3, "stopped": None}
+
+
+def test_per_note_comment_limit():
+    apis = StubApis(pages=3, page_size=10)
+    stats = crawl(apis, {"max_comments": 25})
+    assert stats == {"comments": 25, "pages": 3, "stopped": "comments"}
+
+
+def test_per_note_page_limit():
+    apis = StubApis(pages=3, page_size=10)
+    stats = crawl(apis, {"max_pages": 2})
+    assert stats == {"comments": 20, "pages": 2, "stopped": "pages"}
+    assert [call[2] for call in apis.calls] == ["", "1"]
+
+
+def test_time_limit():
+    apis = StubApis(pages=20, page_size=1, delay=0.02)
+    stats = crawl(apis, {"max_seconds": 0.1})
+    assert stats["stopped"] == "time"
+    assert 1 <= stats["pages"] < 20
+
+
+def test_sub_comment_pages_count_towards_the_budget():
+    apis = StubApis(pages=1, page_size=2, sub_pages=2)
+    stats = crawl(apis, {"max_pages": 3})
+    # 一级评论 1 页，第一条一级评论的二级评论 2 页，第二条一级评论的二级评论被拒绝
+    assert stats == {"comments": 4, "pages": 3, "stopped": "pages"}
+    assert [call[1] for call in apis.calls if call[0] == "inner"] == ["n1-0-0"] * 2
+
+    stats = crawl(StubApis(pages=1, page_size=2, sub_pages=2), include_sub=False)
+    assert stats == {"comments": 2, "pages": 1, "stopped": None}
+
+
+def test_global_budget_is_shared_across_notes():
+    apis = StubApis(pages=3, page_size=10)
+    budget = CommentBudget(max_comments=45)
+    crawler = CommentCrawler(apis, ListSink(), budget=budget)
+    results = crawler.crawl_notes([note_url(n) for n in ("n1", "n2", "n3")], "a1=x")
+
+    assert [stats for _, _, _, stats in results] == [
+        {"comments": 30, "pages": 3, "stopped": None},
+        {"comments": 15, "pages": 2, "stopped": "comments"},
+    ]
+    # 全局预算用完后不再请求第三篇笔记
+    assert not [call for call in apis.calls if call[1] == "n3"]
+    assert budget.comments == 45
+
+
+def test_note_budget_is_given_back_after_global_refusal():
+    budget = CommentBudget(max_pages=4)
+    crawl(StubApis(pages=3, page_size=10), budget=budget)
+    stats = crawl(StubApis(pages=3, page_size=10), {"max_pages": 10}, budget, "n2")
+    # 第二页被全局预算拒绝，本篇预算归还，不计入已用页数
+    assert stats == {"comments": 10, "pages": 1, "stopped": "pages"}
+    assert budget.pages == 4
+
+    budget = CommentBudget(max_comments=35)
+    crawl(StubApis(pages=3, page_size=10), budget=budget)
+    stats = crawl(StubApis(pages=3, page_size=10), {"max_comments": 10}, budget, "n2")
+    assert stats == {"comments": 5, "pages": 1, "stopped": "comments"}
+    assert budget.comments == 35
+
+
+def test_failed_request_is_reported():
+    class FailingApis(StubApis):
+        def get_note_out_comment(self, *args):
+            return False, "接口异常", None
+
+    sink = ListSink()
+    crawler = CommentCrawler(FailingApis(), sink)
+    success, msg, stats = crawler.crawl_note(note_url("n1"), "a1=x")
+    assert not success
+    assert msg == "接口异常"
+    assert stats == {"comments": 0, "pages": 1, "stopped": None}
+
+
+def read_rows(path):
+    if path.endswith(".csv"):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            return list(csv.reader(f))
+    ws = openpyxl.load_workbook(path).active
+    return [[cell.value for cell in row] for row in ws.iter_rows()]
+
+
+@pytest.mark.parametrize("ext", [".csv", ".xlsx"])
+def test_file_sink_columns_match_xlsx_headers(tmp_path, ext):
+    path = str(tmp_path / f"comments{ext}")
+    sink = open_comment_sink(path)
+    crawler = CommentCrawler(StubApis(pages=1, page_size=2), sink)
+    crawler.crawl_note(note_url("n1"), "a1=x")
+    sink.close()
+
+    header, *rows = read_rows(path)
+    assert header == XLSX_HEADERS["comment"]
+    assert len(rows) == 2
+    row = dict(zip(header, rows[0]))
+    assert row["笔记id"] == "n1"
+    assert row["笔记url"] == note_url("n1")
+    assert row["评论id"] == "n1-0-0"
+    assert row["用户id"] == "user-n1-0-0"
+    assert row["昵称"] == "昵称 n1-0-0"
+    assert row["评论内容"] == "内容 n1-0-0"
+    assert row["ip归属地"] == "上海"
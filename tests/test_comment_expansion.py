@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from apis.xhs_pc_apis import XHS_Apis  # noqa: E402
+
+NOTE_URL = "https://www.xiaohongshu.com/explore/n1?xsec_token=t"
+
+
+class StubApis(XHS_Apis):
+    """
+    替换一级和二级评论接口的 XHS_Apis，不发送网络请求
+    :param pages: 一级评论的页数，每页 3 条，序号为偶数的评论还有更多二级评论
+    :param fail_page: 请求到这一页时返回失败
+    :param delays: 展开二级评论的耗时 {评论id: 秒}
+    """
+
+    def __init__(self, pages=2, fail_page=None, delays=None):
+        super().__init__()
+        self.pages = pages
+        self.fail_page = fail_page
+        self.delays = delays or {}
+        self.inner_calls = []
+        self._lock = threading.Lock()
+
+    def get_note_out_comment(
+        self, note_id, cursor, xsec_token, cookies_str, proxies=None
+    ):
+        page = int(cursor or 0)
+        if page == self.fail_page:
+            return False, "一级评论请求失败", None
+        comments = []
+        for i in range(3):
+            index = page * 3 + i
+            comments.append(
+                {
+                    "id": f"c{index}",
+                    "sub_comments": [{"id": f"c{index}-first"}],
+                    "sub_comment_has_more": index % 2 == 0,
+                    "sub_comment_cursor": "",
+                }
+            )
+        data = {
+            "comments": comments,
+            "cursor": page + 1,
+            "has_more": page + 1 < self.pages,
+        }
+        return True, "成功", {"data": data}
+
+    def get_note_inner_comment(
+        self, comment, cursor, xsec_token, cookies_str, proxies=None
+    ):
+        with self._lock:
+            self.inner_calls.append((comment["id"], cursor))
+        time.sleep(self.delays.get(comment["id"], 0))
+        page = int(cursor or 0)
+        data = {
+            "comments": [{"id": f"{comment['id']}-sub-{page}"}],
+            "cursor": page + 1,
+            "has_more": page == 0,
+        }
+        return True, "成功", {"data": data}
+
+
+def test_expansion_keeps_comment_order():
+    # 先提交的展开更慢，完成顺序与评论顺序相反
+    apis = StubApis(delays={"c0": 0.2, "c2": 0.1})
+    success, msg, comments = apis.get_note_all_comment(NOTE_URL, "a1=x", concurrency=4)
+
+    assert success, msg
+    assert [c["id"] for c in comments] == ["c0", "c1", "c2", "c3", "c4", "c5"]
+    for index, comment in enumerate(comments):
+        expected = [f"c{index}-first"]
+        if index % 2 == 0:
+            expected += [f"c{index}-sub-0", f"c{index}-sub-1"]
+        assert [c["id"] for c in comment["sub_comments"]] == expected
+
+
+def test_complete_threads_are_not_requested():
+    apis = StubApis()
+    apis.get_note_all_comment(NOTE_URL, "a1=x")
+
+    assert sorted({comment_id for comment_id, _ in apis.inner_calls}) == [
+        "c0",
+        "c2",
+        "c4",
+    ]
+
+
+def test_top_level_failure_cancels_pending_expansions():
+    # 只有一个线程，c0 展开时 c2 在排队，第二页失败后 c2 被取消
+    apis = StubApis(fail_page=1, delays={"c0": 0.3})
+    success, msg, comments = apis.get_note_all_comment(NOTE_URL, "a1=x", concurrency=1)
+
+    assert (success, comments) == (False, [])
+    assert "一级评论请求失败" in msg
+    assert {comment_id for comment_id, _ in apis.inner_calls} == {"c0"}
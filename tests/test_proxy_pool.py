@@ -0,0 +1,228 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from apis.xhs_pc_apis import XHS_Apis  # noqa: E402
+from xhs_utils.proxy_pool_util import NoProxyError, ProxyPool  # noqa: E402
+
+# 经过代理请求的地址，本地代理不会真正转发
+API = "/api/sns/web/v1/user/otherinfo?target_user_id=1"
+TIMEOUT = (0.5, 0.5)
+
+
+class StandInProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.hits += 1
+        if server.mode == "hang":
+            # 超过读取超时再返回，客户端视为超时
+            time.sleep(TIMEOUT[1] * 3)
+            return
+        status = 502 if server.mode == "5xx" else 200
+        body = json.dumps({"proxy": server.name, "success": status == 200}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInProxy(ThreadingHTTPServer):
+    """
+    本地代理，mode 为 ok 时正常响应，5xx 时返回 502，hang 时不响应直到超时
+    """
+
+    daemon_threads = True
+
+    def __init__(self, name, mode="ok"):
+        super().__init__(("127.0.0.1", 0), StandInProxyHandler)
+        self.name = name
+        self.mode = mode
+        self.hits = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+@pytest.fixture
+def proxies():
+    servers = {
+        "healthy": StandInProxy("healthy"),
+        "hang": StandInProxy("hang", "hang"),
+        "5xx": StandInProxy("5xx", "5xx"),
+    }
+    yield servers
+    for server in servers.values():
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def apis():
+    apis = XHS_Apis()
+    apis.base_url = "http://xhs.test"
+    return apis
+
+
+def make_pool(proxies, names, **kwargs):
+    kwargs.setdefault("timeout", TIMEOUT)
+    return ProxyPool([proxies[name].url for name in names], **kwargs)
+
+
+def state_of(pool, proxy):
+    return next(s for s in pool.states if s.url == proxy.url)
+
+
+def send(apis, pool, account="a1"):
+    return apis._send_via_pool("GET", API, pool, account, {})
+
+
+def test_failover_inside_one_request(apis, proxies):
+    pool = make_pool(proxies, ["hang", "healthy"])
+    # 未测量过的代理得分相同，先挑中列表中的第一个
+    assert pool.acquire("a1") is state_of(pool, proxies["hang"])
+    pool.report(state_of(pool, proxies["hang"]), True, 0.0)
+
+    response = send(apis, pool)
+
+    assert response.json()["proxy"] == "healthy"
+    assert state_of(pool, proxies["hang"]).failures == 1
+    # 失败后账号改为固定到新的代理
+    assert pool.acquire("a1") is state_of(pool, proxies["healthy"])
+
+
+def test_failover_gives_up_after_second_proxy(apis, proxies):
+    proxies["healthy"].mode = "hang"
+    pool = make_pool(proxies, ["hang", "healthy"])
+
+    with pytest.raises(requests.Timeout):
+        send(apis, pool)
+    assert proxies["hang"].hits == 1
+    assert proxies["healthy"].hits == 1
+
+
+def test_sticky_pinning_per_account(apis, proxies):
+    second = StandInProxy("second")
+    try:
+        pool = ProxyPool([proxies["healthy"].url, second.url], timeout=TIMEOUT)
+        served = {
+            account: {send(apis, pool, account).json()["proxy"] for _ in range(5)}
+            for account in ("a", "b")
+        }
+    finally:
+        second.shutdown()
+        second.server_close()
+
+    assert len(served["a"]) == 1
+    assert len(served["b"]) == 1
+    # b 第一次请求时 a 的代理已有延迟，挑选未测量的代理
+    assert served["a"] != served["b"]
+
+
+def test_unpinned_pool_spreads_by_score(apis, proxies):
+    pool = make_pool(proxies, ["healthy", "5xx"], sticky=False)
+    for _ in range(6):
+        send(apis, pool)
+    assert proxies["healthy"].hits > 0
+    assert proxies["5xx"].hits > 0
+
+
+def test_eject_and_revive_without_probe(apis, proxies):
+    pool = make_pool(proxies, ["5xx", "healthy"], sticky=False, cooldown=0.3)
+    bad = state_of(pool, proxies["5xx"])
+
+    # 502 的代理延迟不更新，得分一直最低，直到被剔除
+    for _ in range(3):
+        assert send(apis, pool).status_code == 502
+    assert bad.failures == 3
+    assert [s["ejected"] for s in pool.stats()] == [True, False]
+
+    for _ in range(3):
+        assert send(apis, pool).json()["proxy"] == "healthy"
+    assert proxies["5xx"].hits == 3
+
+    time.sleep(0.4)
+    proxies["5xx"].mode = "ok"
+    # 冷却期满后放回池中，试探成功继续使用
+    assert send(apis, pool).json()["proxy"] == "5xx"
+    assert [s["ejected"] for s in pool.stats()] == [False, False]
+
+
+def test_revived_proxy_is_ejected_again_after_one_failure(apis, proxies):
+    pool = make_pool(proxies, ["5xx", "healthy"], sticky=False, cooldown=0.3)
+    for _ in range(3):
+        send(apis, pool)
+    time.sleep(0.4)
+
+    assert send(apis, pool).status_code == 502
+    assert state_of(pool, proxies["5xx"]).failures == 4
+    assert pool.stats()[0]["ejected"]
+
+
+def wait_probe(pool, state):
+    deadline = time.time() + 2
+    while time.time() < deadline:
+        with pool._lock:
+            if state.url not in pool._probing:
+                return
+        time.sleep(0.01)
+
+
+def test_revive_with_probe(proxies):
+    pool = make_pool(
+        proxies, ["5xx", "healthy"], cooldown=0.2, probe_url="http://probe.test/"
+    )
+    bad, healthy = pool.states
+    for _ in range(3):
+        pool.report(pool.acquire(exclude=[healthy]), False)
+    assert bad.ejected_until > time.time()
+
+    # 冷却期满时在后台探测，探测期间不使用该代理
+    time.sleep(0.3)
+    assert pool.acquire() is healthy
+    wait_probe(pool, bad)
+    assert proxies["5xx"].hits == 1
+    # 探测失败时继续冷却
+    assert bad.ejected_until > time.time()
+
+    proxies["5xx"].mode = "ok"
+    time.sleep(0.3)
+    pool.acquire()
+    wait_probe(pool, bad)
+    assert proxies["5xx"].hits == 2
+    assert bad.ejected_until == 0.0
+    assert not pool.stats()[0]["ejected"]
+
+
+def test_acquire_never_returns_excluded_proxy(proxies):
+    pool = make_pool(proxies, ["hang", "5xx", "healthy"])
+    hang, bad, healthy = pool.states
+    hang.ejected_until = bad.ejected_until = time.time() + 60
+
+    # 唯一健康的代理失败后，退回最早恢复的已剔除代理，而不是刚失败的代理
+    assert pool.acquire(exclude=[healthy]) in (hang, bad)
+    with pytest.raises(NoProxyError):
+        pool.acquire(exclude=pool.states)
+
+
+def test_single_proxy_pool_does_not_retry_same_proxy(apis, proxies):
+    pool = make_pool(proxies, ["hang"])
+    with pytest.raises(requests.Timeout):
+        send(apis, pool)
+    assert proxies["hang"].hits == 1
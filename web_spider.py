@@ -5,19 +5,49 @@
 提供JSON数据输出和HTML可视化交互
 """
 
+import contextlib
 import json
 import os
 import time
+import urllib.parse
 import uuid
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from threading import Condition, Lock
+from flask import (
+    Flask,
+    Response,
+    request,
+    jsonify,
+    render_template,
+    send_file,
+    send_from_directory,
+    stream_with_context,
+)
+from requests.adapters import HTTPAdapter
 from flask_cors import CORS
-from threading import Thread
 from main import Data_Spider
 from xhs_utils.common_util import init
+from xhs_utils.cookie_util import trans_cookies
+from xhs_utils.image_cache_util import ImageCache
+from xhs_utils.log_util import hot_logger
+from xhs_utils.metrics_util import registry as metrics_registry
+from xhs_utils.note_cache_util import NOTE_CACHE_HIT_MSG
+from xhs_utils.profile_util import CrawlProfiler, bind_task
+from xhs_utils.rate_limit_util import AdaptivePacer
+from xhs_utils.result_util import ResultStore, project_note
+from xhs_utils.scheduler_util import TaskScheduler
+from xhs_utils.store_util import SharedStore, SharedTasks, SharedTaskScheduler
 from loguru import logger
 
+# 每条笔记、图片和评论都会输出的日志，按 LOG_SAMPLE / LOG_RATE 采样和限流
+note_log = hot_logger("note")
+picture_log = hot_logger("picture")
+comment_log = hot_logger("comment")
+sub_comment_log = hot_logger("sub_comment")
+image_log = hot_logger("image")
+
 app = Flask(__name__)
 CORS(app)
 
@@ -26,69 +56,222 @@ class WebSpider:
     def __init__(self):
         self.cookies_str, self.base_path = init()
         self.data_spider = Data_Spider()
-        self.tasks = {}  # 存储任务状态
         self.results_dir = "web_data"
         os.makedirs(self.results_dir, exist_ok=True)
+        # 存储任务事件，供SSE推送: task_id -> {"offset", "events", "finished_at"}
+        # offset 为已丢弃的事件数，每个任务最多保留 events_per_task 条，结束 events_ttl 秒后只保留最后一条
+        self.task_events = {}
+        self.events_per_task = int(os.getenv("WEB_EVENTS_PER_TASK", 500))
+        self.events_ttl = float(os.getenv("WEB_EVENTS_TTL", 600))
+        self.events_cond = Condition()
+        # 生产模式下任务状态、事件和队列保存在SQLite中，由多个进程共享
+        self.store = None
+        if os.getenv("WEB_STATE_BACKEND", "memory") == "sqlite":
+            self.store = SharedStore(
+                os.getenv("WEB_STATE_DB", os.path.join(self.results_dir, "state.db")),
+                events_per_task=self.events_per_task,
+                events_ttl=self.events_ttl,
+            )
+            # 爬虫在独立进程中运行，/metrics 由任意一个Web进程响应，计数器通过共享数据库汇总
+            metrics_registry.share(
+                self.store, float(os.getenv("WEB_METRICS_FLUSH", 15))
+            )
+        self.tasks = SharedTasks(self.store) if self.store else {}  # 存储任务状态
+        self.result_store = ResultStore(self.results_dir)
+        self.image_cache = ImageCache(
+            os.getenv(
+                "IMAGE_CACHE_DIR",
+                os.path.join(os.path.dirname(self.base_path["media"]), "image_cache"),
+            ),
+            max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", 512)) * 1024 * 1024,
+            ttl=int(os.getenv("IMAGE_CACHE_TTL", 7 * 86400)),
+        )
+        # 固定大小的工作池，同一个Cookie同时只跑有限个任务
+        scheduler_class = SharedTaskScheduler if self.store else TaskScheduler
+        scheduler_args = (self.store,) if self.store else ()
+        self.scheduler = scheduler_class(
+            *scheduler_args,
+            max_workers=int(os.getenv("WEB_MAX_WORKERS", 2)),
+            per_key_limit=int(os.getenv("WEB_PER_COOKIE_LIMIT", 1)),
+        )
+        # 单个任务内同时处理的笔记数量
+        self.note_concurrency = int(os.getenv("WEB_NOTE_CONCURRENCY", 3))
+        # 与笔记详情并发获取第一页评论的共享线程池，大小与同时处理的笔记数一致，不必每条笔记新建线程
+        self.comment_executor = ThreadPoolExecutor(
+            max_workers=self.scheduler.max_workers * self.note_concurrency,
+            thread_name_prefix="first-comments",
+        )
+
+    def publish_event(self, task_id, event, data):
+        """
+        记录任务事件并唤醒等待中的SSE连接
+        :param task_id: 任务ID
+        :param event: 事件类型 status/progress/note/completed/failed
+        :param data: 事件数据
+        """
+        if self.store:
+            return self.store.publish_event(task_id, event, data)
+        with self.events_cond:
+            record = self.task_events.setdefault(
+                task_id, {"offset": 0, "events": [], "finished_at": None}
+            )
+            events = record["events"]
+            events.append((event, data))
+            if len(events) > self.events_per_task:
+                # 丢弃最早的事件(多为单条笔记)，断线重连时从保留的第一条开始推送
+                dropped = len(events) - self.events_per_task
+                del events[:dropped]
+                record["offset"] += dropped
+            if event in ("completed", "failed"):
+                record["finished_at"] = time.time()
+                self._prune_events()
+            self.events_cond.notify_all()
+
+    def _prune_events(self):
+        """
+        结束超过 events_ttl 秒的任务只保留最后的完成/失败事件，释放笔记数据
+        """
+        expire_before = time.time() - self.events_ttl
+        for record in self.task_events.values():
+            finished_at = record["finished_at"]
+            if (
+                finished_at
+                and finished_at < expire_before
+                and len(record["events"]) > 1
+            ):
+                record["offset"] += len(record["events"]) - 1
+                del record["events"][:-1]
+
+    def _events_end(self, task_id):
+        record = self.task_events.get(task_id)
+        return record["offset"] + len(record["events"]) if record else 0
+
+    def wait_events(self, task_id, start, timeout):
+        """
+        获取任务从 start 开始的事件，没有新事件时最多等待 timeout 秒
+        返回 (第一条事件的序号, 事件列表)，start 之后的事件已被丢弃时从保留的第一条开始
+        """
+        if self.store:
+            return self.store.wait_events(task_id, start, timeout)
+        with self.events_cond:
+            self.events_cond.wait_for(
+                lambda: self._events_end(task_id) > start, timeout
+            )
+            record = self.task_events.get(task_id)
+            if record is None:
+                return start, []
+            first = max(start, record["offset"])
+            return first, record["events"][first - record["offset"] :]
+
+    @staticmethod
+    def cookie_key(cookie):
+        """
+        获取Cookie的账号标识(a1)，用于按账号限制并发
+        """
+        try:
+            return trans_cookies(cookie).get("a1") or cookie
+        except Exception:
+            return cookie
+
+    def fetch_first_comments(self, note_url, cookies_str, pacer=None, cache_hits=None):
+        """
+        获取笔记的第一页评论，优先使用笔记缓存
+        :param note_url: 笔记URL
+        :param cookies_str: Cookie字符串
+        :param pacer: 请求节奏控制器
+        :param cache_hits: 记录缓存命中的列表
+        """
+        note_log.info("开始获取笔记评论: {}", note_url)
+        comments = []
+        try:
+            # 解析note_id和xsec_token
+            urlParse = urllib.parse.urlparse(note_url)
+            note_id = urlParse.path.split("/")[-1]
+
+            xsec_token = ""
+            if urlParse.query:
+                kvs = urlParse.query.split("&")
+                for kv in kvs:
+                    if "=" in kv and kv.startswith("xsec_token="):
+                        xsec_token = kv.split("=", 1)[1]
+                        break
+
+            note_log.info(
+                "解析得到 note_id: {}, xsec_token: {}...", note_id, xsec_token[:20]
+            )
+
+            note_cache = self.data_spider.note_cache
+            cached = note_cache.get(note_id, "comments")
+            if cached is not None:
+                note_log.info("命中评论缓存: {}", note_id)
+                if cache_hits is not None:
+                    cache_hits.append("comments")
+                return cached
+
+            if pacer:
+                pacer.wait()
+            success, msg, res_json = self.data_spider.xhs_apis.get_note_out_comment(
+                note_id, "", xsec_token, cookies_str
+            )
+            if pacer:
+                pacer.feedback(success, msg)
+
+            if (
+                success
+                and res_json
+                and "data" in res_json
+                and "comments" in res_json["data"]
+            ):
+                comments = res_json["data"]["comments"]
+                note_cache.put(note_id, "comments", comments)
+                note_log.info("成功获取评论数量: {}", len(comments))
+            else:
+                logger.warning(f"获取评论失败: {msg}")
+
+        except Exception as e:
+            logger.error(f"获取评论异常: {e}")
+            comments = []
+        return comments
 
-    def extract_note_data(self, note_url, cookies_str=None):
+    def extract_note_data(
+        self, note_url, cookies_str=None, pacer=None, cache_hits=None
+    ):
         """
-        提取单个笔记的完整数据
+        提取单个笔记的完整数据，笔记详情和第一页评论并发获取
         :param note_url: 笔记URL
         :param cookies_str: Cookie字符串，如果为None则使用初始化时的Cookie
+        :param pacer: 请求节奏控制器，为None时不限速
+        :param cache_hits: 记录缓存命中的列表，命中笔记缓存记为 note，命中评论缓存记为 comments
         """
-        # 优先使用传入的cookie，否则使用默认的
+        # 优先使用传入的Cookie，否则使用默认的
         cookies_to_use = cookies_str or self.cookies_str
         try:
-            # 获取笔记基本信息
+            # 获取评论与获取笔记基本信息同时进行
+            # 共享线程池的线程早于任务创建，标记为本任务的工作才会被性能分析采样
+            comments_future = self.comment_executor.submit(
+                bind_task(self.fetch_first_comments),
+                note_url,
+                cookies_to_use,
+                pacer,
+                cache_hits,
+            )
+            note_id = urllib.parse.urlparse(note_url).path.split("/")[-1]
+            # 命中缓存的笔记不需要等待请求间隔
+            paced = pacer and not self.data_spider.note_cache.has(note_id, "note")
+            if paced:
+                pacer.wait()
             success, msg, note_info = self.data_spider.spider_note(
                 note_url, cookies_to_use
             )
+            if paced:
+                pacer.feedback(success, msg)
+            if msg == NOTE_CACHE_HIT_MSG and cache_hits is not None:
+                cache_hits.append("note")
+            comments = comments_future.result()
             if not success:
                 logger.error(f"获取笔记信息失败: {msg}")
                 return None
 
-            # 获取评论 - 使用简化方法
-            logger.info(f"开始获取笔记评论: {note_url}")
-            comments = []
-            try:
-                # 解析note_id和xsec_token
-                import urllib.parse
-
-                urlParse = urllib.parse.urlparse(note_url)
-                note_id = urlParse.path.split("/")[-1]
-
-                xsec_token = ""
-                if urlParse.query:
-                    kvs = urlParse.query.split("&")
-                    for kv in kvs:
-                        if "=" in kv and kv.startswith("xsec_token="):
-                            xsec_token = kv.split("=", 1)[1]
-                            break
-
-                logger.info(
-                    f"解析得到 note_id: {note_id}, xsec_token: {xsec_token[:20]}..."
-                )
-
-                # 获取第一页评论进行测试
-                success, msg, res_json = self.data_spider.xhs_apis.get_note_out_comment(
-                    note_id, "", xsec_token, cookies_to_use
-                )
-
-                if (
-                    success
-                    and res_json
-                    and "data" in res_json
-                    and "comments" in res_json["data"]
-                ):
-                    comments = res_json["data"]["comments"]
-                    logger.info(f"成功获取评论数量: {len(comments)}")
-                else:
-                    logger.warning(f"获取评论失败: {msg}")
-
-            except Exception as e:
-                logger.error(f"获取评论异常: {e}")
-                comments = []
-
             # 提取图片链接
             pictures = []
             if "image_list" in note_info:
@@ -101,11 +284,11 @@ class WebSpider:
 
                     if img_url:
                         pictures.append(img_url)
-                        logger.info(f"提取到图片URL: {img_url}")
+                        picture_log.info("提取到图片URL: {}", img_url)
 
             # 提取评论内容
             comment_texts = []
-            logger.info(f"处理评论数量: {len(comments)}")
+            note_log.info("处理评论数量: {}", len(comments))
 
             for comment in comments:
                 if isinstance(comment, dict):
@@ -117,7 +300,7 @@ class WebSpider:
                             "[偷笑R]", "😏"
                         )
                         comment_texts.append(clean_content)
-                        logger.info(f"提取评论: {clean_content[:50]}...")
+                        comment_log.info("提取评论: {}...", clean_content[:50])
 
                     # 提取子评论
                     sub_comments = comment.get("sub_comments", [])
@@ -131,11 +314,13 @@ class WebSpider:
                                 comment_texts.append(
                                     f"↳ {clean_sub_content}"
                                 )  # 添加缩进标识子评论
-                                logger.info(f"提取子评论: {clean_sub_content[:50]}...")
+                                sub_comment_log.info(
+                                    "提取子评论: {}...", clean_sub_content[:50]
+                                )
                 elif isinstance(comment, str):
                     comment_texts.append(comment)
 
-            logger.info(f"提取到评论文本数量: {len(comment_texts)}")
+            note_log.info("提取到评论文本数量: {}", len(comment_texts))
 
             return {
                 "link": note_url,
@@ -149,14 +334,220 @@ class WebSpider:
             logger.error(f"提取笔记数据失败: {e}")
             return None
 
-    def search_and_collect(self, keyword, num_notes, task_id, cookie=None):
+    def collect_notes(self, task_id, notes, cookies_str, concurrency=None):
+        """
+        并发提取一批笔记的数据，并推送每条笔记的结果和任务进度
+        :param task_id: 任务ID
+        :param notes: 搜索得到的笔记列表，带 keywords 字段时会写入结果
+        :param cookies_str: Cookie字符串
+        :param concurrency: 同时处理的笔记数量，为None时使用 WEB_NOTE_CONCURRENCY
+        返回 按原顺序排列的笔记数据, 缓存命中记录
+        """
+        total_notes = len(notes)
+        results = [None] * total_notes
+        cache_hits = []
+        finished = 0
+        progress_lock = Lock()
+        # 所有并发请求共享一个自适应节奏，替代固定的 sleep
+        pacer = AdaptivePacer(
+            initial_interval=float(os.getenv("WEB_REQUEST_INTERVAL", 1.0))
+        )
+
+        def process(i, note):
+            nonlocal finished
+            try:
+                note_url = f"https://www.xiaohongshu.com/explore/{note['id']}?xsec_token={note['xsec_token']}"
+
+                note_log.info("处理第 {}/{} 个笔记...", i + 1, total_notes)
+                results[i] = self.extract_note_data(
+                    note_url, cookies_str, pacer, cache_hits
+                )
+                if results[i]:
+                    if "keywords" in note:
+                        results[i]["keywords"] = note["keywords"]
+                    self.publish_event(
+                        task_id, "note", {"index": i, "note": results[i]}
+                    )
+
+            except Exception as e:
+                logger.error(f"处理第 {i+1} 个笔记时出错: {e}")
+            finally:
+                # 更新进度
+                with progress_lock:
+                    finished += 1
+                    progress = int(finished / total_notes * 100)
+                    self.tasks[task_id]["progress"] = progress
+                    self.publish_event(
+                        task_id,
+                        "progress",
+                        {
+                            "progress": progress,
+                            "finished": finished,
+                            "total": total_notes,
+                        },
+                    )
+
+        workers = max(1, concurrency or self.note_concurrency)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i, note in enumerate(notes):
+                executor.submit(bind_task(process), i, note)
+
+        collected_data = [note_data for note_data in results if note_data]
+        return collected_data, cache_hits
+
+    def save_result(self, task_id, task_name, collected_data, cache_hits, **extra):
+        """
+        保存任务结果并标记任务完成
+        :param extra: 需要额外写入结果文件的字段
+        """
+        result_data = {
+            "task": task_name,
+            "data": collected_data,
+            "id": task_id,
+            "created_at": datetime.now().isoformat(),
+            "total_notes": len(collected_data),
+            "cache_hits": {
+                "notes": cache_hits.count("note"),
+                "comments": cache_hits.count("comments"),
+            },
+            **extra,
+        }
+
+        stage_timer = self.data_spider.stage_timer
+        with stage_timer.stage("persist"):
+            result_file = self.result_store.write(task_id, result_data)
+
+        self.tasks[task_id]["status"] = "completed"
+        self.tasks[task_id]["progress"] = 100
+        self.tasks[task_id]["result_file"] = result_file
+        self.publish_event(
+            task_id,
+            "completed",
+            {
+                "progress": 100,
+                "total_notes": len(collected_data),
+                "result_url": f"/api/data/{task_id}",
+                "view_url": f"/view/{task_id}",
+            },
+        )
+
+        logger.info(f"任务 {task_id} 完成，收集了 {len(collected_data)} 条数据")
+        stage_timer.summary()
+
+    def batch_search_and_collect(
+        self, keywords, num_notes, task_id, cookie=None, concurrency=None
+    ):
+        """
+        多关键词批量搜索并收集数据的后台任务
+        并发搜索所有关键词，按 note_id 去重后每篇笔记只获取一次，并记录每篇笔记匹配的关键词
+        :param keywords: 关键词列表
+        :param num_notes: 每个关键词搜索的笔记数量
+        """
+        try:
+            logger.info(f"开始批量搜索任务 {task_id}: {keywords}")
+            self.tasks[task_id]["status"] = "running"
+            self.tasks[task_id]["progress"] = 0
+            self.publish_event(task_id, "status", {"status": "running", "progress": 0})
+
+            cookies_str = cookie or self.cookies_str
+            pacer = AdaptivePacer(
+                initial_interval=float(os.getenv("WEB_REQUEST_INTERVAL", 1.0))
+            )
+
+            def search(keyword):
+                pacer.wait()
+                success, msg, notes = self.data_spider.xhs_apis.search_some_note(
+                    keyword,
+                    num_notes,
+                    cookies_str,
+                    sort_type_choice=2,  # 按最多点赞排序
+                    note_type=0,  # 不限类型
+                    proxies=None,
+                )
+                pacer.feedback(success, msg)
+                return success, msg, notes
+
+            workers = max(1, min(len(keywords), self.note_concurrency))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                searches = list(executor.map(bind_task(search), keywords))
+
+            # 按关键词顺序合并，相同 note_id 只保留一份
+            merged = {}
+            keyword_stats = {}
+            failed_keywords = {}
+            for keyword, (success, msg, notes) in zip(keywords, searches):
+                if not success:
+                    logger.warning(f"关键词 {keyword} 搜索失败: {msg}")
+                    failed_keywords[keyword] = str(msg)
+                    continue
+                notes = [note for note in notes if note["model_type"] == "note"]
+                notes = notes[:num_notes]
+                keyword_stats[keyword] = len(notes)
+                for note in notes:
+                    if note["id"] not in merged:
+                        merged[note["id"]] = dict(note, keywords=[])
+                    merged[note["id"]]["keywords"].append(keyword)
+
+            if not keyword_stats:
+                error = "; ".join(f"{k}: {v}" for k, v in failed_keywords.items())
+                self.tasks[task_id]["status"] = "failed"
+                self.tasks[task_id]["error"] = error
+                self.publish_event(task_id, "failed", {"error": error})
+                return
+
+            unique_notes = list(merged.values())
+            logger.info(
+                f"批量搜索共找到 {sum(keyword_stats.values())} 条笔记，去重后 {len(unique_notes)} 条"
+            )
+
+            collected_data, cache_hits = self.collect_notes(
+                task_id, unique_notes, cookies_str, concurrency
+            )
+            self.save_result(
+                task_id,
+                ", ".join(keywords),
+                collected_data,
+                cache_hits,
+                keywords=keywords,
+                keyword_stats=keyword_stats,
+                failed_keywords=failed_keywords,
+            )
+
+        except Exception as e:
+            logger.error(f"任务 {task_id} 执行失败: {e}")
+            self.tasks[task_id]["status"] = "failed"
+            self.tasks[task_id]["error"] = str(e)
+            self.publish_event(task_id, "failed", {"error": str(e)})
+
+    def task_profiler(self, task_id):
+        """
+        任务带 profile 标记时返回性能分析器，结果保存在 results_dir/profile/<task_id>.*
+        """
+        if not self.tasks[task_id].get("profile"):
+            return contextlib.nullcontext()
+        return CrawlProfiler.from_env(
+            os.path.join(self.results_dir, "profile"), str(task_id)
+        )
+
+    def search_and_collect(
+        self, keyword, num_notes, task_id, cookie=None, concurrency=None
+    ):
         """
         搜索并收集数据的后台任务
+        :param concurrency: 同时处理的笔记数量，为None时使用 WEB_NOTE_CONCURRENCY
         """
+        profiler = self.task_profiler(task_id)
+        with profiler:
+            self._search_and_collect(keyword, num_notes, task_id, cookie, concurrency)
+        if isinstance(profiler, CrawlProfiler):
+            self.tasks[task_id]["profile_files"] = profiler.files
+
+    def _search_and_collect(self, keyword, num_notes, task_id, cookie, concurrency):
         try:
             logger.info(f"开始搜索任务 {task_id}: {keyword}")
             self.tasks[task_id]["status"] = "running"
             self.tasks[task_id]["progress"] = 0
+            self.publish_event(task_id, "status", {"status": "running", "progress": 0})
 
             # 使用传入的Cookie或默认Cookie
             cookies_str = cookie or self.cookies_str
@@ -174,62 +565,70 @@ class WebSpider:
             if not success:
                 self.tasks[task_id]["status"] = "failed"
                 self.tasks[task_id]["error"] = msg
+                self.publish_event(task_id, "failed", {"error": msg})
                 return
 
             # 过滤笔记类型
             notes = list(filter(lambda x: x["model_type"] == "note", notes))
             logger.info(f"找到 {len(notes)} 条相关笔记")
 
-            collected_data = []
-            total_notes = min(len(notes), num_notes)
-
-            for i, note in enumerate(notes[:num_notes]):
-                try:
-                    note_url = f"https://www.xiaohongshu.com/explore/{note['id']}?xsec_token={note['xsec_token']}"
-
-                    logger.info(f"处理第 {i+1}/{total_notes} 个笔记...")
-                    note_data = self.extract_note_data(note_url, cookies_str)
-
-                    if note_data:
-                        collected_data.append(note_data)
-
-                    # 更新进度
-                    progress = int((i + 1) / total_notes * 100)
-                    self.tasks[task_id]["progress"] = progress
-
-                    # 添加延时避免请求过快
-                    time.sleep(1)
-
-                except Exception as e:
-                    logger.error(f"处理第 {i+1} 个笔记时出错: {e}")
-                    continue
-
-            # 保存结果
-            result_data = {
-                "task": keyword,
-                "data": collected_data,
-                "id": task_id,
-                "created_at": datetime.now().isoformat(),
-                "total_notes": len(collected_data),
-            }
-
-            result_file = os.path.join(self.results_dir, f"{task_id}.json")
-            with open(result_file, "w", encoding="utf-8") as f:
-                json.dump(result_data, f, ensure_ascii=False, indent=2)
-
-            self.tasks[task_id]["status"] = "completed"
-            self.tasks[task_id]["progress"] = 100
-            self.tasks[task_id]["result_file"] = result_file
-
-            logger.info(f"任务 {task_id} 完成，收集了 {len(collected_data)} 条数据")
+            collected_data, cache_hits = self.collect_notes(
+                task_id, notes[:num_notes], cookies_str, concurrency
+            )
+            self.save_result(task_id, keyword, collected_data, cache_hits)
 
         except Exception as e:
             logger.error(f"任务 {task_id} 执行失败: {e}")
             self.tasks[task_id]["status"] = "failed"
             self.tasks[task_id]["error"] = str(e)
+            self.publish_event(task_id, "failed", {"error": str(e)})
+
+
+def register_metrics(spider):
+    """
+    注册Web服务的瞬时指标，采集时才读取任务、队列和图片缓存的状态
+    """
+
+    def task_counts():
+        counts = {}
+        for _, task_info in spider.tasks.items():
+            status = (task_info.get("status") or "unknown",)
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    metrics_registry.gauge("web_tasks", "各状态的任务数量", task_counts, ("status",))
+    metrics_registry.gauge(
+        "web_queue_pending",
+        "排队等待执行的任务数",
+        lambda: spider.scheduler.stats()["pending"],
+    )
+    metrics_registry.gauge(
+        "web_queue_running",
+        "正在执行的任务数",
+        lambda: spider.scheduler.stats()["running"],
+    )
+
+    def image_hit_ratio():
+        # 图片代理的请求计数已汇总所有Web进程
+        requests = metrics_registry.values("web_image_cache_requests_total")
+        hits = requests.get(("hit",), 0)
+        total = hits + requests.get(("miss",), 0)
+        return round(hits / total, 4) if total else 0.0
+
+    metrics_registry.gauge(
+        "web_image_cache_hit_ratio",
+        "图片代理缓存命中率(所有Web进程合计)",
+        image_hit_ratio,
+    )
 
 
 web_spider = WebSpider()
+register_metrics(web_spider)
+
+# 图片代理复用的上游连接池
+image_session = requests.Session()
+image_session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+image_session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
 
 
 @app.route("/")
@@ -245,6 +644,9 @@ def start_search():
     keyword = data.get("keyword", "").strip()
     num_notes = data.get("num_notes", 10)
     cookie = data.get("cookie", "").strip()
+    priority = data.get("priority", 0)
+    # 为 true 时对任务做性能分析，结果保存在 web_data/profile
+    profile = data.get("profile", False)
 
     if not keyword:
         return jsonify({"error": "关键词不能为空"}), 400
@@ -255,6 +657,12 @@ def start_search():
     if not cookie:
         return jsonify({"error": "登录凭证不能为空"}), 400
 
+    if not isinstance(priority, int):
+        return jsonify({"error": "优先级必须为整数"}), 400
+
+    if not isinstance(profile, bool):
+        return jsonify({"error": "profile 必须为布尔值"}), 400
+
     # 生成任务ID
     task_id = int(time.time() * 1000)  # 使用时间戳作为ID
 
@@ -265,18 +673,115 @@ def start_search():
         "cookie": cookie,
         "status": "pending",
         "progress": 0,
+        "priority": priority,
+        "profile": profile,
+        "created_at": datetime.now().isoformat(),
+    }
+
+    # 先发布排队事件再入队，避免工作线程的 running 事件先于 pending 到达
+    web_spider.publish_event(
+        task_id,
+        "status",
+        {
+            "status": "pending",
+            "queue_position": web_spider.scheduler.expected_position(priority),
+        },
+    )
+
+    # 加入任务队列，由固定大小的工作池执行
+    queue_position = web_spider.scheduler.submit(
+        task_id,
+        web_spider.search_and_collect,
+        args=(keyword, num_notes, task_id, cookie),
+        key=web_spider.cookie_key(cookie),
+        priority=priority,
+    )
+
+    return jsonify(
+        {
+            "task_id": task_id,
+            "message": "搜索任务已启动",
+            "status": "pending",
+            "queue_position": queue_position,
+        }
+    )
+
+
+@app.route("/api/search/batch", methods=["POST"])
+def start_batch_search():
+    """开始多关键词批量搜索任务"""
+    data = request.get_json()
+    keywords = data.get("keywords", [])
+    if isinstance(keywords, str):
+        keywords = keywords.splitlines()
+    num_notes = data.get("num_notes", 10)
+    cookie = data.get("cookie", "").strip()
+    priority = data.get("priority", 0)
+
+    if not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords):
+        return jsonify({"error": "关键词必须为字符串列表"}), 400
+
+    # 去掉空白和重复的关键词，保持原顺序
+    keywords = list(dict.fromkeys(k.strip() for k in keywords if k and k.strip()))
+    max_keywords = int(os.getenv("WEB_BATCH_MAX_KEYWORDS", 20))
+
+    if not keywords:
+        return jsonify({"error": "关键词不能为空"}), 400
+
+    if len(keywords) > max_keywords:
+        return jsonify({"error": f"关键词数量不能超过{max_keywords}个"}), 400
+
+    if num_notes <= 0 or num_notes > 100:
+        return jsonify({"error": "笔记数量必须在1-100之间"}), 400
+
+    if not cookie:
+        return jsonify({"error": "登录凭证不能为空"}), 400
+
+    if not isinstance(priority, int):
+        return jsonify({"error": "优先级必须为整数"}), 400
+
+    # 生成任务ID
+    task_id = int(time.time() * 1000)  # 使用时间戳作为ID
+
+    # 初始化任务状态
+    web_spider.tasks[task_id] = {
+        "keyword": ", ".join(keywords),
+        "keywords": keywords,
+        "num_notes": num_notes,
+        "cookie": cookie,
+        "status": "pending",
+        "progress": 0,
+        "priority": priority,
         "created_at": datetime.now().isoformat(),
     }
 
-    # 启动后台任务
-    thread = Thread(
-        target=web_spider.search_and_collect, args=(keyword, num_notes, task_id, cookie)
+    # 先发布排队事件再入队，避免工作线程的 running 事件先于 pending 到达
+    web_spider.publish_event(
+        task_id,
+        "status",
+        {
+            "status": "pending",
+            "queue_position": web_spider.scheduler.expected_position(priority),
+        },
+    )
+
+    # 加入任务队列，由固定大小的工作池执行
+    queue_position = web_spider.scheduler.submit(
+        task_id,
+        web_spider.batch_search_and_collect,
+        args=(keywords, num_notes, task_id, cookie),
+        key=web_spider.cookie_key(cookie),
+        priority=priority,
     )
-    thread.daemon = True
-    thread.start()
 
     return jsonify(
-        {"task_id": task_id, "message": "搜索任务已启动", "status": "pending"}
+        {
+            "task_id": task_id,
+            "message": "批量搜索任务已启动",
+            "status": "pending",
+            "keywords": keywords,
+            "queue_position": queue_position,
+        }
     )
 
 
@@ -319,18 +824,19 @@ def test_cookie():
             400,
         )
 
+    xhs_apis = web_spider.data_spider.xhs_apis
     try:
-        # 使用Cookie测试一个简单的API调用
-        success, msg, result = web_spider.data_spider.xhs_apis.get_homefeed_all_channel(
-            cookie
-        )
+        # 使用Cookie测试一个简单的API调用，不读缓存，登录过期时立即发现
+        with xhs_apis.response_cache.control(refresh=True):
+            success, msg, result = xhs_apis.get_homefeed_all_channel(cookie)
 
         if success:
             # 尝试获取用户信息来进一步验证
             try:
-                user_success, user_msg, user_info = (
-                    web_spider.data_spider.xhs_apis.get_user_self_info(cookie)
-                )
+                with xhs_apis.response_cache.control(refresh=True):
+                    user_success, user_msg, user_info = xhs_apis.get_user_self_info(
+                        cookie
+                    )
                 if user_success and user_info and "data" in user_info:
                     user_name = user_info["data"].get("nickname", "未知用户")
                     return jsonify(
@@ -395,22 +901,106 @@ def get_task_status(task_id):
             "num_notes": task["num_notes"],
             "created_at": task["created_at"],
             "error": task.get("error", None),
+            "queue_position": web_spider.scheduler.position(task_id),
         }
     )
 
 
+@app.route("/api/task/<int:task_id>/events")
+def task_events(task_id):
+    """以Server-Sent Events推送任务进度、单条笔记结果和最终结果地址"""
+    if task_id not in web_spider.tasks:
+        return jsonify({"error": "任务不存在"}), 404
+
+    # 断线重连时从浏览器记录的最后一个事件之后继续推送
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    start = last_event_id + 1 if last_event_id is not None else 0
+
+    def generate():
+        index = start
+        while True:
+            index, events = web_spider.wait_events(task_id, index, timeout=15)
+            if not events:
+                # 心跳，防止代理断开空闲连接
+                yield ": keep-alive\n\n"
+                continue
+            for event, data in events:
+                payload = json.dumps(data, ensure_ascii=False)
+                yield f"id: {index}\nevent: {event}\ndata: {payload}\n\n"
+                index += 1
+                if event in ("completed", "failed"):
+                    return
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/api/data/<int:task_id>")
 def get_data(task_id):
-    """获取任务结果数据"""
-    result_file = os.path.join(web_spider.results_dir, f"{task_id}.json")
-
-    if not os.path.exists(result_file):
+    """
+    获取任务结果数据
+    支持参数: offset/limit 分页, fields 只返回指定字段, exclude 去掉指定字段(如 comments), stream=1 流式返回
+    """
+    store = web_spider.result_store
+    if not store.exists(task_id):
         return jsonify({"error": "数据不存在"}), 404
 
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", type=int)
+    fields = [f for f in request.args.get("fields", "").split(",") if f]
+    exclude = [f for f in request.args.get("exclude", "").split(",") if f]
+    stream = request.args.get("stream", "0") in ("1", "true")
+    if offset < 0 or (limit is not None and limit < 0):
+        return jsonify({"error": "offset和limit不能为负数"}), 400
+
     try:
-        with open(result_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return jsonify(data)
+        # 不带任何参数时保持原来的完整返回
+        if (
+            not stream
+            and not fields
+            and not exclude
+            and "offset" not in request.args
+            and limit is None
+        ):
+            return jsonify(store.load(task_id))
+
+        index = store.index(task_id)
+        total = len(index["notes"])
+        page_meta = dict(index["meta"], offset=offset, limit=limit, total=total)
+
+        if not stream:
+            notes = [
+                project_note(note, fields, exclude)
+                for note in store.iter_notes(task_id, offset, limit)
+            ]
+            return jsonify(dict(page_meta, data=notes))
+
+        def generate():
+            head = json.dumps(page_meta, ensure_ascii=False)
+            yield head[:-1] + (', "data": [' if page_meta else '"data": [')
+            if fields or exclude:
+                raws = (
+                    json.dumps(project_note(note, fields, exclude), ensure_ascii=False)
+                    for note in store.iter_notes(task_id, offset, limit)
+                )
+            else:
+                # 不需要筛选字段时直接转发文件中的原始字节
+                raws = (
+                    raw.decode("utf-8")
+                    for raw in store.iter_raw_notes(task_id, offset, limit)
+                )
+            for i, raw in enumerate(raws):
+                yield ("," if i else "") + raw
+            yield "]}"
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="application/json",
+            headers={"Content-Type": "application/json; charset=utf-8"},
+        )
     except Exception as e:
         return jsonify({"error": f"读取数据失败: {str(e)}"}), 500
 
@@ -447,133 +1037,166 @@ def test_image():
     return render_template("test_image.html")
 
 
-@app.route("/api/export/comments/<int:task_id>")
-def export_comments(task_id):
-    """导出评论数据"""
-    note_index = request.args.get("note_index", type=int)
-    export_format = request.args.get("format", "json")  # json, csv, txt
+def iter_export_comments(task_ids, note_index=None):
+    """
+    逐条生成需要导出的评论，多个任务时附带任务ID
+    :param task_ids: 任务ID列表
+    :param note_index: 只导出指定索引的笔记，超出范围时不导出
+    """
+    store = web_spider.result_store
+    for task_id in task_ids:
+        if note_index is not None:
+            if not 0 <= note_index < store.note_count(task_id):
+                continue
+            notes = enumerate(store.iter_notes(task_id, note_index, 1), note_index)
+        else:
+            notes = enumerate(store.iter_notes(task_id))
+        for idx, note in notes:
+            for comment in note["comments"]:
+                item = {
+                    "note_title": note["title"],
+                    "note_link": note["link"],
+                    "comment": comment,
+                    "note_index": idx,
+                }
+                if len(task_ids) > 1:
+                    item["task_id"] = task_id
+                yield item
+
+
+def buffered(chunks, size=64 * 1024):
+    """
+    合并小块输出，减少响应写入次数
+    """
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def generate_json_export(task_name, export_time, total, items):
+    head = json.dumps(
+        {"task": task_name, "export_time": export_time, "total_comments": total},
+        ensure_ascii=False,
+        indent=2,
+    )
+    # 与 json.dumps(indent=2) 完整输出逐字节一致
+    yield head[: -len("\n}")] + ',\n  "comments": ['
+    first = True
+    for item in items:
+        body = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+        yield ("\n    " if first else ",\n    ") + body
+        first = False
+    yield "]\n}" if first else "\n  ]\n}"
+
+
+def generate_csv_export(items):
+    import csv
+    import io
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+
+    def flush():
+        value = output.getvalue()
+        output.seek(0)
+        output.truncate()
+        return value
+
+    # 写入表头
+    writer.writerow(["笔记标题", "笔记链接", "评论内容", "笔记索引"])
+    yield flush()
+
+    # 写入数据
+    for item in items:
+        writer.writerow(
+            [item["note_title"], item["note_link"], item["comment"], item["note_index"]]
+        )
+        yield flush()
 
-    result_file = os.path.join(web_spider.results_dir, f"{task_id}.json")
 
-    if not os.path.exists(result_file):
-        return jsonify({"error": "数据不存在"}), 404
+def generate_txt_export(task_name, export_time, total, items):
+    yield f"评论导出 - {task_name}"
+    yield f"\n导出时间: {export_time}"
+    yield f"\n评论总数: {total}"
+    yield "\n" + "=" * 50
+    yield "\n"
 
-    try:
-        with open(result_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+    current_note = None
+    for item in items:
+        if current_note != item["note_title"]:
+            current_note = item["note_title"]
+            yield f"\n【{current_note}】"
+            yield f"\n链接: {item['note_link']}"
+            yield "\n" + "-" * 30
 
-        # 收集评论数据
-        comments_data = []
+        yield f"\n• {item['comment']}"
+        yield "\n"
 
-        if note_index is not None:
-            # 导出特定笔记的评论
-            if 0 <= note_index < len(data["data"]):
-                note = data["data"][note_index]
-                for comment in note["comments"]:
-                    comments_data.append(
-                        {
-                            "note_title": note["title"],
-                            "note_link": note["link"],
-                            "comment": comment,
-                            "note_index": note_index,
-                        }
-                    )
-        else:
-            # 导出所有评论
-            for idx, note in enumerate(data["data"]):
-                for comment in note["comments"]:
-                    comments_data.append(
-                        {
-                            "note_title": note["title"],
-                            "note_link": note["link"],
-                            "comment": comment,
-                            "note_index": idx,
-                        }
-                    )
 
-        # 根据格式返回数据
-        if export_format == "json":
-            response_data = {
-                "task": data["task"],
-                "export_time": datetime.now().isoformat(),
-                "total_comments": len(comments_data),
-                "comments": comments_data,
-            }
+@app.route("/api/export/comments")
+@app.route("/api/export/comments/<int:task_id>")
+def export_comments(task_id=None):
+    """
+    导出评论数据，流式返回
+    多个任务一起导出时使用 /api/export/comments?task_ids=1,2
+    """
+    note_index = request.args.get("note_index", type=int)
+    export_format = request.args.get("format", "json")  # json, csv, txt
 
-            response = app.response_class(
-                json.dumps(response_data, ensure_ascii=False, indent=2),
-                mimetype="application/json",
-                headers={
-                    "Content-Disposition": f"attachment; filename=comments_{task_id}.json",
-                    "Content-Type": "application/json; charset=utf-8",
-                },
-            )
-            return response
+    if task_id is not None:
+        task_ids = [task_id]
+    else:
+        try:
+            task_ids = [
+                int(i) for i in request.args.get("task_ids", "").split(",") if i
+            ]
+        except ValueError:
+            return jsonify({"error": "任务ID格式错误"}), 400
+        if not task_ids:
+            return jsonify({"error": "任务ID不能为空"}), 400
+
+    store = web_spider.result_store
+    if not all(store.exists(i) for i in task_ids):
+        return jsonify({"error": "数据不存在"}), 404
 
-        elif export_format == "csv":
-            import csv
-            import io
-
-            output = io.StringIO()
-            writer = csv.writer(output)
-
-            # 写入表头
-            writer.writerow(["笔记标题", "笔记链接", "评论内容", "笔记索引"])
-
-            # 写入数据
-            for item in comments_data:
-                writer.writerow(
-                    [
-                        item["note_title"],
-                        item["note_link"],
-                        item["comment"],
-                        item["note_index"],
-                    ]
-                )
+    if export_format not in ("json", "csv", "txt"):
+        return jsonify({"error": "不支持的导出格式"}), 400
 
-            response = app.response_class(
-                output.getvalue(),
-                mimetype="text/csv",
-                headers={
-                    "Content-Disposition": f"attachment; filename=comments_{task_id}.csv",
-                    "Content-Type": "text/csv; charset=utf-8",
-                },
-            )
-            return response
+    try:
+        task_name = ", ".join(store.index(i)["meta"]["task"] for i in task_ids)
+        # 评论总数来自索引，正文在响应时逐条生成
+        total = sum(store.comment_count(i, note_index) for i in task_ids)
+        items = iter_export_comments(task_ids, note_index)
+        file_id = "_".join(str(i) for i in task_ids)
 
-        elif export_format == "txt":
-            output_lines = []
-            output_lines.append(f"评论导出 - {data['task']}")
-            output_lines.append(
-                f"导出时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            )
-            output_lines.append(f"评论总数: {len(comments_data)}")
-            output_lines.append("=" * 50)
-            output_lines.append("")
-
-            current_note = None
-            for item in comments_data:
-                if current_note != item["note_title"]:
-                    current_note = item["note_title"]
-                    output_lines.append(f"【{current_note}】")
-                    output_lines.append(f"链接: {item['note_link']}")
-                    output_lines.append("-" * 30)
-
-                output_lines.append(f"• {item['comment']}")
-                output_lines.append("")
-
-            response = app.response_class(
-                "\n".join(output_lines),
-                mimetype="text/plain",
-                headers={
-                    "Content-Disposition": f"attachment; filename=comments_{task_id}.txt",
-                    "Content-Type": "text/plain; charset=utf-8",
-                },
+        if export_format == "json":
+            body = generate_json_export(
+                task_name, datetime.now().isoformat(), total, items
             )
-            return response
-
+            mimetype = "application/json"
+        elif export_format == "csv":
+            body = generate_csv_export(items)
+            mimetype = "text/csv"
         else:
-            return jsonify({"error": "不支持的导出格式"}), 400
+            body = generate_txt_export(
+                task_name, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), total, items
+            )
+            mimetype = "text/plain"
+
+        return app.response_class(
+            stream_with_context(buffered(body)),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=comments_{file_id}.{export_format}",
+                "Content-Type": f"{mimetype}; charset=utf-8",
+            },
+        )
 
     except Exception as e:
         logger.error(f"导出评论失败: {e}")
@@ -582,14 +1205,36 @@ def export_comments(task_id):
 
 @app.route("/proxy_image")
 def proxy_image():
-    """代理图片请求，解决403问题"""
+    """代理图片请求，解决403问题，图片缓存在本地磁盘"""
     image_url = request.args.get("url")
     if not image_url:
         logger.error("代理图片请求缺少URL参数")
         return "Missing URL parameter", 400
 
+    started = time.perf_counter()
+    image_cache = web_spider.image_cache
+    cache_headers = {
+        "Cache-Control": "public, max-age=3600",  # 缓存1小时
+        "Access-Control-Allow-Origin": "*",
+    }
+
+    cached = image_cache.get(image_url)
+    if cached:
+        data_path, meta = cached
+        # ETag 是缓存内容的摘要，浏览器已有相同内容时直接返回304
+        etag = meta["etag"]
+        if request.if_none_match.contains(etag):
+            image_cache.record(True, time.perf_counter() - started)
+            return Response(status=304, headers=dict(cache_headers, ETag=f'"{etag}"'))
+        image_cache.record(True, time.perf_counter() - started, meta["size"])
+        response = send_file(
+            data_path, mimetype=meta["content_type"], etag=etag, max_age=3600
+        )
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        return response
+
     try:
-        logger.info(f"代理图片请求: {image_url}")
+        image_log.info("代理图片请求: {}", image_url)
 
         # 添加小红书的请求头来绕过防盗链
         headers = {
@@ -599,26 +1244,42 @@ def proxy_image():
             "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
         }
 
-        # 添加超时设置
-        response = requests.get(image_url, headers=headers, timeout=10, stream=True)
+        # 复用连接池，添加超时设置
+        response = image_session.get(
+            image_url, headers=headers, timeout=10, stream=True
+        )
 
-        logger.info(f"图片请求响应状态: {response.status_code}")
+        image_log.info("图片请求响应状态: {}", response.status_code)
 
         if response.status_code == 200:
             # 获取内容类型
             content_type = response.headers.get("content-type", "image/jpeg")
+            image_cache.record(
+                False,
+                time.perf_counter() - started,
+                int(response.headers.get("content-length", 0) or 0),
+            )
 
-            # 返回图片数据
-            return app.response_class(
-                response.content,
+            def relay():
+                # 客户端中途断开时生成器被关闭，同时关闭上游响应，归还连接池
+                try:
+                    yield from image_cache.stream_into(
+                        image_url,
+                        content_type,
+                        response.iter_content(chunk_size=64 * 1024),
+                    )
+                finally:
+                    response.close()
+
+            # 边下载边返回图片数据，同时写入缓存，内容摘要在写完后才知道，这次响应不带 ETag
+            return Response(
+                stream_with_context(relay()),
                 mimetype=content_type,
-                headers={
-                    "Cache-Control": "public, max-age=3600",  # 缓存1小时
-                    "Access-Control-Allow-Origin": "*",
-                },
+                headers=cache_headers,
             )
         else:
             logger.warning(f"图片请求失败，状态码: {response.status_code}")
+            response.close()
             return (
                 f"Failed to fetch image: {response.status_code}",
                 response.status_code,
@@ -635,6 +1296,18 @@ def proxy_image():
         return f"Error: {str(e)}", 500
 
 
+@app.route("/metrics")
+def metrics():
+    """Prometheus 格式的运行指标"""
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/image_cache/stats")
+def image_cache_stats():
+    """图片缓存命中率和耗时统计"""
+    return jsonify(web_spider.image_cache.stats())
+
+
 if __name__ == "__main__":
     print("🚀 小红书爬虫Web服务启动...")
     print("📱 访问 http://localhost:8888 开始使用")
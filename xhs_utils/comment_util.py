@@ -0,0 +1,303 @@
+import csv
+import json
+import os
+import threading
+import time
+import urllib.parse
+import openpyxl
+from loguru import logger
+from xhs_utils.data_util import XLSX_HEADERS, handle_comment_info, norm_text
+from xhs_utils.error_util import error_msg
+
+
+class CommentBudget:
+    """
+    评论爬取的预算，评论数、页数、时间任意一项用完即停止
+    同一个对象可以在多篇笔记之间共享，作为全局预算
+    stopped 记录第一次被拒绝的预算类型(comments / pages / time)，预算刚好用完但没有再申请时为 None
+    :param max_comments: 最多保存的评论数(一级和二级评论合计)，None 为不限
+    :param max_pages: 最多请求的评论页数(一级和二级评论合计)，None 为不限
+    :param max_seconds: 最长爬取时间(秒)，从第一次使用开始计时，None 为不限
+    """
+
+    def __init__(self, max_comments=None, max_pages=None, max_seconds=None):
+        self.max_comments = max_comments
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.comments = 0
+        self.pages = 0
+        self.stopped = None
+        self._deadline = None
+        self._lock = threading.Lock()
+
+    def _exhausted(self):
+        if self.max_seconds is not None:
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.max_seconds
+            elif time.monotonic() >= self._deadline:
+                return "time"
+        if self.max_comments is not None and self.comments >= self.max_comments:
+            return "comments"
+        if self.max_pages is not None and self.pages >= self.max_pages:
+            return "pages"
+        return None
+
+    def exhausted(self):
+        """
+        返回用完的预算类型(comments / pages / time)，都没有用完时返回 None
+        """
+        with self._lock:
+            return self._exhausted()
+
+    def stop(self, reason):
+        """
+        记录停止的原因，只保留第一次
+        """
+        with self._lock:
+            self.stopped = self.stopped or reason
+
+    def take_page(self) -> bool:
+        """
+        申请请求一页评论，预算用完时返回 False
+        """
+        with self._lock:
+            reason = self._exhausted()
+            if reason:
+                self.stopped = self.stopped or reason
+                return False
+            self.pages += 1
+            return True
+
+    def take_comment(self) -> bool:
+        """
+        申请保存一条评论，预算用完时返回 False
+        """
+        with self._lock:
+            if self.max_comments is not None and self.comments >= self.max_comments:
+                self.stopped = self.stopped or "comments"
+                return False
+            self.comments += 1
+            return True
+
+    def give_back(self, pages=0, comments=0):
+        """
+        归还已申请但没有使用的预算
+        """
+        with self._lock:
+            self.pages -= pages
+            self.comments -= comments
+
+
+class JsonlCommentSink:
+    """
+    逐行写入 handle_comment_info 整理后的评论，每行一个JSON
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, row: dict):
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+class CsvCommentSink:
+    """
+    逐行写入CSV，表头与 save_to_xlsx 的评论表头一致
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        # 带BOM，Excel 打开时不会乱码
+        self._file = open(path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(XLSX_HEADERS["comment"])
+
+    def write(self, row: dict):
+        self._writer.writerow([norm_text(str(v)) for v in row.values()])
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxCommentSink:
+    """
+    使用 openpyxl 的 write_only 模式逐行写入excel，表头与 save_to_xlsx 的评论表头一致
+    write_only 模式的行直接写入临时文件，内存占用不随行数增长
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._wb = openpyxl.Workbook(write_only=True)
+        self._ws = self._wb.create_sheet()
+        self._ws.append(XLSX_HEADERS["comment"])
+
+    def write(self, row: dict):
+        self._ws.append([norm_text(str(v)) for v in row.values()])
+        self.rows += 1
+
+    def close(self):
+        self._wb.save(self.path)
+        logger.info(f"数据保存至 {self.path}")
+
+
+COMMENT_SINKS = {
+    ".jsonl": JsonlCommentSink,
+    ".csv": CsvCommentSink,
+    ".xlsx": XlsxCommentSink,
+}
+
+
+def open_comment_sink(path):
+    """
+    按扩展名(.jsonl / .csv / .xlsx)创建评论输出
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in COMMENT_SINKS:
+        raise ValueError(f"不支持的评论输出格式: {ext}")
+    return COMMENT_SINKS[ext](path)
+
+
+class CommentCrawler:
+    """
+    按预算逐页爬取笔记评论并写入 sink，不在内存中保留评论
+    一级评论按接口返回的顺序逐页处理，每条一级评论之后紧跟它的二级评论
+    :param xhs_apis: XHS_Apis
+    :param sink: 评论输出，见 open_comment_sink
+    :param note_limits: 每篇笔记的预算，CommentBudget 的参数，如 {"max_comments": 500}
+    :param budget: 所有笔记共享的全局预算
+    :param include_sub: 是否展开二级评论，为 False 时只保存一级评论
+    """
+
+    def __init__(self, xhs_apis, sink, note_limits=None, budget=None, include_sub=True):
+        self.xhs_apis = xhs_apis
+        self.sink = sink
+        self.note_limits = note_limits or {}
+        self.budget = budget or CommentBudget()
+        self.include_sub = include_sub
+
+    def _take_page(self, note_budget):
+        if not note_budget.take_page():
+            return False
+        if not self.budget.take_page():
+            note_budget.give_back(pages=1)
+            note_budget.stop(self.budget.stopped)
+            return False
+        return True
+
+    def _write(self, comment, note_url, note_budget):
+        """
+        保存一条评论，预算用完时返回 False
+        """
+        if not note_budget.take_comment():
+            return False
+        if not self.budget.take_comment():
+            note_budget.give_back(comments=1)
+            note_budget.stop(self.budget.stopped)
+            return False
+        comment["note_url"] = note_url
+        self.sink.write(handle_comment_info(comment))
+        return True
+
+    def _pages(self, fetch, cursor, note_budget):
+        """
+        按 cursor 逐页请求，每页申请一次预算，返回每页的评论列表
+        """
+        while self._take_page(note_budget):
+            success, msg, res_json = fetch(cursor)
+            if not success:
+                raise Exception(msg)
+            data = res_json["data"]
+            yield data["comments"]
+            if "cursor" not in data or not data["has_more"]:
+                return
+            cursor = str(data["cursor"])
+
+    def _write_thread(
+        self, comment, note_url, xsec_token, cookies_str, proxies, note_budget
+    ):
+        """
+        保存一条一级评论和它的二级评论，预算用完时返回 False
+        """
+        if not self._write(comment, note_url, note_budget):
+            return False
+        if not self.include_sub:
+            return True
+        for sub_comment in comment.get("sub_comments") or []:
+            if not self._write(sub_comment, note_url, note_budget):
+                return False
+        if not comment.get("sub_comment_has_more"):
+            return True
+
+        def fetch(cursor):
+            return self.xhs_apis.get_note_inner_comment(
+                comment, cursor, xsec_token, cookies_str, proxies
+            )
+
+        for sub_comments in self._pages(
+            fetch, comment.get("sub_comment_cursor", ""), note_budget
+        ):
+            for sub_comment in sub_comments:
+                if not self._write(sub_comment, note_url, note_budget):
+                    return False
+        return True
+
+    def crawl_note(self, note_url: str, cookies_str, proxies=None):
+        """
+        爬取一篇笔记的评论
+        返回 success, msg, 统计信息 {"comments", "pages", "stopped"}
+        stopped 为中途拒绝继续爬取的预算类型(本篇或全局)，评论全部爬完时为 None
+        """
+        note_budget = CommentBudget(**self.note_limits)
+        url_parse = urllib.parse.urlparse(note_url)
+        note_id = url_parse.path.split("/")[-1]
+        # 与 get_note_all_comment 一样按原样取参数，不做URL解码
+        kvs = dict(kv.split("=", 1) for kv in url_parse.query.split("&") if "=" in kv)
+        xsec_token = kvs.get("xsec_token", "")
+
+        def fetch(cursor):
+            return self.xhs_apis.get_note_out_comment(
+                note_id, cursor, xsec_token, cookies_str, proxies
+            )
+
+        success, msg = True, "成功"
+        try:
+            for comments in self._pages(fetch, "", note_budget):
+                if not all(
+                    self._write_thread(
+                        comment, note_url, xsec_token, cookies_str, proxies, note_budget
+                    )
+                    for comment in comments
+                ):
+                    break
+        except Exception as e:
+            success, msg = False, error_msg(e)
+        stats = {
+            "comments": note_budget.comments,
+            "pages": note_budget.pages,
+            "stopped": note_budget.stopped,
+        }
+        logger.info(f"爬取笔记评论 {note_url}: {success}, msg: {msg}, {stats}")
+        return success, msg, stats
+
+    def crawl_notes(self, note_urls, cookies_str, proxies=None):
+        """
+        依次爬取多篇笔记的评论，全局预算用完后停止
+        返回每篇笔记的 (note_url, success, msg, 统计信息)
+        """
+        results = []
+        for note_url in note_urls:
+            stopped = self.budget.exhausted()
+            if stopped:
+                logger.info(f"评论全局预算已用完({stopped})，停止爬取")
+                break
+            results.append((note_url, *self.crawl_note(note_url, cookies_str, proxies)))
+        return results
@@ -1,12 +1,19 @@
 import os
 from loguru import logger
 from dotenv import load_dotenv
+from xhs_utils.log_util import setup_logging
 
 def load_env():
     load_dotenv()
     cookies_str = os.getenv('COOKIES')
     return cookies_str
 
+def get_request_timeout():
+    # 请求的 (连接超时, 读取超时)，避免一个卡住的连接让线程一直阻塞
+    connect_timeout = float(os.getenv('XHS_CONNECT_TIMEOUT', 5))
+    read_timeout = float(os.getenv('XHS_READ_TIMEOUT', 15))
+    return connect_timeout, read_timeout
+
 def init():
     media_base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/media_datas'))
     excel_base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/excel_datas'))
@@ -15,6 +22,8 @@ def init():
             os.makedirs(base_path)
             logger.info(f'创建目录 {base_path}')
     cookies_str = load_env()
+    # 日志配置来自 .env，需要在加载之后设置
+    setup_logging()
     base_path = {
         'media': media_base_path,
         'excel': excel_base_path,
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from loguru import logger
+from xhs_utils.cookie_util import trans_cookies
+from xhs_utils.rate_limit_util import is_risk_msg
+
+# 出现这些关键字的失败响应视为账号登录失效
+LOGIN_KEYWORDS = ("登录", "login")
+
+
+def is_login_msg(msg) -> bool:
+    msg = str(msg or "").lower()
+    return any(keyword in msg for keyword in LOGIN_KEYWORDS)
+
+
+class CookieAccount:
+    """
+    账号池中的单个账号及其请求统计
+    """
+
+    def __init__(self, cookies_str: str, weight: int = 1):
+        self.cookies_str = cookies_str
+        self.a1 = trans_cookies(cookies_str).get("a1", "")
+        self.weight = max(1, weight)
+        self.current_weight = 0
+        self.last_used = 0.0
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.quarantined_until = 0.0
+        self.quarantine_reason = ""
+
+    def available(self, now):
+        return now >= self.quarantined_until
+
+    def stats(self, now):
+        return {
+            "a1": self.a1,
+            "weight": self.weight,
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "quarantined": not self.available(now),
+            "quarantine_left": round(max(0.0, self.quarantined_until - now), 1),
+            "quarantine_reason": self.quarantine_reason,
+        }
+
+
+class CookiePool:
+    """
+    多账号Cookie池
+    每次请求从池中挑选一个账号，登录失效或触发风控的账号暂时隔离，隔离期满后自动恢复
+    XHS_Apis 的方法和 Data_Spider 都可以传入 CookiePool 代替 cookies_str
+    :param cookies: cookies_str 列表，或 (cookies_str, 权重) 列表
+    :param strategy: lru 最久未使用的账号优先, weighted 按权重轮询
+    :param risk_quarantine: 触发风控后隔离的秒数
+    :param login_quarantine: 登录失效后隔离的秒数
+    """
+
+    def __init__(
+        self,
+        cookies,
+        strategy: str = "lru",
+        risk_quarantine: float = 600,
+        login_quarantine: float = 3600,
+    ):
+        if strategy not in ("lru", "weighted"):
+            raise ValueError(f"不支持的账号调度方式: {strategy}")
+        self.accounts = []
+        for item in cookies:
+            cookies_str, weight = item if isinstance(item, (tuple, list)) else (item, 1)
+            if cookies_str:
+                self.accounts.append(CookieAccount(cookies_str, int(weight)))
+        if not self.accounts:
+            raise ValueError("账号池为空")
+        self.strategy = strategy
+        self.risk_quarantine = risk_quarantine
+        self.login_quarantine = login_quarantine
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        COOKIES_POOL_FILE: 账号文件，每行一个cookie，可以用 "权重<Tab>cookie" 指定权重
+        COOKIES_POOL: 多个cookie，用 | 分隔
+        COOKIES_POOL_STRATEGY: lru 或 weighted
+        COOKIES_RISK_QUARANTINE / COOKIES_LOGIN_QUARANTINE: 隔离秒数
+        两者都未配置时返回 None
+        """
+        cookies = []
+        pool_file = os.getenv("COOKIES_POOL_FILE")
+        if pool_file:
+            with open(pool_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    weight, _, cookies_str = line.rpartition("\t")
+                    cookies.append((cookies_str, int(weight) if weight else 1))
+        pool_env = os.getenv("COOKIES_POOL")
+        if pool_env:
+            cookies.extend(c.strip() for c in pool_env.split("|") if c.strip())
+        if not cookies:
+            return None
+        return cls(
+            cookies,
+            strategy=os.getenv("COOKIES_POOL_STRATEGY", "lru"),
+            risk_quarantine=float(os.getenv("COOKIES_RISK_QUARANTINE", 600)),
+            login_quarantine=float(os.getenv("COOKIES_LOGIN_QUARANTINE", 3600)),
+        )
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def acquire(self) -> CookieAccount:
+        """
+        挑选一个可用的账号，所有账号都在隔离中时抛出异常
+        """
+        with self._lock:
+            now = time.time()
+            candidates = [a for a in self.accounts if a.available(now)]
+            if not candidates:
+                raise RuntimeError("账号池中没有可用的账号")
+            if self.strategy == "weighted":
+                # 平滑加权轮询
+                total = sum(a.weight for a in candidates)
+                for account in candidates:
+                    account.current_weight += account.weight
+                account = max(candidates, key=lambda a: a.current_weight)
+                account.current_weight -= total
+            else:
+                account = min(candidates, key=lambda a: a.last_used)
+            account.last_used = time.monotonic()
+            account.requests += 1
+            return account
+
+    def report(self, account: CookieAccount, success: bool, msg=""):
+        """
+        记录请求结果，登录失效或触发风控的账号进入隔离
+        :param account: acquire 返回的账号
+        :param success: 请求是否成功
+        :param msg: 请求返回的信息
+        """
+        with self._lock:
+            if success:
+                account.successes += 1
+                return
+            account.failures += 1
+            if is_login_msg(msg):
+                seconds, reason = self.login_quarantine, "login"
+            elif is_risk_msg(msg):
+                seconds, reason = self.risk_quarantine, "risk"
+            else:
+                return
+            account.quarantined_until = time.time() + seconds
+            account.quarantine_reason = reason
+        logger.warning(f"账号 {account.a1} 隔离 {seconds} 秒: {msg}")
+
+    def release(self, account: CookieAccount):
+        """
+        手动解除账号隔离
+        """
+        with self._lock:
+            account.quarantined_until = 0.0
+            account.quarantine_reason = ""
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return [account.stats(now) for account in self.accounts]
@@ -2,12 +2,24 @@ import json
 import os
 import re
 import time
+import urllib.parse
 import openpyxl
 import requests
 from loguru import logger
 from retry import retry
+from xhs_utils.common_util import get_request_timeout
+from xhs_utils.metrics_util import DOWNLOAD_BYTES
+from xhs_utils.record_util import get_recorder
+from xhs_utils.timing_util import stage
 
 
+# save_to_xlsx 各类数据的表头，顺序与 handle_xxx_info 返回的字段一致
+XLSX_HEADERS = {
+    'note': ['笔记id', '笔记url', '笔记类型', '用户id', '用户主页url', '昵称', '头像url', '标题', '描述', '点赞数量', '收藏数量', '评论数量', '分享数量', '视频封面url', '视频地址url', '图片地址url列表', '标签', '上传时间', 'ip归属地'],
+    'user': ['用户id', '用户主页url', '用户名', '头像url', '小红书号', '性别', 'ip地址', '介绍', '关注数量', '粉丝数量', '作品被赞和收藏数量', '标签'],
+    'comment': ['笔记id', '笔记url', '评论id', '用户id', '用户主页url', '昵称', '头像url', '评论内容', '评论标签', '点赞数量', '上传时间', 'ip归属地', '图片地址url列表'],
+}
+
 def norm_str(str):
     new_str = re.sub(r"|[\\/:*?\"<>| ]+", "", str).replace('\n', '').replace('\r', '')
     return new_str
@@ -93,7 +105,8 @@ def handle_note_info(data):
             pass
     if note_type == '视频':
         video_cover = image_list[0]
-        video_addr = 'https://sns-video-bd.xhscdn.com/' + data['note_card']['video']['consumer']['origin_video_key']
+        video_cdn_base = os.getenv('XHS_VIDEO_CDN_BASE', 'https://sns-video-bd.xhscdn.com/')
+        video_addr = video_cdn_base + data['note_card']['video']['consumer']['origin_video_key']
         # success, msg, video_addr = XHS_Apis.get_note_no_water_video(note_id)
     else:
         video_cover = None
@@ -176,34 +189,60 @@ def handle_comment_info(data):
         'pictures': pictures,
     }
 def save_to_xlsx(datas, file_path, type='note'):
+    with stage('xlsx'):
+        _save_to_xlsx(datas, file_path, type)
+    logger.info(f'数据保存至 {file_path}')
+
+def _save_to_xlsx(datas, file_path, type):
     wb = openpyxl.Workbook()
     ws = wb.active
-    if type == 'note':
-        headers = ['笔记id', '笔记url', '笔记类型', '用户id', '用户主页url', '昵称', '头像url', '标题', '描述', '点赞数量', '收藏数量', '评论数量', '分享数量', '视频封面url', '视频地址url', '图片地址url列表', '标签', '上传时间', 'ip归属地']
-    elif type == 'user':
-        headers = ['用户id', '用户主页url', '用户名', '头像url', '小红书号', '性别', 'ip地址', '介绍', '关注数量', '粉丝数量', '作品被赞和收藏数量', '标签']
-    else:
-        headers = ['笔记id', '笔记url', '评论id', '用户id', '用户主页url', '昵称', '头像url', '评论内容', '评论标签', '点赞数量', '上传时间', 'ip归属地', '图片地址url列表']
+    headers = XLSX_HEADERS.get(type, XLSX_HEADERS['comment'])
     ws.append(headers)
     for data in datas:
         data = {k: norm_text(str(v)) for k, v in data.items()}
         ws.append(list(data.values()))
     wb.save(file_path)
-    logger.info(f'数据保存至 {file_path}')
+
+def cdn_url(url):
+    # 配置了 XHS_CDN_BASE 时把媒体地址指向本地模拟服务器，原来的域名作为路径的第一段
+    cdn_base = os.getenv('XHS_CDN_BASE')
+    if not cdn_base:
+        return url
+    parsed = urllib.parse.urlsplit(url)
+    new_url = f"{cdn_base.rstrip('/')}/{parsed.netloc}{parsed.path}"
+    if parsed.query:
+        new_url += f'?{parsed.query}'
+    return new_url
 
 def download_media(path, name, url, type):
+    with stage('download'):
+        file_path = _download_media(path, name, url, type)
+    if file_path is None:
+        return
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.record_media(url, file_path)
+
+def _download_media(path, name, url, type):
     if type == 'image':
-        content = requests.get(url).content
-        with open(path + '/' + name + '.jpg', mode="wb") as f:
+        file_path = path + '/' + name + '.jpg'
+        content = requests.get(cdn_url(url), timeout=get_request_timeout()).content
+        with open(file_path, mode="wb") as f:
             f.write(content)
+        DOWNLOAD_BYTES.inc((type,), len(content))
     elif type == 'video':
-        res = requests.get(url, stream=True)
+        file_path = path + '/' + name + '.mp4'
+        res = requests.get(cdn_url(url), stream=True, timeout=get_request_timeout())
         size = 0
         chunk_size = 1024 * 1024
-        with open(path + '/' + name + '.mp4', mode="wb") as f:
+        with open(file_path, mode="wb") as f:
             for data in res.iter_content(chunk_size=chunk_size):
                 f.write(data)
                 size += len(data)
+        DOWNLOAD_BYTES.inc((type,), size)
+    else:
+        return None
+    return file_path
 
 def save_user_detail(user, path):
     with open(f'{path}/detail.txt', mode="w", encoding="utf-8") as f:
@@ -257,11 +296,12 @@ def download_note(note_info, path, save_choice):
     if title.strip() == '':
         title = f'无标题'
     save_path = f'{path}/{nickname}_{user_id}/{title}_{note_id}'
-    check_and_create_path(save_path)
-    with open(f'{save_path}/info.json', mode='w', encoding='utf-8') as f:
-        f.write(json.dumps(note_info) + '\n')
+    with stage('persist'):
+        check_and_create_path(save_path)
+        with open(f'{save_path}/info.json', mode='w', encoding='utf-8') as f:
+            f.write(json.dumps(note_info) + '\n')
+        save_note_detail(note_info, save_path)
     note_type = note_info['note_type']
-    save_note_detail(note_info, save_path)
     if note_type == '图集' and save_choice in ['media', 'media-image', 'all']:
         for img_index, img_url in enumerate(note_info['image_list']):
             download_media(save_path, f'image_{img_index}', img_url, 'image')
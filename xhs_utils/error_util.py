@@ -0,0 +1,82 @@
+import requests
+
+
+class XHSError(Exception):
+    """
+    请求小红书接口出错的基类，kind 为错误类别
+    """
+
+    kind = "error"
+
+
+class NetworkError(XHSError):
+    """
+    连接失败、超时或服务端 5xx 错误
+    """
+
+    kind = "network"
+
+
+class SignError(XHSError):
+    """
+    生成请求签名失败
+    """
+
+    kind = "sign"
+
+
+class AuthError(XHSError):
+    """
+    登录失效或需要重新登录
+    """
+
+    kind = "auth"
+
+
+class RiskError(XHSError):
+    """
+    请求被风控拦截
+    """
+
+    kind = "risk"
+
+
+class ParseError(XHSError):
+    """
+    响应不是预期的json
+    """
+
+    kind = "parse"
+
+
+class CircuitOpenError(XHSError):
+    """
+    接口熔断中，请求未发出
+    """
+
+    kind = "circuit"
+
+
+class ErrorMsg(str):
+    """
+    带错误类别的 msg，仍然是字符串，调用方可以通过 kind 区分错误类型
+    """
+
+    def __new__(cls, msg, kind: str = "error"):
+        obj = super().__new__(cls, msg)
+        obj.kind = kind
+        return obj
+
+
+def error_msg(e: Exception) -> ErrorMsg:
+    """
+    把异常转换为 msg，保留错误类别
+    """
+    if isinstance(e, XHSError):
+        return ErrorMsg(str(e), e.kind)
+    # get_all_* 等方法用 raise Exception(msg) 向外传递内层的 msg
+    if e.args and isinstance(e.args[0], ErrorMsg):
+        return e.args[0]
+    if isinstance(e, requests.RequestException):
+        return ErrorMsg(str(e), NetworkError.kind)
+    return ErrorMsg(str(e))
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from xhs_utils.metrics_util import IMAGE_CACHE_BYTES, IMAGE_CACHE_REQUESTS
+
+
+class ImageCache:
+    """
+    以图片URL为key的磁盘LRU缓存
+    每张图片保存为 <key>.bin 和 <key>.json(元数据)，文件修改时间作为最近访问时间，超过容量时从最久未访问的开始淘汰
+    元数据中的 etag 是图片内容的摘要，上游图片变化后重新缓存时随之改变
+    淘汰和统计都以磁盘为准，多个进程可以共用同一个缓存目录
+    :param cache_dir: 缓存目录
+    :param max_bytes: 缓存容量上限(字节)
+    :param ttl: 缓存有效期(秒)
+    """
+
+    def __init__(
+        self, cache_dir, max_bytes: int = 512 * 1024 * 1024, ttl: int = 7 * 86400
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = self._scan_size()
+        self.hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+        self.bytes_served = 0
+        self.bytes_fetched = 0
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".bin", base + ".json"
+
+    def _scan_size(self):
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".bin"):
+                try:
+                    total += os.path.getsize(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+        return total
+
+    def _remove(self, key):
+        data_path, meta_path = self._paths(key)
+        for path in (meta_path, data_path):
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                if path == data_path:
+                    with self._lock:
+                        self._size -= size
+            except OSError:
+                pass
+
+    def get(self, url):
+        """
+        查询缓存，命中时返回 (文件路径, 元数据)，否则返回 None
+        """
+        key = self.key(url)
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - meta.get("created", 0) > self.ttl or not os.path.exists(
+            data_path
+        ):
+            self._remove(key)
+            return None
+        try:
+            # 更新访问时间，作为LRU的依据
+            os.utime(data_path)
+            if "etag" not in meta:
+                # 旧版本的缓存没有内容摘要，补算一次
+                digest = hashlib.sha1()
+                with open(data_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(64 * 1024), b""):
+                        digest.update(chunk)
+                meta["etag"] = digest.hexdigest()
+                self._write_meta(meta_path, meta)
+        except OSError:
+            return None
+        return data_path, meta
+
+    @staticmethod
+    def _write_meta(meta_path, meta):
+        tmp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def stream_into(self, url, content_type, chunks):
+        """
+        边把上游的数据块返回给调用方边写入缓存，全部写完后才放入缓存
+        :param url: 图片URL
+        :param content_type: 图片类型
+        :param chunks: 上游数据块
+        """
+        key = self.key(url)
+        data_path, meta_path = self._paths(key)
+        tmp_path = f"{data_path}.{uuid.uuid4().hex}.tmp"
+        size = 0
+        digest = hashlib.sha1()
+        completed = False
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            with self._lock:
+                self.bytes_fetched += size
+            IMAGE_CACHE_BYTES.inc(("fetched",), size)
+            if completed:
+                os.replace(tmp_path, data_path)
+                meta = {
+                    "url": url,
+                    "content_type": content_type,
+                    "size": size,
+                    "etag": digest.hexdigest(),
+                    "created": time.time(),
+                }
+                self._write_meta(meta_path, meta)
+                with self._lock:
+                    self._size += size
+                self.evict()
+            else:
+                # 客户端中途断开或上游出错，丢弃不完整的文件
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """
+        超过容量时按最近访问时间淘汰到容量的90%
+        """
+        if self._size <= self.max_bytes:
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".bin"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name[: -len(".bin")]))
+        entries.sort()
+        total = sum(entry[1] for entry in entries)
+        with self._lock:
+            self._size = total
+        for _, size, key in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            self._remove(key)
+            total -= size
+
+    def record(self, hit: bool, seconds: float, size: int = 0):
+        """
+        记录一次请求的命中情况和耗时
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_seconds += seconds
+            else:
+                self.misses += 1
+                self.miss_seconds += seconds
+            self.bytes_served += size
+        IMAGE_CACHE_REQUESTS.inc(("hit" if hit else "miss",))
+        IMAGE_CACHE_BYTES.inc(("served",), size)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "avg_hit_ms": (
+                    round(self.hit_seconds / self.hits * 1000, 2) if self.hits else 0.0
+                ),
+                "avg_miss_ms": (
+                    round(self.miss_seconds / self.misses * 1000, 2)
+                    if self.misses
+                    else 0.0
+                ),
+                "bytes_served": self.bytes_served,
+                "bytes_fetched": self.bytes_fetched,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,161 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from loguru import logger
+
+# 紧凑格式: 时间 级别首字母 线程 模块:行号 [日志类别] 消息
+COMPACT_FORMAT = (
+    "{time:YYMMDD HH:mm:ss.SSS} {level.name:.1} {thread.name} {name}:{line} "
+)
+
+# LOG_MODE=prod 时的默认采样率和每秒条数上限，逐条的图片和评论日志基本不输出
+PROD_SAMPLE = {"picture": 0.0, "comment": 0.01, "sub_comment": 0.01, "note": 0.1}
+PROD_RATE = {"*": 20}
+
+# loguru 内置的 DEBUG / INFO 级别数值
+DEBUG_NO, INFO_NO = 10, 20
+
+_settings = {"min_level": 0, "sample": {}, "rate": {}}
+_setup_lock = threading.Lock()
+_configured = False
+
+
+def _parse_mapping(value, cast=float):
+    """
+    解析 "note=0.1,comment=0.01" 形式的配置
+    """
+    mapping = {}
+    for item in (value or "").split(","):
+        name, _, number = item.partition("=")
+        if name.strip() and number.strip():
+            mapping[name.strip()] = cast(number)
+    return mapping
+
+
+def compact_format(record):
+    template = COMPACT_FORMAT
+    if "log_class" in record["extra"]:
+        template += "[{extra[log_class]}] "
+    return template + "{message}\n{exception}"
+
+
+def setup_logging():
+    """
+    按环境变量配置日志输出，只在第一次调用时生效
+    LOG_LEVEL: 最低级别，默认 INFO
+    LOG_MODE: prod 时默认使用后台队列、紧凑格式以及 PROD_SAMPLE / PROD_RATE
+    LOG_ASYNC: 为 1 时日志放入队列由后台线程写出 (loguru enqueue)
+    LOG_FORMAT: default / compact / json
+    LOG_FILE: 同时写入的日志文件，按 LOG_ROTATION (默认 100 MB) 切分
+    LOG_SAMPLE: 各类日志的采样率，如 picture=0,comment=0.05，* 为其他类别的默认值
+    LOG_RATE: 各类日志每秒最多输出的条数，如 comment=10,*=50
+    """
+    global _configured
+    with _setup_lock:
+        if _configured:
+            return
+        _configured = True
+        prod = os.getenv("LOG_MODE", "") == "prod"
+        level = os.getenv("LOG_LEVEL", "INFO").upper()
+        enqueue = os.getenv("LOG_ASYNC", "1" if prod else "0") == "1"
+        log_format = os.getenv("LOG_FORMAT", "compact" if prod else "default")
+        options = {"level": level, "enqueue": enqueue, "backtrace": False}
+        if log_format == "json":
+            options["serialize"] = True
+        elif log_format == "compact":
+            options["format"] = compact_format
+            options["colorize"] = False
+        logger.remove()
+        logger.add(sys.stderr, **options)
+        log_file = os.getenv("LOG_FILE")
+        if log_file:
+            logger.add(
+                log_file,
+                rotation=os.getenv("LOG_ROTATION", "100 MB"),
+                encoding="utf-8",
+                **dict(options, colorize=False),
+            )
+        _settings["min_level"] = logger.level(level).no
+        _settings["sample"] = dict(PROD_SAMPLE if prod else {})
+        _settings["sample"].update(_parse_mapping(os.getenv("LOG_SAMPLE")))
+        _settings["rate"] = dict(PROD_RATE if prod else {})
+        _settings["rate"].update(_parse_mapping(os.getenv("LOG_RATE"), int))
+
+
+class HotLogger:
+    """
+    热路径上逐条输出的一类日志(如每张图片、每条评论)
+    在格式化消息之前依次检查级别、采样和每秒条数上限，被丢弃的日志不会格式化:
+        comment_log = hot_logger('comment')
+        comment_log.info('提取评论: {}', content)
+    每秒的窗口结束时输出一条被限流丢弃的数量
+    :param name: 日志类别，对应 LOG_SAMPLE / LOG_RATE 中的名称
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._counter = itertools.count()
+        self._window = 0
+        self._window_count = 0
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._logger = logger.bind(log_class=name)
+
+    def _setting(self, key, default):
+        values = _settings[key]
+        return values.get(self.name, values.get("*", default))
+
+    def _admit(self):
+        sample = self._setting("sample", 1.0)
+        if sample <= 0:
+            return False
+        if sample < 1:
+            # 按顺序每 1/sample 条保留一条，比随机采样更均匀
+            n = next(self._counter)
+            if int((n + 1) * sample) == int(n * sample):
+                return False
+        rate = self._setting("rate", None)
+        if not rate:
+            return True
+        with self._lock:
+            window = int(time.monotonic())
+            if window != self._window:
+                if self._dropped:
+                    self._logger.info("限流丢弃 {} 条", self._dropped)
+                self._window, self._window_count, self._dropped = window, 0, 0
+            if self._window_count >= rate:
+                self._dropped += 1
+                return False
+            self._window_count += 1
+            return True
+
+    def log(self, level: str, message: str, *args, **kwargs):
+        if logger.level(level).no < _settings["min_level"] or not self._admit():
+            return
+        self._logger.opt(depth=1).log(level, message, *args, **kwargs)
+
+    def debug(self, message: str, *args, **kwargs):
+        if DEBUG_NO < _settings["min_level"] or not self._admit():
+            return
+        self._logger.opt(depth=1).debug(message, *args, **kwargs)
+
+    def info(self, message: str, *args, **kwargs):
+        if INFO_NO < _settings["min_level"] or not self._admit():
+            return
+        self._logger.opt(depth=1).info(message, *args, **kwargs)
+
+
+_hot_loggers = {}
+
+
+def hot_logger(name: str) -> HotLogger:
+    """
+    获取某类热路径日志，同名共享采样和限流状态
+    """
+    with _setup_lock:
+        hot = _hot_loggers.get(name)
+        if hot is None:
+            hot = _hot_loggers[name] = HotLogger(name)
+        return hot
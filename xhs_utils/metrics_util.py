@@ -0,0 +1,364 @@
+import hashlib
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+
+# 延迟直方图默认的桶上限(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _add_values(a, b):
+    """
+    合并两个指标值，计数器为数值，直方图为 [各桶计数..., 总和, 次数]
+    """
+    if isinstance(a, list):
+        return [x + y for x, y in zip(a, b)]
+    return a + b
+
+
+class _Sharded:
+    """
+    按线程分片的指标，每个线程只写自己的分片，写入时不加锁
+    采集时汇总所有分片，已结束线程的分片合并后丢弃
+    """
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _merge(self, total, shard):
+        raise NotImplementedError
+
+    def collect(self):
+        """
+        汇总所有线程的分片，返回 {标签值: 值}
+        """
+        with self._lock:
+            alive = []
+            total = {}
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                    self._merge(total, shard.copy())
+                else:
+                    self._merge(self._retired, shard.copy())
+            self._shards = alive
+            self._merge(total, self._retired)
+            return total
+
+
+class Counter(_Sharded):
+    """
+    只增不减的计数器
+    """
+
+    type = "counter"
+
+    def inc(self, labels=(), amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge(self, total, shard):
+        for labels, value in shard.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self, values=None):
+        values = self.collect() if values is None else values
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Sharded):
+    """
+    固定桶的直方图，每个标签值保存 [各桶计数..., 总和, 次数]
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels=(), value=0.0):
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            row = shard[labels] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[index] += 1
+                break
+        row[-2] += value
+        row[-1] += 1
+
+    def _merge(self, total, shard):
+        for labels, row in shard.items():
+            merged = total.get(labels)
+            if merged is None:
+                total[labels] = list(row)
+            else:
+                for index, value in enumerate(row):
+                    merged[index] += value
+
+    def render(self, values=None):
+        values = self.collect() if values is None else values
+        lines = []
+        for labels, row in sorted(values.items()):
+            cumulative = 0
+            # 超过最大桶的观测只计入 +Inf，即总次数
+            for bound, count in zip(self.buckets + (math.inf,), row[:-2] + [0]):
+                cumulative = row[-1] if bound == math.inf else cumulative + count
+                le = (("le", _format_value(bound)),)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(row[-2])}")
+            lines.append(f"{self.name}_count{label_str} {row[-1]}")
+        return lines
+
+
+class Gauge:
+    """
+    采集时调用 fn 取值的瞬时指标，fn 返回数值或 {标签值: 数值}
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        value = self.fn()
+        values = value if isinstance(value, dict) else {(): value}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}"
+            for labels, v in sorted(values.items())
+        ]
+
+
+class MetricsRegistry:
+    """
+    指标注册表，render 输出 Prometheus 文本格式
+    调用 share 后计数器和直方图汇总所有进程的数据，瞬时指标仍只在本进程取值
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._store = None
+        self._process = None
+        self._interval = None
+
+    def share(self, store, interval: float = 15):
+        """
+        多进程部署(如 start_web.py --prod)时在进程之间汇总计数器和直方图
+        本进程的累计值每 interval 秒写入 store(SharedStore)，render 时合并其他进程写入的值
+        超过 10 个周期没有更新的进程视为已退出，它的值合并保留，计数不会因进程重启而减少
+        :param store: SharedStore
+        :param interval: 写入间隔(秒)，进程退出前最后一个周期内的计数会丢失
+        """
+        with self._lock:
+            if self._store is not None:
+                return
+            self._store = store
+            self._interval = interval
+            # 主机名和进程号便于排查，随机后缀避免进程号重复使用时覆盖已退出进程的值
+            self._process = (
+                f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            )
+        threading.Thread(
+            target=self._flush_loop, name="metrics-flush", daemon=True
+        ).start()
+
+    def _sharded(self):
+        with self._lock:
+            return [m for m in self._metrics.values() if isinstance(m, _Sharded)]
+
+    def flush(self):
+        """
+        把本进程的累计值写入共享存储，并合并已退出进程的值
+        """
+        if self._store is None:
+            return
+        rows = [
+            (metric.name, list(labels), value)
+            for metric in self._sharded()
+            for labels, value in metric.collect().items()
+        ]
+        self._store.save_metrics(self._process, rows)
+        self._store.retire_metrics(time.time() - self._interval * 10, _add_values)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.flush()
+            except Exception:
+                # 数据库暂时不可用时下个周期再写入，累计值不会丢失
+                pass
+
+    def _shared_values(self):
+        """
+        其他进程写入的值 {指标名: {标签值: 值}}，未调用 share 时为空
+        """
+        shared = {}
+        if self._store is None:
+            return shared
+        for name, labels, value in self._store.load_metrics(exclude=self._process):
+            values = shared.setdefault(name, {})
+            labels = tuple(labels)
+            values[labels] = (
+                _add_values(values[labels], value) if labels in values else value
+            )
+        return shared
+
+    @staticmethod
+    def _combine(local, shared):
+        for labels, value in shared.items():
+            local[labels] = (
+                _add_values(local[labels], value) if labels in local else value
+            )
+        return local
+
+    def values(self, name):
+        """
+        计数器或直方图所有进程合计的值 {标签值: 值}
+        """
+        with self._lock:
+            metric = self._metrics[name]
+        return self._combine(metric.collect(), self._shared_values().get(name, {}))
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(
+        self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn, labelnames=()) -> Gauge:
+        """
+        注册瞬时指标，同名指标重复注册时替换取值函数
+        """
+        with self._lock:
+            gauge = self._metrics[name] = Gauge(name, help, fn, labelnames)
+            return gauge
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        # 读取共享存储失败时整体报错，避免只输出本进程的值让计数器看起来变小
+        shared = self._shared_values()
+        lines = []
+        for metric in metrics:
+            try:
+                if isinstance(metric, _Sharded):
+                    samples = metric.render(
+                        self._combine(metric.collect(), shared.get(metric.name, {}))
+                    )
+                else:
+                    samples = metric.render()
+            except Exception:
+                # 取值失败的瞬时指标不影响其他指标
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def account_label(a1):
+    """
+    账号的指标标签，使用 a1 的摘要避免在指标中暴露cookie
+    """
+    if not a1:
+        return "unknown"
+    return hashlib.sha1(a1.encode("utf-8")).hexdigest()[:8]
+
+
+# 进程内共享的指标注册表和爬虫热路径上的指标
+registry = MetricsRegistry()
+
+API_REQUESTS = registry.counter(
+    "xhs_api_requests_total",
+    "XHS_Apis 请求数，按接口和结果统计",
+    ("endpoint", "outcome"),
+)
+API_LATENCY = registry.histogram(
+    "xhs_api_request_seconds",
+    "XHS_Apis 网络请求耗时(不含签名)",
+    ("endpoint", "outcome"),
+)
+SIGN_LATENCY = registry.histogram(
+    "xhs_sign_seconds",
+    "请求签名耗时",
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2, 5),
+)
+ACCOUNT_REQUESTS = registry.counter(
+    "xhs_account_requests_total",
+    "每个账号发出的请求数，账号为 a1 的摘要",
+    ("account",),
+)
+DOWNLOAD_BYTES = registry.counter(
+    "xhs_download_bytes_total",
+    "下载的媒体字节数",
+    ("type",),
+)
+IMAGE_CACHE_REQUESTS = registry.counter(
+    "web_image_cache_requests_total",
+    "图片代理请求数，按是否命中缓存统计",
+    ("result",),
+)
+IMAGE_CACHE_BYTES = registry.counter(
+    "web_image_cache_bytes_total",
+    "图片代理返回和从上游下载的字节数",
+    ("direction",),
+)
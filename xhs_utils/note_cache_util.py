@@ -0,0 +1,135 @@
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 命中缓存时 spider_note 返回的 msg
+NOTE_CACHE_HIT_MSG = "命中笔记缓存"
+
+
+class NoteCache:
+    """
+    跨任务共享的笔记缓存，以 note_id 为key
+    笔记详情(含点赞收藏等互动数)和评论分别设置有效期，内存中按LRU淘汰，可选同时保存到磁盘
+    :param max_items: 内存中最多缓存的笔记数量
+    :param note_ttl: 笔记详情的有效期(秒)
+    :param comment_ttl: 评论的有效期(秒)
+    :param disk_dir: 磁盘缓存目录，为None时只缓存在内存中
+    """
+
+    def __init__(
+        self,
+        max_items: int = 2000,
+        note_ttl: float = 3600,
+        comment_ttl: float = 600,
+        disk_dir: str = None,
+    ):
+        self.max_items = max(1, max_items)
+        self.ttls = {"note": note_ttl, "comments": comment_ttl}
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._items = OrderedDict()  # note_id -> {part: [time, value]}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_items=int(os.getenv("NOTE_CACHE_SIZE", 2000)),
+            note_ttl=float(os.getenv("NOTE_CACHE_TTL", 3600)),
+            comment_ttl=float(os.getenv("NOTE_CACHE_COMMENT_TTL", 600)),
+            disk_dir=os.getenv("NOTE_CACHE_DIR") or None,
+        )
+
+    def _disk_path(self, note_id):
+        return os.path.join(self.disk_dir, f"{note_id}.json")
+
+    def _trim(self):
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def _load_entry(self, note_id):
+        entry = self._items.get(note_id)
+        if entry is None and self.disk_dir:
+            try:
+                with open(self._disk_path(note_id), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                # 从磁盘读入的也放入内存，同样受 max_items 限制
+                self._items[note_id] = entry
+                self._trim()
+            except (OSError, ValueError):
+                entry = None
+        return entry
+
+    def _fresh(self, entry, part):
+        return (
+            entry is not None
+            and part in entry
+            and time.time() - entry[part][0] <= self.ttls[part]
+        )
+
+    def has(self, note_id, part="note"):
+        """
+        判断缓存中是否有未过期的数据，不计入命中统计
+        """
+        with self._lock:
+            return self._fresh(self._load_entry(note_id), part)
+
+    def get(self, note_id, part="note"):
+        """
+        获取缓存的数据，返回副本，未命中或已过期返回 None
+        :param note_id: 笔记id
+        :param part: note 笔记详情, comments 评论
+        """
+        with self._lock:
+            entry = self._load_entry(note_id)
+            if not self._fresh(entry, part):
+                self.misses += 1
+                return None
+            self._items.move_to_end(note_id)
+            self.hits += 1
+            value = entry[part][1]
+        return copy.deepcopy(value)
+
+    def put(self, note_id, part, value):
+        """
+        写入缓存
+        :param note_id: 笔记id
+        :param part: note 笔记详情, comments 评论
+        :param value: 数据
+        """
+        value = copy.deepcopy(value)
+        with self._lock:
+            entry = self._load_entry(note_id) or {}
+            entry[part] = [time.time(), value]
+            self._items[note_id] = entry
+            self._items.move_to_end(note_id)
+            self._trim()
+            if self.disk_dir:
+                tmp_path = f"{self._disk_path(note_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                os.replace(tmp_path, self._disk_path(note_id))
+
+    def stats(self):
+        with self._lock:
+            return {"items": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_note_cache():
+    """
+    获取进程内共享的笔记缓存，配置来自环境变量
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = NoteCache.from_env()
+        return _default_cache
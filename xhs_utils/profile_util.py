@@ -0,0 +1,292 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from loguru import logger
+
+# 当前线程在为哪些采样器工作，任务的调用线程和执行任务工作的线程池线程都会设置
+_task_local = threading.local()
+
+# tracemalloc 是进程级的，多个分析同时开启内存跟踪时按引用计数，最后一个结束的才停止
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False
+
+
+def _acquire_tracing():
+    """
+    开始使用 tracemalloc，没有在跟踪时开启
+    """
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            _tracing_owned = True
+        _tracing_users += 1
+
+
+def _release_tracing():
+    """
+    结束使用 tracemalloc，最后一个使用者结束且跟踪是这里开启的才停止，外部开启的跟踪保持不变
+    """
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+def _current_samplers():
+    return getattr(_task_local, "samplers", ())
+
+
+def bind_task(fn):
+    """
+    包装提交到线程池的函数，在工作线程中执行期间该线程归入提交者所属任务的采样
+    线程池的线程可能早于任务创建并被多个任务共用，只在执行本任务的工作时采样
+    当前线程没有进行中的采样时原样返回 fn
+    """
+    samplers = _current_samplers()
+    if not samplers:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = _current_samplers()
+        _task_local.samplers = samplers
+        ident = threading.get_ident()
+        for sampler in samplers:
+            sampler.add_thread(ident)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            for sampler in samplers:
+                sampler.remove_thread(ident)
+            _task_local.samplers = previous
+
+    return wrapper
+
+
+class StackSampler:
+    """
+    采样分析器，后台线程定时读取其他线程的调用栈，按火焰图的折叠栈格式(collapsed stacks)统计
+    只采样调用 start 的线程和通过 bind_task 为它执行工作的线程，同时运行的其他任务和Web服务的线程不计入
+    :param interval: 采样间隔(秒)
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._threads = {}  # 线程ident -> 正在执行的工作数
+        self._threads_lock = threading.Lock()
+        self._owner = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_thread(self, ident):
+        with self._threads_lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+
+    def remove_thread(self, ident):
+        with self._threads_lock:
+            count = self._threads.get(ident, 0) - 1
+            if count > 0:
+                self._threads[ident] = count
+            else:
+                self._threads.pop(ident, None)
+
+    def start(self):
+        self._owner = threading.get_ident()
+        self.add_thread(self._owner)
+        _task_local.samplers = _current_samplers() + (self,)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if threading.get_ident() == self._owner:
+            _task_local.samplers = tuple(
+                s for s in _current_samplers() if s is not self
+            )
+        self.remove_thread(self._owner)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                threads = set(self._threads)
+            for ident, frame in sys._current_frames().items():
+                if ident not in threads:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def write(self, path):
+        """
+        写入折叠栈文件，可以直接交给 flamegraph.pl 或 speedscope
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.counts.items(), key=lambda i: -i[1]):
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class CrawlProfiler:
+    """
+    爬取过程的性能分析，作为上下文管理器包住一次爬取:
+        with CrawlProfiler(output_dir, 'search'):
+            ...
+    结束时在 output_dir 下写入:
+        <name>.pstats        cProfile 统计，可用 python -m pstats 或 snakeviz 查看
+        <name>.pstats.txt    按累计耗时排序的前若干个函数
+        <name>.collapsed     采样得到的折叠栈，用于生成火焰图
+        <name>.tracemalloc   结束时的内存快照(开启 tracemalloc 时)
+        <name>.tracemalloc.txt 内存增长最多的代码行
+    cProfile 只统计调用线程，采样覆盖调用线程和通过 bind_task 提交到线程池的工作
+    多个分析同时开启 tracemalloc 时共用一次跟踪，内存快照中也会包含其他任务的分配
+    :param output_dir: 输出目录
+    :param name: 文件名前缀
+    :param mode: both 同时使用两种分析器, cprofile 只用确定性分析, sample 只用采样分析
+    :param interval: 采样间隔(秒)
+    :param trace_memory: 是否开启 tracemalloc
+    :param top: 文本报告中列出的条数
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        name: str = "crawl",
+        mode: str = "both",
+        interval: float = 0.005,
+        trace_memory: bool = False,
+        top: int = 40,
+    ):
+        if mode not in ("both", "cprofile", "sample"):
+            raise ValueError(f"不支持的分析方式: {mode}")
+        self.output_dir = output_dir
+        self.name = name
+        self.mode = mode
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.top = top
+        self.files = []
+        self._profile = None
+        self._sampler = None
+        self._memory_start = None
+        self._started = 0.0
+
+    @classmethod
+    def from_env(cls, output_dir: str, name: str = "crawl"):
+        """
+        XHS_PROFILE_MODE: both / cprofile / sample
+        XHS_PROFILE_INTERVAL: 采样间隔(秒)
+        XHS_PROFILE_MEMORY: 为 1 时开启 tracemalloc
+        """
+        return cls(
+            output_dir,
+            name,
+            mode=os.getenv("XHS_PROFILE_MODE", "both"),
+            interval=float(os.getenv("XHS_PROFILE_INTERVAL", 0.005)),
+            trace_memory=os.getenv("XHS_PROFILE_MEMORY", "0") == "1",
+        )
+
+    def _path(self, suffix):
+        return os.path.join(self.output_dir, f"{self.name}{suffix}")
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._started = time.perf_counter()
+        if self.trace_memory:
+            _acquire_tracing()
+            self._memory_start = tracemalloc.take_snapshot()
+        if self.mode in ("both", "sample"):
+            self._sampler = StackSampler(self.interval)
+            self._sampler.start()
+        if self.mode in ("both", "cprofile"):
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def stop(self):
+        """
+        停止分析并写入结果文件，返回写入的文件列表
+        """
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        # 先取内存快照，避免把写入结果的内存算进去
+        if self._memory_start is not None:
+            self._write_memory()
+        if self._profile is not None:
+            self._write_pstats()
+        if self._sampler is not None:
+            self.files.append(self._sampler.write(self._path(".collapsed")))
+        logger.info(
+            f"性能分析 {self.name} 耗时 {time.perf_counter() - self._started:.2f}s，结果: {self.files}"
+        )
+        return self.files
+
+    def _write_pstats(self):
+        path = self._path(".pstats")
+        self._profile.dump_stats(path)
+        self.files.append(path)
+        report = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=report)
+        stats.sort_stats("cumulative").print_stats(self.top)
+        with open(path + ".txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+        self.files.append(path + ".txt")
+
+    def _write_memory(self):
+        # 排除分析器自身的内存
+        ignored = [
+            tracemalloc.Filter(False, pattern)
+            for pattern in (
+                __file__,
+                cProfile.__file__,
+                pstats.__file__,
+                tracemalloc.__file__,
+            )
+        ]
+        try:
+            snapshot = tracemalloc.take_snapshot().filter_traces(ignored)
+        finally:
+            _release_tracing()
+        start = self._memory_start.filter_traces(ignored)
+        path = self._path(".tracemalloc")
+        snapshot.dump(path)
+        self.files.append(path)
+        current = sum(stat.size for stat in snapshot.statistics("filename"))
+        with open(path + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"当前跟踪的内存: {current / 1024 / 1024:.2f} MB\n")
+            f.write(f"内存增长最多的 {self.top} 行:\n")
+            for stat in snapshot.compare_to(start, "lineno")[: self.top]:
+                f.write(f"{stat}\n")
+        self.files.append(path + ".txt")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
@@ -0,0 +1,395 @@
+import asyncio
+import os
+import threading
+import time
+
+# 出现这些关键字的失败响应视为触发了风控，退避更激进
+RISK_KEYWORDS = ("频繁", "频次", "风控", "异常", "验证", "captcha", "risk")
+
+
+def is_risk_msg(msg) -> bool:
+    msg = str(msg or "").lower()
+    return any(keyword in msg for keyword in RISK_KEYWORDS)
+
+
+class AdaptivePacer:
+    """
+    自适应请求节奏控制
+    多个线程共享同一个请求间隔：请求成功时间隔线性缩短，请求失败时成倍放大，触发风控时再额外放大
+    :param initial_interval: 初始请求间隔(秒)
+    :param min_interval: 最小请求间隔(秒)
+    :param max_interval: 最大请求间隔(秒)
+    :param decrease_step: 每次成功缩短的间隔(秒)
+    :param backoff: 失败时间隔放大的倍数
+    """
+
+    def __init__(
+        self,
+        initial_interval: float = 1.0,
+        min_interval: float = 0.2,
+        max_interval: float = 10.0,
+        decrease_step: float = 0.05,
+        backoff: float = 2.0,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.decrease_step = decrease_step
+        self.backoff = backoff
+        self.interval = min(max(initial_interval, min_interval), max_interval)
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        预约下一个请求时间点并等待到达
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self.interval
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def feedback(self, success: bool, msg=""):
+        """
+        根据请求结果调整间隔
+        :param success: 请求是否成功
+        :param msg: 请求返回的信息，用于识别风控
+        """
+        with self._lock:
+            if success:
+                self.interval = max(
+                    self.min_interval, self.interval - self.decrease_step
+                )
+                return
+            factor = self.backoff * 2 if is_risk_msg(msg) else self.backoff
+            self.interval = min(self.max_interval, self.interval * factor)
+            # 失败后立即推迟后续请求
+            self._next_time = max(self._next_time, time.monotonic() + self.interval)
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+    每次请求预约一个令牌，令牌不足时返回需要等待的时间，等待在锁外进行，因此线程和协程都可以共享同一个桶
+    :param rate: 每秒生成的令牌数
+    :param capacity: 桶容量，即允许的突发请求数
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        预约令牌，返回需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """
+    按账号分组的令牌桶限速器，可以再按接口类别单独限速
+    同一个账号的所有调用方(线程或协程)共享同一份请求额度
+    :param rate: 每个账号每秒的请求数
+    :param capacity: 每个账号允许的突发请求数
+    :param family_rates: 接口类别的限速 {类别: 每秒请求数}，同一账号下该类别的请求还需满足该限速
+    """
+
+    def __init__(self, rate: float = 2.0, capacity: float = 5.0, family_rates=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.family_rates = family_rates or {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        XHS_RATE: 每个账号每秒请求数
+        XHS_BURST: 每个账号突发请求数
+        XHS_FAMILY_RATES: 接口类别限速，如 comment=1,search=0.5
+        """
+        family_rates = {}
+        for item in os.getenv("XHS_FAMILY_RATES", "").split(","):
+            if "=" in item:
+                family, rate = item.split("=", 1)
+                family_rates[family.strip()] = float(rate)
+        return cls(
+            rate=float(os.getenv("XHS_RATE", 2.0)),
+            capacity=float(os.getenv("XHS_BURST", 5.0)),
+            family_rates=family_rates,
+        )
+
+    def _bucket(self, key, rate, capacity):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, capacity)
+            return bucket
+
+    def reserve(self, account, family=None) -> float:
+        """
+        为一次请求预约额度，返回需要等待的秒数
+        :param account: 账号标识(cookie 中的 a1)
+        :param family: 接口类别
+        """
+        if self.rate <= 0:
+            return 0.0
+        wait = self._bucket(account, self.rate, self.capacity).reserve()
+        family_rate = self.family_rates.get(family)
+        if family_rate:
+            bucket = self._bucket((account, family), family_rate, 1)
+            wait = max(wait, bucket.reserve())
+        return wait
+
+    def acquire(self, account, family=None):
+        wait = self.reserve(account, family)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, account, family=None):
+        wait = self.reserve(account, family)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class ConcurrencyController:
+    """
+    AIMD 并发控制
+    同时进行的请求数上限在请求成功时缓慢增加(每个上限周期约加 1)，请求失败或触发风控时成倍减小
+    触发风控的账号还会单独退避一段时间，连续触发时退避时间加倍
+    :param initial_limit: 初始并发上限
+    :param min_limit: 最小并发上限
+    :param max_limit: 最大并发上限
+    :param decrease: 失败时并发上限乘以的系数
+    :param cut_interval: 两次减小并发上限的最小间隔(秒)，避免同一批请求的失败重复减小
+    :param account_backoff: 账号触发风控后的初始退避时间(秒)
+    :param max_account_backoff: 账号最长退避时间(秒)
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 4,
+        min_limit: float = 1,
+        max_limit: float = 16,
+        decrease: float = 0.5,
+        cut_interval: float = 1.0,
+        account_backoff: float = 5.0,
+        max_account_backoff: float = 300.0,
+    ):
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.decrease = decrease
+        self.cut_interval = cut_interval
+        self.account_backoff = account_backoff
+        self.max_account_backoff = max_account_backoff
+        self.in_flight = 0
+        self._last_cut = 0.0
+        self._accounts = {}  # account -> [退避结束时间, 连续触发次数]
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        """
+        XHS_CONCURRENCY: 初始并发上限
+        XHS_CONCURRENCY_MIN / XHS_CONCURRENCY_MAX: 并发上限的范围
+        XHS_ACCOUNT_BACKOFF: 账号触发风控后的初始退避时间(秒)
+        """
+        return cls(
+            initial_limit=float(os.getenv("XHS_CONCURRENCY", 4)),
+            min_limit=float(os.getenv("XHS_CONCURRENCY_MIN", 1)),
+            max_limit=float(os.getenv("XHS_CONCURRENCY_MAX", 16)),
+            account_backoff=float(os.getenv("XHS_ACCOUNT_BACKOFF", 5)),
+        )
+
+    def acquire(self, account=None):
+        """
+        等待账号退避结束并取得一个并发名额
+        """
+        while True:
+            with self._cond:
+                backoff_until = self._accounts.get(account, (0.0, 0))[0]
+                wait = backoff_until - time.monotonic()
+                if wait <= 0:
+                    while self.in_flight >= int(self.limit):
+                        self._cond.wait()
+                    self.in_flight += 1
+                    return
+            time.sleep(wait)
+
+    def release(self, account=None, outcome: str = "ok"):
+        """
+        归还并发名额并根据结果调整并发上限
+        :param outcome: ok 成功, fail 失败, risk 触发风控
+        """
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            now = time.monotonic()
+            if outcome == "ok":
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._accounts.pop(account, None)
+            else:
+                if now - self._last_cut >= self.cut_interval:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_cut = now
+                until, strikes = self._accounts.get(account, (0.0, 0))
+                # 退避期间返回的同一批请求不再重复加倍
+                if outcome == "risk" and until <= now:
+                    strikes += 1
+                    backoff = min(
+                        self.max_account_backoff,
+                        self.account_backoff * 2 ** (strikes - 1),
+                    )
+                    self._accounts[account] = (now + backoff, strikes)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "backoff_accounts": {
+                    account: round(until - now, 1)
+                    for account, (until, _) in self._accounts.items()
+                    if until > now
+                },
+            }
+
+
+class CircuitBreaker:
+    """
+    按接口类别熔断
+    某类接口连续失败(网络错误、超时、响应无法解析)达到阈值后熔断，熔断期间该类请求直接失败不再发出
+    熔断 recovery_time 秒后放行一个试探请求，成功则恢复，失败则继续熔断
+    :param failure_threshold: 连续失败多少次后熔断
+    :param recovery_time: 熔断多少秒后试探恢复
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30):
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_time = recovery_time
+        self._states = {}  # family -> {"failures", "opened_at", "probing"}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        XHS_BREAKER_THRESHOLD: 连续失败多少次后熔断
+        XHS_BREAKER_RECOVERY: 熔断多少秒后试探恢复
+        """
+        return cls(
+            failure_threshold=int(os.getenv("XHS_BREAKER_THRESHOLD", 5)),
+            recovery_time=float(os.getenv("XHS_BREAKER_RECOVERY", 30)),
+        )
+
+    def _state(self, family):
+        state = self._states.get(family)
+        if state is None:
+            state = self._states[family] = {
+                "failures": 0,
+                "opened_at": None,
+                "probing": False,
+            }
+        return state
+
+    def allow(self, family) -> bool:
+        """
+        判断该类接口是否可以发出请求，返回 True 时请求结束后必须调用 record
+        """
+        with self._lock:
+            state = self._state(family)
+            if state["opened_at"] is None:
+                return True
+            if time.monotonic() - state["opened_at"] < self.recovery_time:
+                return False
+            if state["probing"]:
+                return False
+            state["probing"] = True
+            return True
+
+    def record(self, family, success):
+        """
+        记录请求结果
+        :param success: True 接口正常响应, False 接口异常, None 与接口无关的失败(如签名失败)
+        """
+        with self._lock:
+            state = self._state(family)
+            probing, state["probing"] = state["probing"], False
+            if success is None:
+                return
+            if success:
+                state["failures"] = 0
+                state["opened_at"] = None
+                return
+            state["failures"] += 1
+            if probing or state["failures"] >= self.failure_threshold:
+                state["opened_at"] = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                family: {
+                    "failures": state["failures"],
+                    "open": state["opened_at"] is not None,
+                }
+                for family, state in self._states.items()
+            }
+
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    获取进程内共享的限速器，配置来自环境变量
+    """
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter.from_env()
+        return _default_limiter
+
+
+_default_controller = None
+
+
+def get_concurrency_controller():
+    """
+    获取进程内共享的并发控制器，配置来自环境变量
+    """
+    global _default_controller
+    with _default_lock:
+        if _default_controller is None:
+            _default_controller = ConcurrencyController.from_env()
+        return _default_controller
+
+
+_default_breaker = None
+
+
+def get_circuit_breaker():
+    """
+    获取进程内共享的熔断器，配置来自环境变量
+    """
+    global _default_breaker
+    with _default_lock:
+        if _default_breaker is None:
+            _default_breaker = CircuitBreaker.from_env()
+        return _default_breaker
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import urllib.parse
+
+# 录制时替换为 *** 的字段，避免把账号凭证写进夹具
+SECRET_KEYS = {
+    "a1",
+    "web_session",
+    "webId",
+    "websectiga",
+    "sec_poison_id",
+    "gid",
+    "cookie",
+    "cookies",
+    "x-s",
+    "x-t",
+    "x-s-common",
+    "x-b3-traceid",
+}
+# 每次请求都会变化的字段，不参与夹具匹配
+VOLATILE_KEYS = {"search_id"}
+
+
+def scrub(value):
+    """
+    递归替换敏感字段的值
+    """
+    if isinstance(value, dict):
+        return {k: "***" if k in SECRET_KEYS else scrub(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [scrub(v) for v in value]
+    return value
+
+
+def fixture_key(method: str, api: str, data=""):
+    """
+    夹具的匹配key，由请求方法、路径、排序后的参数和去掉易变字段的请求体组成
+    录制和回放使用同一个函数
+    """
+    path, _, query = api.partition("?")
+    params = sorted(
+        (k, v)
+        for k, v in urllib.parse.parse_qsl(query, True)
+        if k not in VOLATILE_KEYS and k not in SECRET_KEYS
+    )
+    if isinstance(data, str):
+        data = json.loads(data) if data else ""
+    if isinstance(data, dict):
+        data = {
+            k: v
+            for k, v in data.items()
+            if k not in VOLATILE_KEYS and k not in SECRET_KEYS
+        }
+    raw = json.dumps([method.upper(), path, params, data], sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def media_key(url: str):
+    """
+    媒体文件的匹配key，由域名和路径组成
+    """
+    parsed = urllib.parse.urlsplit(url)
+    raw = f"{parsed.netloc}{parsed.path}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class Recorder:
+    """
+    录制接口响应和媒体文件，供本地模拟服务器回放
+    api/<key>.json 保存一次请求的参数和去敏后的响应，cdn/<key> 保存媒体文件
+    :param record_dir: 夹具目录
+    """
+
+    def __init__(self, record_dir):
+        self.record_dir = record_dir
+        os.makedirs(os.path.join(record_dir, "api"), exist_ok=True)
+        os.makedirs(os.path.join(record_dir, "cdn"), exist_ok=True)
+        self._lock = threading.Lock()
+
+    def api_path(self, key):
+        return os.path.join(self.record_dir, "api", f"{key}.json")
+
+    def media_path(self, key):
+        return os.path.join(self.record_dir, "cdn", key)
+
+    def record_response(self, method: str, api: str, data, status: int, res_json):
+        path, _, query = api.partition("?")
+        if isinstance(data, str) and data:
+            data = json.loads(data)
+        fixture = {
+            "method": method,
+            "path": path,
+            "params": scrub(dict(urllib.parse.parse_qsl(query, True))),
+            "data": scrub(data),
+            "status": status,
+            "response": scrub(res_json),
+        }
+        target = self.api_path(fixture_key(method, api, data))
+        with self._lock:
+            with open(f"{target}.tmp", "w", encoding="utf-8") as f:
+                json.dump(fixture, f, ensure_ascii=False, indent=2)
+            os.replace(f"{target}.tmp", target)
+
+    def record_media(self, url: str, file_path: str):
+        target = self.media_path(media_key(url))
+        if not os.path.exists(target):
+            shutil.copyfile(file_path, target)
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_recorder():
+    """
+    配置了 XHS_RECORD_DIR 时返回录制器，否则返回 None
+    """
+    record_dir = os.getenv("XHS_RECORD_DIR")
+    if not record_dir:
+        return None
+    with _recorders_lock:
+        if record_dir not in _recorders:
+            _recorders[record_dir] = Recorder(record_dir)
+        return _recorders[record_dir]
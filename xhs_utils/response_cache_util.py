@@ -0,0 +1,162 @@
+import contextlib
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 各只读接口的默认缓存有效期(秒)，以接口路径的最后一段为key
+DEFAULT_TTLS = {
+    "otherinfo": 600,  # 用户信息
+    "category": 3600,  # 主页频道
+    "recommend": 600,  # 搜索联想词
+    "selfinfo": 60,  # 自己的信息
+    "me": 60,  # 自己的信息
+    "feed": 300,  # 笔记详情
+}
+
+
+class ResponseCache:
+    """
+    只读接口的响应缓存
+    内存中按LRU淘汰，可选同时保存到磁盘，每个接口单独设置有效期，只缓存成功的响应
+    缓存key由请求方法、路径、排序后的参数和请求体组成，不包含签名等每次都变化的请求头
+    :param max_items: 内存中最多缓存的响应数量
+    :param ttls: 接口有效期 {接口路径最后一段: 秒}，不在其中的接口不缓存
+    :param disk_dir: 磁盘缓存目录，为None时只缓存在内存中
+    """
+
+    def __init__(self, max_items: int = 1000, ttls=None, disk_dir: str = None):
+        self.max_items = max(1, max_items)
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._items = OrderedDict()  # key -> [time, value]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        RESPONSE_CACHE_SIZE: 内存中最多缓存的响应数量
+        RESPONSE_CACHE_TTLS: 覆盖接口有效期，如 feed=600,selfinfo=0，0 表示不缓存
+        RESPONSE_CACHE_DIR: 磁盘缓存目录
+        """
+        ttls = dict(DEFAULT_TTLS)
+        for item in os.getenv("RESPONSE_CACHE_TTLS", "").split(","):
+            if "=" in item:
+                name, ttl = item.split("=", 1)
+                ttls[name.strip()] = float(ttl)
+        return cls(
+            max_items=int(os.getenv("RESPONSE_CACHE_SIZE", 1000)),
+            ttls={name: ttl for name, ttl in ttls.items() if ttl > 0},
+            disk_dir=os.getenv("RESPONSE_CACHE_DIR") or None,
+        )
+
+    def ttl(self, path):
+        return self.ttls.get(path.rstrip("/").split("/")[-1])
+
+    @contextlib.contextmanager
+    def control(self, bypass: bool = False, refresh: bool = False):
+        """
+        在当前线程中临时改变缓存行为
+        :param bypass: 不读也不写缓存
+        :param refresh: 不读缓存，但用新的响应更新缓存
+        """
+        previous = getattr(self._local, "mode", (False, False))
+        self._local.mode = (bypass, refresh)
+        try:
+            yield self
+        finally:
+            self._local.mode = previous
+
+    @property
+    def bypassed(self):
+        return getattr(self._local, "mode", (False, False))[0]
+
+    @property
+    def refreshing(self):
+        return getattr(self._local, "mode", (False, False))[1]
+
+    def _disk_path(self, key):
+        name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{name}.json")
+
+    def _trim(self):
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def _load_entry(self, key):
+        entry = self._items.get(key)
+        if entry is None and self.disk_dir:
+            try:
+                with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                # 从磁盘读入的也放入内存，同样受 max_items 限制
+                self._items[key] = entry
+                self._trim()
+            except (OSError, ValueError):
+                entry = None
+        return entry
+
+    def get(self, key, path):
+        """
+        获取缓存的响应，返回副本，未命中、已过期、接口不缓存或被跳过时返回 None
+        :param key: 请求的规范化标识
+        :param path: 接口路径，用于确定有效期
+        """
+        ttl = self.ttl(path)
+        if ttl is None or self.bypassed or self.refreshing:
+            return None
+        with self._lock:
+            entry = self._load_entry(key)
+            if entry is None or time.time() - entry[0] > ttl:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        return copy.deepcopy(value)
+
+    def put(self, key, path, value):
+        """
+        写入响应，只缓存配置了有效期的接口的成功响应
+        """
+        if self.ttl(path) is None or self.bypassed or not value.get("success"):
+            return
+        entry = [time.time(), copy.deepcopy(value)]
+        with self._lock:
+            self._items[key] = entry
+            self._items.move_to_end(key)
+            self._trim()
+            if self.disk_dir:
+                tmp_path = (
+                    f"{self._disk_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                )
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                os.replace(tmp_path, self._disk_path(key))
+
+    def stats(self):
+        with self._lock:
+            return {"items": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    获取进程内共享的响应缓存，配置来自环境变量
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache.from_env()
+        return _default_cache
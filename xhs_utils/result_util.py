@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+_decoder = json.JSONDecoder()
+
+
+def _skip_ws(text, pos):
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def build_note_index(text):
+    """
+    扫描结果文件文本，返回除 data 以外的字段，data 中每条笔记的字节区间和评论数
+    :param text: 结果文件的完整文本
+    返回 meta, [[start, end], ...], [评论数, ...]
+    """
+    meta = {}
+    offsets = []
+    comment_counts = []
+    byte_pos, char_pos = 0, 0
+
+    def to_byte(pos):
+        # 增量计算字符位置对应的utf-8字节位置
+        nonlocal byte_pos, char_pos
+        byte_pos += len(text[char_pos:pos].encode("utf-8"))
+        char_pos = pos
+        return byte_pos
+
+    pos = _skip_ws(text, 0)
+    if text[pos] != "{":
+        raise ValueError("结果文件格式错误")
+    pos = _skip_ws(text, pos + 1)
+    while text[pos] != "}":
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _skip_ws(text, pos)
+        pos = _skip_ws(text, pos + 1)  # 跳过 ':'
+        if key == "data" and text[pos] == "[":
+            pos = _skip_ws(text, pos + 1)
+            while text[pos] != "]":
+                start = to_byte(pos)
+                note, pos = _decoder.raw_decode(text, pos)
+                offsets.append([start, to_byte(pos)])
+                comment_counts.append(len(note.get("comments") or []))
+                pos = _skip_ws(text, pos)
+                if text[pos] == ",":
+                    pos = _skip_ws(text, pos + 1)
+            pos += 1
+        else:
+            meta[key], pos = _decoder.raw_decode(text, pos)
+        pos = _skip_ws(text, pos)
+        if text[pos] == ",":
+            pos = _skip_ws(text, pos + 1)
+    return meta, offsets, comment_counts
+
+
+def project_note(note, fields=None, exclude=None):
+    """
+    按字段筛选笔记
+    :param fields: 只保留的字段列表
+    :param exclude: 需要去掉的字段列表
+    """
+    if fields:
+        note = {k: v for k, v in note.items() if k in fields}
+    if exclude:
+        note = {k: v for k, v in note.items() if k not in exclude}
+    return note
+
+
+class ResultStore:
+    """
+    Web任务结果文件的读写
+    每个结果文件旁边保存一个 <task_id>.idx 索引，记录每条笔记在文件中的字节区间，分页和流式读取时只解析需要的笔记
+    解析结果按文件 mtime 缓存，文件被重写后自动失效
+    :param results_dir: 结果目录
+    :param max_cached: 内存中最多缓存的完整结果数量
+    """
+
+    def __init__(self, results_dir, max_cached: int = 8):
+        self.results_dir = results_dir
+        self.max_cached = max_cached
+        self._cache = OrderedDict()  # (kind, task_id) -> (stamp, value)
+        self._lock = threading.Lock()
+
+    def path(self, task_id):
+        return os.path.join(self.results_dir, f"{task_id}.json")
+
+    def index_path(self, task_id):
+        return os.path.join(self.results_dir, f"{task_id}.idx")
+
+    def exists(self, task_id):
+        return os.path.exists(self.path(task_id))
+
+    def _stamp(self, task_id):
+        stat = os.stat(self.path(task_id))
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _cache_get(self, key, stamp):
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None or item[0] != stamp:
+                return None
+            self._cache.move_to_end(key)
+            return item[1]
+
+    def _cache_put(self, key, stamp, value):
+        with self._lock:
+            self._cache[key] = (stamp, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached * 2:
+                self._cache.popitem(last=False)
+
+    def _save_index(self, task_id, stamp, meta, offsets, comment_counts):
+        index = {
+            "stamp": stamp,
+            "meta": meta,
+            "notes": offsets,
+            "comments": comment_counts,
+        }
+        tmp_path = f"{self.index_path(task_id)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path(task_id))
+        return index
+
+    def write(self, task_id, result_data):
+        """
+        写入结果文件并同时生成索引
+        """
+        text = json.dumps(result_data, ensure_ascii=False, indent=2)
+        tmp_path = f"{self.path(task_id)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path(task_id))
+        stamp = self._stamp(task_id)
+        index = self._save_index(task_id, stamp, *build_note_index(text))
+        self._cache_put(("index", task_id), stamp, index)
+        self._cache_put(("full", task_id), stamp, result_data)
+        return self.path(task_id)
+
+    def index(self, task_id):
+        """
+        读取索引，索引不存在或与结果文件不一致时重新生成
+        """
+        stamp = self._stamp(task_id)
+        index = self._cache_get(("index", task_id), stamp)
+        if index is not None:
+            return index
+        try:
+            with open(self.index_path(task_id), "r", encoding="utf-8") as f:
+                index = json.load(f)
+            # 旧版本的索引没有评论数，重新生成
+            if index.get("stamp") != stamp or "comments" not in index:
+                index = None
+        except (OSError, ValueError):
+            index = None
+        if index is None:
+            with open(self.path(task_id), "r", encoding="utf-8") as f:
+                index = self._save_index(task_id, stamp, *build_note_index(f.read()))
+        self._cache_put(("index", task_id), stamp, index)
+        return index
+
+    def load(self, task_id):
+        """
+        读取完整结果
+        """
+        stamp = self._stamp(task_id)
+        data = self._cache_get(("full", task_id), stamp)
+        if data is None:
+            with open(self.path(task_id), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._cache_put(("full", task_id), stamp, data)
+        return data
+
+    def note_count(self, task_id):
+        return len(self.index(task_id)["notes"])
+
+    def comment_count(self, task_id, note_index: int = None):
+        """
+        从索引中读取评论数，不解析结果文件
+        :param note_index: 只统计指定索引的笔记，超出范围时为 0
+        """
+        counts = self.index(task_id)["comments"]
+        if note_index is None:
+            return sum(counts)
+        return counts[note_index] if 0 <= note_index < len(counts) else 0
+
+    def iter_raw_notes(self, task_id, offset: int = 0, limit: int = None):
+        """
+        按索引逐条读取笔记的原始字节
+        """
+        notes = self.index(task_id)["notes"]
+        end = len(notes) if limit is None else min(len(notes), offset + limit)
+        with open(self.path(task_id), "rb") as f:
+            for start, stop in notes[offset:end]:
+                f.seek(start)
+                yield f.read(stop - start)
+
+    def iter_notes(self, task_id, offset: int = 0, limit: int = None):
+        """
+        按索引逐条读取并解析笔记
+        """
+        for raw in self.iter_raw_notes(task_id, offset, limit):
+            yield json.loads(raw)
@@ -0,0 +1,106 @@
+import bisect
+import itertools
+import threading
+from loguru import logger
+
+
+class TaskScheduler:
+    """
+    固定大小的后台任务工作池
+    任务按优先级(高优先)和提交顺序(先进先出)排队，同一个 key(一般为 cookie 的 a1)同时运行的任务数不超过 per_key_limit
+    :param max_workers: 工作线程数量
+    :param per_key_limit: 同一个 key 同时运行的任务上限
+    """
+
+    def __init__(self, max_workers: int = 2, per_key_limit: int = 1):
+        self.max_workers = max(1, max_workers)
+        self.per_key_limit = max(1, per_key_limit)
+        self._cond = threading.Condition()
+        self._pending = []  # 按 (-priority, seq) 排序的等待队列
+        self._running = {}  # key -> 运行中的任务数
+        self._active = 0
+        self._seq = itertools.count()
+        self._workers = []
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._work_loop,
+                name=f"task-worker-{len(self._workers)}",
+                daemon=True,
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def submit(self, task_id, fn, args=(), key=None, priority: int = 0):
+        """
+        提交任务
+        :param task_id: 任务id，用于查询排队位置
+        :param fn: 任务函数
+        :param args: 任务参数
+        :param key: 并发限制的分组 key
+        :param priority: 优先级，数值越大越先执行
+        返回任务当前的排队位置
+        """
+        with self._cond:
+            self._ensure_workers()
+            entry = (-priority, next(self._seq), task_id, key, fn, args)
+            bisect.insort(self._pending, entry)
+            self._cond.notify()
+            return self._pending.index(entry) + 1
+
+    def position(self, task_id):
+        """
+        返回任务的排队位置(从1开始)，不在队列中返回 None
+        """
+        with self._cond:
+            for index, entry in enumerate(self._pending):
+                if entry[2] == task_id:
+                    return index + 1
+        return None
+
+    def expected_position(self, priority: int = 0):
+        """
+        以 priority 提交的新任务将会处于的排队位置
+        """
+        with self._cond:
+            return sum(1 for entry in self._pending if -entry[0] >= priority) + 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_workers": self.max_workers,
+                "pending": len(self._pending),
+                "running": self._active,
+            }
+
+    def _take_runnable(self):
+        for index, entry in enumerate(self._pending):
+            key = entry[3]
+            if key is None or self._running.get(key, 0) < self.per_key_limit:
+                return self._pending.pop(index)
+        return None
+
+    def _work_loop(self):
+        while True:
+            with self._cond:
+                entry = self._take_runnable()
+                while entry is None:
+                    self._cond.wait()
+                    entry = self._take_runnable()
+                _, _, task_id, key, fn, args = entry
+                if key is not None:
+                    self._running[key] = self._running.get(key, 0) + 1
+                self._active += 1
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"任务 {task_id} 执行异常: {e}")
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    if key is not None:
+                        self._running[key] -= 1
+                        if self._running[key] <= 0:
+                            del self._running[key]
+                    self._cond.notify_all()
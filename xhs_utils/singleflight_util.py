@@ -0,0 +1,78 @@
+import copy
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+def _fresh_error(error):
+    """
+    同一个异常对象在多个线程中抛出会互相改写 __traceback__，每个等待者抛出副本
+    """
+    try:
+        return copy.copy(error)
+    except Exception:
+        return type(error)(*error.args) if error.args else Exception(str(error))
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求
+    同一个 key 同时只执行一次，执行期间到来的相同调用等待并共享结果(返回副本)
+    执行出错时每个等待者抛出各自的异常副本，share_errors=False 时等待者改为自己重新执行
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args, share_errors=True, **kwargs):
+        """
+        执行 fn(*args, **kwargs)，相同 key 正在执行时等待其结果
+        :param share_errors: 执行出错时等待者是否共享错误，为 False 时等待者自己执行 fn
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+        if not leader:
+            call.done.wait()
+            if call.error is None:
+                return copy.deepcopy(call.result)
+            if not share_errors:
+                return fn(*args, **kwargs)
+            raise _fresh_error(call.error) from call.error
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        if call.followers:
+            # 调用方可能修改返回值，有等待者时给自己也返回副本，等待者从原始结果复制
+            return copy.deepcopy(call.result)
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "shared": self.shared,
+                "in_flight": len(self._calls),
+            }
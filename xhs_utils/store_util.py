@@ -0,0 +1,521 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from loguru import logger
+
+# 不写入共享数据库的任务字段，Cookie 只随任务参数传给爬虫进程
+PRIVATE_TASK_FIELDS = ("cookie",)
+
+# 已退出进程的指标合并后保存在这个进程名下
+RETIRED_METRICS = "retired"
+
+
+class SharedStore:
+    """
+    基于 SQLite 的多进程共享状态
+    保存任务状态、任务事件和任务队列，生产模式下多个Web进程和爬虫进程通过同一个数据库文件协作
+    任务参数(含 Cookie)只在排队期间保存，被领取时清空
+    运行中的任务持有租约，爬虫进程定时续约，租约过期说明进程已退出，任务标记为失败
+    任务事件与内存模式一样，每个任务最多保留 events_per_task 条，结束 events_ttl 秒后只保留最后一条
+    :param db_path: 数据库文件路径
+    :param events_per_task: 每个任务最多保留的事件数
+    :param events_ttl: 任务结束后保留全部事件的时间(秒)
+    """
+
+    def __init__(self, db_path, events_per_task: int = 500, events_ttl: float = 600):
+        self.db_path = db_path
+        self.events_per_task = max(1, events_per_task)
+        self.events_ttl = events_ttl
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS events (
+                    task_id INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created REAL,
+                    PRIMARY KEY (task_id, seq)
+                );
+                CREATE TABLE IF NOT EXISTS jobs (
+                    task_id INTEGER PRIMARY KEY,
+                    priority INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    key TEXT,
+                    target TEXT NOT NULL,
+                    args TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    worker TEXT,
+                    lease_until REAL
+                );
+                CREATE TABLE IF NOT EXISTS metrics (
+                    process TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (process, name, labels)
+                );
+                """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "lease_until" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(events)")]
+            if "created" not in columns:
+                # 旧数据没有时间，视为早已结束，下次清理时只保留最后一条
+                conn.execute("ALTER TABLE events ADD COLUMN created REAL")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # 删除或清空的内容(如任务参数中的 Cookie)用零覆盖，不留在数据库文件中
+            conn.execute("PRAGMA secure_delete=ON")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+    # 任务状态
+    def get_task(self, task_id):
+        row = (
+            self._conn()
+            .execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,))
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    def set_task(self, task_id, data):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO tasks (task_id, data) VALUES (?, ?)",
+            (task_id, json.dumps(data, ensure_ascii=False)),
+        )
+
+    def update_task(self, task_id, **fields):
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT data FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            data = json.loads(row[0]) if row else {}
+            data.update(fields)
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, data) VALUES (?, ?)",
+                (task_id, json.dumps(data, ensure_ascii=False)),
+            )
+
+    def list_tasks(self):
+        rows = self._conn().execute("SELECT task_id, data FROM tasks").fetchall()
+        return [(task_id, json.loads(data)) for task_id, data in rows]
+
+    # 任务事件
+    def publish_event(self, task_id, event, data):
+        with self._transaction() as conn:
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM events WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO events (task_id, seq, event, data, created) VALUES (?, ?, ?, ?, ?)",
+                (
+                    task_id,
+                    seq,
+                    event,
+                    json.dumps(data, ensure_ascii=False),
+                    time.time(),
+                ),
+            )
+            # 丢弃最早的事件(多为单条笔记)，断线重连时从保留的第一条开始推送
+            conn.execute(
+                "DELETE FROM events WHERE task_id = ? AND seq <= ?",
+                (task_id, seq - self.events_per_task),
+            )
+        if event in ("completed", "failed"):
+            self.prune_events()
+
+    def prune_events(self):
+        """
+        结束超过 events_ttl 秒的任务只保留最后的完成/失败事件，删除笔记和评论数据
+        返回删除的事件数
+        """
+        return (
+            self._conn()
+            .execute(
+                "DELETE FROM events WHERE EXISTS ("
+                "SELECT 1 FROM events AS last WHERE last.task_id = events.task_id "
+                "AND last.seq > events.seq AND last.event IN ('completed', 'failed') "
+                "AND COALESCE(last.created, 0) < ?)",
+                (time.time() - self.events_ttl,),
+            )
+            .rowcount
+        )
+
+    def wait_events(self, task_id, start, timeout, poll_interval=0.3):
+        """
+        获取任务从 start 开始的事件，没有新事件时轮询等待最多 timeout 秒
+        返回 (第一条事件的序号, 事件列表)，start 之后的事件已被丢弃时从保留的第一条开始
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            rows = (
+                self._conn()
+                .execute(
+                    "SELECT seq, event, data FROM events WHERE task_id = ? AND seq >= ? ORDER BY seq",
+                    (task_id, start),
+                )
+                .fetchall()
+            )
+            if rows or time.monotonic() >= deadline:
+                first = rows[0][0] if rows else start
+                return first, [(event, json.loads(data)) for _, event, data in rows]
+            time.sleep(poll_interval)
+
+    # 任务队列
+    def enqueue(self, task_id, target, args, key=None, priority=0):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM jobs").fetchone()
+            seq = row[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (task_id, priority, seq, key, target, args, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'pending')",
+                (
+                    task_id,
+                    priority,
+                    seq,
+                    key,
+                    target,
+                    json.dumps(args, ensure_ascii=False),
+                ),
+            )
+        return self.position(task_id)
+
+    def claim(self, per_key_limit, worker, lease):
+        """
+        按优先级和提交顺序取出一个可以运行的任务，同一个 key 运行中的任务数不超过 per_key_limit
+        领取后清空数据库中的任务参数，并设置 lease 秒的租约
+        返回 (task_id, target, args) 或 None
+        """
+        with self._transaction() as conn:
+            running = dict(
+                conn.execute(
+                    "SELECT key, COUNT(*) FROM jobs WHERE status = 'running' AND key IS NOT NULL GROUP BY key"
+                ).fetchall()
+            )
+            rows = conn.execute(
+                "SELECT task_id, key, target, args FROM jobs WHERE status = 'pending' ORDER BY priority DESC, seq"
+            ).fetchall()
+            for task_id, key, target, args in rows:
+                if key is None or running.get(key, 0) < per_key_limit:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, args = '[]' "
+                        "WHERE task_id = ?",
+                        (worker, time.time() + lease, task_id),
+                    )
+                    return task_id, target, json.loads(args)
+        return None
+
+    def renew(self, worker, lease):
+        """
+        为 worker 运行中的任务续约
+        """
+        self._conn().execute(
+            "UPDATE jobs SET lease_until = ? WHERE worker = ? AND status = 'running'",
+            (time.time() + lease, worker),
+        )
+
+    def finish(self, task_id):
+        self._conn().execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+
+    def fail_expired(self):
+        """
+        租约过期的运行中任务(所在进程已退出)标记为失败
+        任务参数在领取时已经清空，无法重新排队，需要重新提交
+        返回失败的任务ID列表
+        """
+        error = "爬虫进程异常退出，请重新提交任务"
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT task_id, worker FROM jobs WHERE status = 'running' AND lease_until < ?",
+                (time.time(),),
+            ).fetchall()
+            for task_id, worker in rows:
+                conn.execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+        for task_id, worker in rows:
+            logger.warning(f"任务 {task_id} 的爬虫进程 {worker} 租约过期，标记为失败")
+            self.update_task(task_id, status="failed", error=error)
+            self.publish_event(task_id, "failed", {"error": error})
+        return [task_id for task_id, _ in rows]
+
+    def position(self, task_id):
+        row = (
+            self._conn()
+            .execute(
+                "SELECT priority, seq FROM jobs WHERE task_id = ? AND status = 'pending'",
+                (task_id,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        priority, seq = row
+        ahead = (
+            self._conn()
+            .execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'pending' AND (priority > ? OR (priority = ? AND seq < ?))",
+                (priority, priority, seq),
+            )
+            .fetchone()[0]
+        )
+        return ahead + 1
+
+    def expected_position(self, priority):
+        row = (
+            self._conn()
+            .execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'pending' AND priority >= ?",
+                (priority,),
+            )
+            .fetchone()
+        )
+        return row[0] + 1
+
+    # 多进程指标
+    def save_metrics(self, process, rows):
+        """
+        保存一个进程的累计指标，rows 为 [(指标名, 标签值列表, 值)]
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO metrics (process, name, labels, value, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (process, name, json.dumps(labels), json.dumps(value), now)
+                    for name, labels, value in rows
+                ],
+            )
+            conn.execute(
+                "UPDATE metrics SET updated = ? WHERE process = ?", (now, process)
+            )
+
+    def load_metrics(self, exclude=None):
+        """
+        返回所有进程(exclude 除外)的指标 [(指标名, 标签值列表, 值)]
+        """
+        rows = (
+            self._conn()
+            .execute(
+                "SELECT name, labels, value FROM metrics WHERE process != ?",
+                (exclude or "",),
+            )
+            .fetchall()
+        )
+        return [
+            (name, json.loads(labels), json.loads(value))
+            for name, labels, value in rows
+        ]
+
+    def retire_metrics(self, before, merge):
+        """
+        before 之后没有更新过的进程(已退出)的指标用 merge 合并到 RETIRED_METRICS 名下
+        返回合并的行数
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT name, labels, value FROM metrics WHERE updated < ? AND process != ?",
+                (before, RETIRED_METRICS),
+            ).fetchall()
+            if not rows:
+                return 0
+            retired = {
+                (name, labels): json.loads(value)
+                for name, labels, value in conn.execute(
+                    "SELECT name, labels, value FROM metrics WHERE process = ?",
+                    (RETIRED_METRICS,),
+                )
+            }
+            for name, labels, value in rows:
+                value = json.loads(value)
+                key = (name, labels)
+                retired[key] = merge(retired[key], value) if key in retired else value
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO metrics (process, name, labels, value, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (RETIRED_METRICS, name, labels, json.dumps(value), now)
+                    for (name, labels), value in retired.items()
+                ],
+            )
+            conn.execute(
+                "DELETE FROM metrics WHERE updated < ? AND process != ?",
+                (before, RETIRED_METRICS),
+            )
+        return len(rows)
+
+    def queue_stats(self):
+        counts = dict(
+            self._conn()
+            .execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            .fetchall()
+        )
+        return {
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+        }
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class TaskRecord(dict):
+    """
+    共享任务状态中的单个任务，修改字段时同步写入数据库
+    """
+
+    def __init__(self, store, task_id, data):
+        super().__init__(data)
+        self._store = store
+        self._task_id = task_id
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if key not in PRIVATE_TASK_FIELDS:
+            self._store.update_task(self._task_id, **{key: value})
+
+
+class SharedTasks:
+    """
+    以字典的方式访问共享任务状态，接口与 WebSpider.tasks 的内存字典一致
+    """
+
+    def __init__(self, store):
+        self._store = store
+
+    def __contains__(self, task_id):
+        return self._store.get_task(task_id) is not None
+
+    def __getitem__(self, task_id):
+        data = self._store.get_task(task_id)
+        if data is None:
+            raise KeyError(task_id)
+        return TaskRecord(self._store, task_id, data)
+
+    def __setitem__(self, task_id, data):
+        data = {k: v for k, v in data.items() if k not in PRIVATE_TASK_FIELDS}
+        self._store.set_task(task_id, data)
+
+    def get(self, task_id, default=None):
+        return self[task_id] if task_id in self else default
+
+    def items(self):
+        return [
+            (task_id, TaskRecord(self._store, task_id, data))
+            for task_id, data in self._store.list_tasks()
+        ]
+
+
+class SharedTaskScheduler:
+    """
+    基于共享任务队列的调度器，接口与 TaskScheduler 一致
+    Web进程只负责入队，由独立的爬虫进程调用 serve 取出任务执行
+    :param store: SharedStore
+    :param max_workers: 每个爬虫进程的工作线程数量
+    :param per_key_limit: 同一个 key 同时运行的任务上限(所有进程合计)
+    :param lease: 运行中任务的租约(秒)，爬虫进程每 lease/3 秒续约一次
+    """
+
+    def __init__(
+        self, store, max_workers: int = 2, per_key_limit: int = 1, lease: float = None
+    ):
+        self.store = store
+        self.max_workers = max(1, max_workers)
+        self.per_key_limit = max(1, per_key_limit)
+        self.lease = lease or float(os.getenv("WEB_JOB_LEASE", 60))
+
+    def submit(self, task_id, fn, args=(), key=None, priority: int = 0):
+        return self.store.enqueue(task_id, fn.__name__, list(args), key, priority)
+
+    def position(self, task_id):
+        return self.store.position(task_id)
+
+    def expected_position(self, priority: int = 0):
+        return self.store.expected_position(priority)
+
+    def stats(self):
+        return dict(self.store.queue_stats(), max_workers=self.max_workers)
+
+    def serve(self, target, poll_interval: float = 0.5):
+        """
+        在当前进程中启动工作线程，循环领取并执行任务，阻塞直到进程退出
+        :param target: 执行任务的对象，任务按方法名调用
+        """
+        # 主机名和进程号便于排查，随机后缀避免进程号重复使用时混淆
+        worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.store.fail_expired()
+        threading.Thread(
+            target=self._heartbeat_loop,
+            args=(worker,),
+            name="crawl-heartbeat",
+            daemon=True,
+        ).start()
+        workers = [
+            threading.Thread(
+                target=self._work_loop,
+                args=(target, worker, poll_interval),
+                name=f"crawl-worker-{i}",
+                daemon=True,
+            )
+            for i in range(self.max_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def _heartbeat_loop(self, worker):
+        """
+        为本进程的任务续约，同时清理其他进程留下的过期任务和已过期的任务事件
+        """
+        while True:
+            time.sleep(self.lease / 3)
+            try:
+                self.store.renew(worker, self.lease)
+                self.store.fail_expired()
+                self.store.prune_events()
+            except Exception as e:
+                logger.error(f"任务续约失败: {e}")
+
+    def _work_loop(self, target, worker, poll_interval):
+        while True:
+            job = self.store.claim(self.per_key_limit, worker, self.lease)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            task_id, name, args = job
+            try:
+                getattr(target, name)(*args)
+            except Exception as e:
+                logger.error(f"任务 {task_id} 执行异常: {e}")
+            finally:
+                self.store.finish(task_id)
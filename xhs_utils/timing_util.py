@@ -0,0 +1,193 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from loguru import logger
+
+# 直方图的桶上限(毫秒)，最后一个桶收集更慢的调用
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+# 关闭计时时所有阶段共用的空上下文
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class StageHistogram:
+    """
+    单个阶段的耗时直方图
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def percentile(self, p):
+        """
+        按桶估算分位数，返回所在桶的上限(最后一个桶返回最大值)
+        """
+        if not self.count:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                return float(BUCKETS_MS[index]) if index < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 2),
+            "avg_ms": round(self.total / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max, 2),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": {
+                (
+                    f"<={BUCKETS_MS[i]}"
+                    if i < len(BUCKETS_MS)
+                    else f">{BUCKETS_MS[-1]}"
+                ): n
+                for i, n in enumerate(self.buckets)
+                if n
+            },
+        }
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "started")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class StageTimer:
+    """
+    按阶段统计耗时，如 sign(签名)、http(网络请求)、parse(解析响应)、handle_note(整理笔记)、xlsx(写入excel)
+        with stage_timer.stage('sign'):
+            ...
+    未开启时 stage 返回一个共享的空上下文，几乎没有额外开销
+    :param enabled: 是否开启计时
+    :param export_path: 每次输出汇总时同时把统计写入该JSON文件
+    """
+
+    def __init__(self, enabled: bool = False, export_path: str = None):
+        self.enabled = enabled
+        self.export_path = export_path
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        XHS_TIMING: 为 1 时开启计时
+        XHS_TIMING_EXPORT: 统计导出的JSON文件路径，为空时不导出
+        """
+        return cls(
+            enabled=os.getenv("XHS_TIMING", "0") == "1",
+            export_path=os.getenv("XHS_TIMING_EXPORT") or None,
+        )
+
+    def stage(self, name):
+        """
+        返回统计 name 阶段耗时的上下文管理器
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        """
+        记录一次阶段耗时
+        :param seconds: 耗时(秒)
+        """
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = StageHistogram()
+            histogram.add(seconds * 1000)
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def stats(self):
+        with self._lock:
+            return {name: h.stats() for name, h in self._stages.items()}
+
+    def summary(self, title="阶段耗时"):
+        """
+        输出各阶段的耗时汇总，配置了导出路径时同时写入JSON
+        """
+        if not self.enabled:
+            return
+        stats = self.stats()
+        if not stats:
+            return
+        grand_total = sum(s["total_ms"] for s in stats.values()) or 1.0
+        lines = [f"{title}(进程累计):"]
+        for name, s in sorted(stats.items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(
+                f"  {name:<12} 次数 {s['count']:>6}  合计 {s['total_ms'] / 1000:>8.2f}s "
+                f"({s['total_ms'] / grand_total:>5.1%})  平均 {s['avg_ms']:>8.2f}ms  "
+                f"p50 {s['p50_ms']:>6.0f}ms  p95 {s['p95_ms']:>6.0f}ms  最大 {s['max_ms']:>8.2f}ms"
+            )
+        logger.info("\n".join(lines))
+        if self.export_path:
+            self.export(self.export_path)
+
+    def export(self, path):
+        """
+        把各阶段统计写入JSON文件
+        """
+        report = {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "buckets_ms": list(BUCKETS_MS),
+            "stages": self.stats(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
+
+
+_default_timer = None
+_default_lock = threading.Lock()
+
+
+def get_stage_timer():
+    """
+    获取进程内共享的阶段计时器，配置来自环境变量
+    """
+    global _default_timer
+    if _default_timer is None:
+        with _default_lock:
+            if _default_timer is None:
+                _default_timer = StageTimer.from_env()
+    return _default_timer
+
+
+def stage(name):
+    """
+    使用进程内共享的计时器统计 name 阶段的耗时
+    """
+    return get_stage_timer().stage(name)